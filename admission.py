@@ -0,0 +1,330 @@
+"""A module shedding load: bounded concurrency per route class, per-client write rate limits and their metrics."""
+
+import collections
+import contextlib
+import math
+import socket
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from typing import Callable, Iterator, Optional
+
+import config
+
+READ = 'read'
+WRITE = 'write'
+EXTERNAL = 'external'
+QUEUE_FULL = 'queue_full'
+QUEUE_TIMEOUT = 'queue_timeout'
+COUNTER_LABELS = ('event', 'route_class', 'reason')
+SHED_RESPONSE = '\r\n'.join((
+    'HTTP/1.0 503 Service Unavailable', f'Retry-After: {config.RETRY_AFTER}', 'Content-Length: 0', '', '',
+)).encode()
+
+
+class Overloaded(Exception):
+    """Raised when a request is rejected for lack of capacity."""
+
+    def __init__(self, reason: str) -> None:
+        """
+        Initialize the exception.
+
+        Args:
+            reason (str): Why the request was rejected, QUEUE_FULL or QUEUE_TIMEOUT.
+        """
+        super().__init__(f'over capacity: {reason}')
+        self.reason = reason
+
+
+class Bulkhead:
+    """A limit of concurrent requests with a bounded queue; requests over both are rejected at once."""
+
+    def __init__(self, limit: int, queue_limit: int, queue_timeout: float) -> None:
+        """
+        Initialize the bulkhead.
+
+        Args:
+            limit (int): The maximum number of requests running at once.
+            queue_limit (int): The maximum number of requests waiting for a running one to finish.
+            queue_timeout (float): Seconds a request waits in the queue before it is rejected.
+        """
+        self.limit = limit
+        self.queue_limit = queue_limit
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.queued = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self) -> 'Bulkhead':
+        """
+        Start a request, waiting in the queue if the limit is reached.
+
+        Returns:
+            Bulkhead: The bulkhead itself.
+
+        Raises:
+            Overloaded: If the queue is full or the request waited too long in it.
+        """
+        with self._condition:
+            if self.running >= self.limit:
+                if self.queued >= self.queue_limit:
+                    raise Overloaded(QUEUE_FULL)
+                self.queued += 1
+                started = self._condition.wait_for(lambda: self.running < self.limit, self.queue_timeout)
+                self.queued -= 1
+                if not started:
+                    raise Overloaded(QUEUE_TIMEOUT)
+            self.running += 1
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """
+        Finish a request, letting a queued one run.
+
+        Args:
+            exc_info (object): The exception raised by the request, if any.
+        """
+        with self._condition:
+            self.running -= 1
+            self._condition.notify()
+
+
+class RateLimiter:
+    """Token buckets limiting the rate of requests per key, e.g. per API token."""
+
+    def __init__(self, rate: float, burst: int, max_keys: int) -> None:
+        """
+        Initialize the limiter.
+
+        Args:
+            rate (float): The number of requests per second allowed in the long run for each key.
+            burst (int): The number of requests a key may make at once after being idle.
+            max_keys (int): The maximum number of keys tracked; the least recently seen are forgotten.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: collections.OrderedDict[str, tuple[float, float]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> float:
+        """
+        Take a token from the bucket of a key.
+
+        Args:
+            key (str): The key of the requester.
+
+        Returns:
+            float: 0 if the request is allowed, else the seconds until it would be.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / self.rate
+            self._buckets[key] = (tokens if wait else tokens - 1, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class AdmissionController:
+    """
+    Bulkheads of the route classes, the write rate limiter and counters of admitted and shed requests.
+
+    Writes are rate limited per client address before their API token has been verified, so clients cannot spread
+    their writes over many buckets by sending made-up tokens, and per token and client address after.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the bulkheads and the rate limiter from config."""
+        self.bulkheads = {
+            route_class: Bulkhead(limit, queue_limit, config.ADMISSION_QUEUE_TIMEOUT)
+            for route_class, (limit, queue_limit) in config.ADMISSION_LIMITS.items()
+        }
+        self.write_limiter = RateLimiter(config.WRITE_RATE, config.WRITE_BURST, config.RATE_LIMIT_MAX_KEYS)
+        self._verified_tokens: collections.OrderedDict[str, None] = collections.OrderedDict()
+        self._counters: collections.Counter[tuple[str, ...]] = collections.Counter()
+        self._lock = threading.Lock()
+
+    def run(self, route_class: str, handle_request: Callable[[], None], reject: Callable[[str], None]) -> None:
+        """
+        Handle a request if its route class has capacity, reject it otherwise.
+
+        Args:
+            route_class (str): READ, WRITE or EXTERNAL.
+            handle_request (Callable[[], None]): Function handling the request.
+            reject (Callable[[str], None]): Function responding to a rejected request with the reason.
+        """
+        try:
+            with self.admit(route_class):
+                handle_request()
+        except Overloaded as overloaded:
+            reject(overloaded.reason)
+
+    @contextlib.contextmanager
+    def admit(self, route_class: str) -> Iterator[None]:
+        """
+        Run a block within the capacity of a route class, e.g. the part of a request calling an external service.
+
+        Args:
+            route_class (str): READ, WRITE or EXTERNAL.
+
+        Yields:
+            None: Once the block is admitted.
+
+        Raises:
+            Overloaded: If the route class has no capacity left.
+        """
+        with contextlib.ExitStack() as stack:
+            try:
+                stack.enter_context(self.bulkheads[route_class])
+            except Overloaded as overloaded:
+                self.count('shed', route_class, overloaded.reason)
+                raise
+            self.count('admitted', route_class, '')
+            yield
+
+    def verified(self, token: str) -> None:
+        """
+        Remember an API token as verified, to rate limit its next writes by the token and client address.
+
+        Args:
+            token (str): The API token.
+        """
+        with self._lock:
+            self._verified_tokens[token] = None
+            self._verified_tokens.move_to_end(token)
+            if len(self._verified_tokens) > config.RATE_LIMIT_MAX_KEYS:
+                self._verified_tokens.popitem(last=False)
+
+    def limit_write(self, token: Optional[str], address: str) -> float:
+        """
+        Rate limit a write request by its client address, and by its API token too if the token was verified before.
+
+        Clients sharing a verified token, e.g. the single token of a deployment, each get a bucket of their own,
+        apart from the bucket of unverified writes of their address.
+
+        Args:
+            token (Optional[str]): The API token of the request, if any.
+            address (str): The address of the client.
+
+        Returns:
+            float: 0 if the write is allowed, else the seconds until it would be.
+        """
+        with self._lock:
+            key = f'token:{token}:{address}' if token in self._verified_tokens else f'address:{address}'
+        wait = self.write_limiter.acquire(key)
+        if wait:
+            self.count('rate_limited', WRITE, '')
+        return wait
+
+    def count(self, event: str, route_class: str, reason: str) -> None:
+        """
+        Count a request event.
+
+        Args:
+            event (str): 'admitted', 'shed' or 'rate_limited'.
+            route_class (str): The route class of the request, empty for whole connections.
+            reason (str): Why the request was shed, empty otherwise.
+        """
+        with self._lock:
+            self._counters[event, route_class, reason] += 1
+
+    def metrics(self) -> str:
+        """
+        Render the counters and the current load of the bulkheads in the Prometheus text format.
+
+        Returns:
+            str: The metrics.
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+        lines = ['# TYPE moviehub_requests_total counter']
+        lines.extend(
+            metric_line('moviehub_requests_total', dict(zip(COUNTER_LABELS, labels)), count)
+            for labels, count in counters
+        )
+        for gauge in ('running', 'queued'):
+            lines.append(f'# TYPE moviehub_requests_{gauge} gauge')
+            lines.extend(
+                metric_line(f'moviehub_requests_{gauge}', {'route_class': route_class}, getattr(bulkhead, gauge))
+                for route_class, bulkhead in self.bulkheads.items()
+            )
+        lines.append('')
+        return '\n'.join(lines)
+
+
+class BoundedThreadingHTTPServer(ThreadingHTTPServer):
+    """A threading HTTP server with a thread per connection up to a limit; connections over it get a 503."""
+
+    def __init__(self, address: tuple[str, int], handler_class: type, max_connections: int) -> None:
+        """
+        Bind the server.
+
+        Args:
+            address (tuple[str, int]): The host and port to listen on.
+            handler_class (type): The request handler class, with an admission attribute.
+            max_connections (int): The maximum number of connections handled at once.
+        """
+        super().__init__(address, handler_class)
+        self._connections = threading.BoundedSemaphore(max_connections)
+
+    def process_request(self, request: socket.socket, client_address: tuple) -> None:
+        """
+        Handle a connection in a new thread, or answer 503 at once from the accepting thread.
+
+        Args:
+            request (socket.socket): The connection.
+            client_address (tuple): The address of the client.
+        """
+        if self._connections.acquire(blocking=False):
+            super().process_request(request, client_address)
+            return
+        self.RequestHandlerClass.admission.count('shed', '', 'connections')
+        with contextlib.suppress(OSError):
+            request.sendall(SHED_RESPONSE)
+            request.shutdown(socket.SHUT_WR)
+        # Closed without freeing a slot, as none was taken.
+        self.close_request(request)
+
+    def shutdown_request(self, request: socket.socket) -> None:
+        """
+        Close a handled connection and free its slot.
+
+        Args:
+            request (socket.socket): The connection.
+        """
+        super().shutdown_request(request)
+        self._connections.release()
+
+
+def metric_line(name: str, labels: dict[str, str], metric_value: int) -> str:
+    """
+    Render a sample in the Prometheus text format.
+
+    Args:
+        name (str): The name of the metric.
+        labels (dict[str, str]): The labels of the sample.
+        metric_value (int): The value of the sample.
+
+    Returns:
+        str: The sample line.
+    """
+    pairs = (f'{label}="{label_value}"' for label, label_value in labels.items())
+    rendered_labels = ','.join(pairs)
+    return f'{name}{{{rendered_labels}}} {metric_value}'
+
+
+def retry_after(wait: float) -> dict[str, str]:
+    """
+    Build the Retry-After header of a rejected request.
+
+    Args:
+        wait (float): Seconds until the request would be accepted.
+
+    Returns:
+        dict[str, str]: The header, in whole seconds.
+    """
+    seconds = max(1, math.ceil(wait))
+    return {'Retry-After': str(seconds)}
@@ -0,0 +1,167 @@
+"""A module completing movie titles and actor names from a prefix with in-memory sorted indexes."""
+
+import bisect
+import threading
+import unicodedata
+from operator import itemgetter
+from typing import Iterable, Optional
+from uuid import UUID
+
+from catalog import ActorRecord, CatalogSnapshot, MovieRecord
+from persistent import HashIndex
+
+
+class PrefixIndex:
+    """Records sorted by their normalized text, so the records matching a prefix are found by binary search."""
+
+    def __init__(self, indexed: Iterable[tuple[str, object]] = ()) -> None:
+        """
+        Build the index.
+
+        Args:
+            indexed (Iterable[tuple[str, object]]): Pairs of the text to index and its record.
+        """
+        pairs = sorted(((normalize(text), record) for text, record in indexed), key=itemgetter(0))
+        self._keys = [key for key, _ in pairs]
+        self._records = [record for _, record in pairs]
+
+    def add(self, text: str, record: object) -> None:
+        """
+        Index a record.
+
+        Args:
+            text (str): The text to index the record by.
+            record (object): The record, with an id attribute.
+        """
+        key = normalize(text)
+        position = bisect.bisect_right(self._keys, key)
+        self._keys.insert(position, key)
+        self._records.insert(position, record)
+
+    def remove(self, text: str, record_id: UUID) -> None:
+        """
+        Remove a record from the index.
+
+        Args:
+            text (str): The text the record was indexed by.
+            record_id (UUID): The id of the record.
+        """
+        key = normalize(text)
+        position = bisect.bisect_left(self._keys, key)
+        while position < len(self._keys) and self._keys[position] == key:
+            if self._records[position].id == record_id:
+                self._keys.pop(position)
+                self._records.pop(position)
+                return
+            position += 1
+
+    def search(self, prefix: str, limit: int) -> list:
+        """
+        Find the records whose normalized text starts with the normalized prefix.
+
+        Args:
+            prefix (str): The prefix typed so far.
+            limit (int): The maximum number of records.
+
+        Returns:
+            list: The first matching records in alphabetical order of their normalized text.
+        """
+        key = normalize(prefix)
+        if not key:
+            return []
+        start = bisect.bisect_left(self._keys, key)
+        end = start
+        stop = min(start + limit, len(self._keys))
+        while end < stop and self._keys[end].startswith(key):
+            end += 1
+        return self._records[start:end]
+
+    def __len__(self) -> int:
+        """
+        Count the indexed records.
+
+        Returns:
+            int: Number of records.
+        """
+        return len(self._keys)
+
+
+class Autocomplete:
+    """Prefix indexes of the titles and actor names of the catalog, updated with each catalog snapshot."""
+
+    def __init__(self) -> None:
+        """Initialize empty indexes."""
+        self._lock = threading.Lock()
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._titles = PrefixIndex()
+        self._actors = PrefixIndex()
+
+    def update(self, snapshot: CatalogSnapshot, changes: Optional[list[tuple]]) -> None:
+        """
+        Follow a new catalog snapshot, updating only the titles of changed movies and the names of changed actors.
+
+        Args:
+            snapshot (CatalogSnapshot): The new snapshot.
+            changes (Optional[list[tuple]]): Rows of db.get_movie_changes applied; None if the catalog was reloaded.
+        """
+        with self._lock:
+            previous = self._snapshot
+            self._snapshot = snapshot
+            if previous is None:
+                self._actors = PrefixIndex((actor.full_name, actor) for actor in snapshot.actors.values())
+            elif snapshot.actors is not previous.actors:
+                self._update_actors(previous.actors, snapshot)
+            if previous is None or changes is None:
+                self._titles = PrefixIndex((movie.title, movie) for movie in snapshot.movies)
+                return
+            changed_ids = {change[1] for change in changes}
+            for movie_id in changed_ids:
+                old_movie = previous.movies_by_id.get(movie_id)
+                if old_movie is not None:
+                    self._titles.remove(old_movie.title, movie_id)
+                movie = snapshot.movies_by_id.get(movie_id)
+                if movie is not None:
+                    self._titles.add(movie.title, movie)
+
+    def search(self, prefix: str, limit: int) -> tuple[list[MovieRecord], list[ActorRecord]]:
+        """
+        Complete a prefix with movie titles and actor names.
+
+        Args:
+            prefix (str): The prefix typed so far.
+            limit (int): The maximum number of movies and of actors.
+
+        Returns:
+            tuple[list[MovieRecord], list[ActorRecord]]: The matching movies and actors.
+        """
+        with self._lock:
+            return self._titles.search(prefix, limit), self._actors.search(prefix, limit)
+
+    def _update_actors(self, previous_actors: HashIndex, snapshot: CatalogSnapshot) -> None:
+        # Only the added, removed or renamed actors among the changed ones, or all of them after a reload, are
+        # reindexed.
+        actor_ids = snapshot.changed_actors
+        if actor_ids is None:
+            actor_ids = previous_actors.keys() | snapshot.actors.keys()
+        for actor_id in actor_ids:
+            indexed, actor = previous_actors.get(actor_id), snapshot.actors.get(actor_id)
+            if getattr(indexed, 'full_name', None) == getattr(actor, 'full_name', None):
+                continue
+            if indexed is not None:
+                self._actors.remove(indexed.full_name, actor_id)
+            if actor is not None:
+                self._actors.add(actor.full_name, actor)
+
+
+def normalize(text: str) -> str:
+    """
+    Normalize a text for matching: case folded, without accents and with single spaces.
+
+    Args:
+        text (str): The text to normalize.
+
+    Returns:
+        str: The normalized text.
+    """
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ' '.join(''.join(char for char in decomposed if not unicodedata.combining(char)).split())
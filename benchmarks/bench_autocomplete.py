@@ -0,0 +1,65 @@
+"""Benchmark the latency of title completions and of incremental index updates on a synthetic catalog."""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from uuid import uuid4
+
+import numpy
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config
+from autocomplete import PrefixIndex
+from catalog import MovieRecord
+from seed import CatalogGenerator
+
+QUERIES = 10000
+UPDATES = 1000
+
+
+def percentiles(latencies: list[float]) -> str:
+    """
+    Format the median and tail latencies.
+
+    Args:
+        latencies (list[float]): Latencies in microseconds.
+
+    Returns:
+        str: The p50, p99 and maximum latencies.
+    """
+    p50, p99 = numpy.percentile(latencies, (50, 99))
+    return f'p50 {p50:8.1f} us, p99 {p99:8.1f} us, max {max(latencies):8.1f} us'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--movies', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=config.SEED)
+    args = parser.parse_args()
+
+    movies = []
+    for chunk, _ in CatalogGenerator(args.movies, 1, args.seed).movie_chunks():
+        movies.extend(MovieRecord(*movie_row) for movie_row in chunk)
+    started = time.perf_counter()
+    index = PrefixIndex((movie.title, movie) for movie in movies)
+    print(f'movies={args.movies} indexed in {time.perf_counter() - started:.1f} s')
+
+    rng = random.Random(args.seed)
+    searches = []
+    for queried in rng.choices(movies, k=QUERIES):
+        prefix = queried.title[:rng.randint(1, len(queried.title))]
+        started = time.perf_counter()
+        index.search(prefix, config.AUTOCOMPLETE_DEFAULT_LIMIT)
+        searches.append((time.perf_counter() - started) * 1e6)
+    print(f'top-{config.AUTOCOMPLETE_DEFAULT_LIMIT} completions: {percentiles(searches)}')
+
+    updates = []
+    for renamed in rng.sample(movies, UPDATES):
+        started = time.perf_counter()
+        index.remove(renamed.title, renamed.id)
+        index.add(f'{renamed.title} {uuid4().hex[:4]}', renamed)
+        updates.append((time.perf_counter() - started) * 1e6)
+    print(f'title updates: {percentiles(updates)}')
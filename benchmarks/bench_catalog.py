@@ -0,0 +1,123 @@
+"""Benchmark memory per movie and lookup latency of the in-memory catalog against lists of row tuples."""
+
+import argparse
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config
+from catalog import CatalogSnapshot
+from seed import GENRES, CatalogGenerator
+
+SAMPLES = 100000
+SCAN_SAMPLES = 10
+
+
+def generate_rows(movies: int, seed: int) -> list[tuple]:
+    """
+    Generate the movie rows of the synthetic catalog without a database.
+
+    Args:
+        movies (int): Number of movies.
+        seed (int): Seed of the generator.
+
+    Returns:
+        list[tuple]: Rows of (id, title, description, genre, year, trailer, poster).
+    """
+    rows = []
+    for chunk, _ in CatalogGenerator(movies, 1, seed).movie_chunks():
+        rows.extend(chunk)
+    return rows
+
+
+def row_bytes(row: tuple) -> int:
+    """
+    Measure a row tuple with the values it holds.
+
+    Args:
+        row (tuple): The row to measure.
+
+    Returns:
+        int: Size of the row in bytes.
+    """
+    return sys.getsizeof(row) + sys.getsizeof(row[0].int) + sum(sys.getsizeof(row_value) for row_value in row)
+
+
+def traced_bytes(build: Callable[[], object]) -> tuple[object, int]:
+    """
+    Measure the memory newly allocated and retained by a structure.
+
+    Args:
+        build (Callable[[], object]): Function building the structure.
+
+    Returns:
+        tuple[object, int]: The structure and its retained bytes.
+    """
+    gc.collect()
+    tracemalloc.start()
+    built = build()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return built, retained
+
+
+def latency(lookup: Callable[[int], object], samples: int = SAMPLES) -> float:
+    """
+    Measure the mean latency of a lookup.
+
+    Args:
+        lookup (Callable[[int], object]): Function looking up the sample of the given number.
+        samples (int): Number of lookups.
+
+    Returns:
+        float: Mean latency in microseconds.
+    """
+    started = time.perf_counter()
+    for sample in range(samples):
+        lookup(sample)
+    return (time.perf_counter() - started) / samples * 1e6
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--movies', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=config.SEED)
+    args = parser.parse_args()
+
+    rows = generate_rows(args.movies, args.seed)
+    tuples_total = sum(map(row_bytes, rows))
+    genre_strings = sum(sys.getsizeof(row[3]) for row in rows)
+    # The snapshot shares the id, title, description and URL objects of the rows, so only its records,
+    # indexes and interned genres are newly allocated; the duplicate genre strings of the rows are not kept.
+    snapshot, structure = traced_bytes(lambda: CatalogSnapshot.build(0, rows, ()))
+    row_overhead = sum(sys.getsizeof(row) for row in rows)
+    snapshot_total = tuples_total - row_overhead - genre_strings + structure
+
+    rng = random.Random(args.seed)
+    sample_rows = rng.choices(rows, k=SAMPLES)
+    years = list(snapshot.movies_by_year)
+    scan = latency(lambda sample: next(row for row in rows if row[0] == sample_rows[sample][0]), SCAN_SAMPLES)
+    by_id = latency(lambda sample: snapshot.movies_by_id[sample_rows[sample][0]])
+    by_title = latency(lambda sample: snapshot.movies_by_title[sample_rows[sample][1]])
+    by_year = latency(lambda sample: snapshot.find_movies(year=years[sample % len(years)]))
+    by_genre_year = latency(
+        lambda sample: snapshot.find_movies(genre=GENRES[sample % len(GENRES)], year=years[sample % len(years)]),
+    )
+
+    print(f'movies={args.movies}')
+    print(f'bytes per movie: row tuples {tuples_total / args.movies:.0f}, snapshot {snapshot_total / args.movies:.0f}')
+    print(f'  of which snapshot records and indexes {structure / args.movies:.0f}')
+    print(f'id lookup, scan of row tuples {scan:12.1f} us')
+    listings = (
+        ('id lookup', by_id), ('title lookup', by_title), ('year listing', by_year),
+        ('genre+year listing', by_genre_year),
+    )
+    for name, lookup_latency in listings:
+        print(f'{name}, snapshot'.ljust(30), f'{lookup_latency:12.3f} us')
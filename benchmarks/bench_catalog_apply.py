@@ -0,0 +1,77 @@
+"""Benchmark applying one change of the change feed to catalog snapshots of growing sizes."""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config
+from catalog import CatalogSnapshot
+from seed import GENRES, CatalogGenerator
+
+CHANGES = 2000
+
+
+def change_rows(rows: list[tuple], changes: int, seed: int) -> list[tuple]:
+    """
+    Generate changes of rated movies moving them to other genres, years and ranks.
+
+    Args:
+        rows (list[tuple]): Rows of the catalog.
+        changes (int): Number of changes.
+        seed (int): Seed of the generator.
+
+    Returns:
+        list[tuple]: Rows of db.get_movie_changes, one per change.
+    """
+    rng = random.Random(seed)
+    return [
+        (
+            seq, row[0], False, *row[1:3], rng.choice(GENRES), rng.randrange(1950, 2025), *row[5:7],
+            rng.randrange(10, 100) / 10, rng.randrange(1, 100000), None, None,
+        )
+        for seq, row in enumerate(rng.sample(rows, changes), start=1)
+    ]
+
+
+def generate_rated_rows(movies: int, seed: int) -> list[tuple]:
+    """
+    Generate the movie rows of the synthetic catalog, half of them rated so the ranking is as large as a big bucket.
+
+    Args:
+        movies (int): Number of movies.
+        seed (int): Seed of the generator.
+
+    Returns:
+        list[tuple]: Rows of (id, title, description, genre, year, trailer, poster) and ratings.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for chunk, _ in CatalogGenerator(movies, 1, seed).movie_chunks():
+        rows.extend(
+            (*row, rng.randrange(10, 100) / 10, rng.randrange(1, 100000)) if rng.randrange(2) else row
+            for row in chunk
+        )
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--movies', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--seed', type=int, default=config.SEED)
+    args = parser.parse_args()
+
+    for movies in args.movies:
+        rows = generate_rated_rows(movies, args.seed)
+        started = time.perf_counter()
+        snapshot = CatalogSnapshot.build(0, rows, ())
+        built = time.perf_counter() - started
+        changes = change_rows(rows, min(CHANGES, movies), args.seed)
+        started = time.perf_counter()
+        for change in changes:
+            snapshot = snapshot.apply([change])
+        applied = (time.perf_counter() - started) / len(changes)
+        print(f'movies={movies:>8}  build {built:7.2f} s  apply one change {applied * 1e6:8.1f} us')
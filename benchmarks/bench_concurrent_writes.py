@@ -0,0 +1,82 @@
+"""Benchmark concurrent writers of movies whose transactions stay open a while after their write, e.g. on commit."""
+
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+from uuid import uuid4
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db
+import query
+
+TITLE_PREFIX = 'bench-cw'
+HOLD = 'select pg_sleep(%s)'
+CLEANUP = 'delete from movie where title like %s'
+
+
+def writer(writes: int, hold: float, barrier: threading.Barrier) -> None:
+    """
+    Insert movies on a dedicated connection, each in a transaction held open after the insert.
+
+    Args:
+        writes (int): Number of movies to insert.
+        hold (float): Seconds each transaction stays open after its insert.
+        barrier (threading.Barrier): Barrier released when all writers are connected.
+    """
+    connection, cursor = db.connect()
+    barrier.wait()
+    for _ in range(writes):
+        movie = (uuid4(), f'{TITLE_PREFIX}-{uuid4()}', 'benchmark movie', 'Drama', 2000, 'trailer', 'poster')
+        cursor.execute(query.INSERT_MOVIE, params=movie)
+        cursor.execute(HOLD, params=(hold,))
+        connection.commit()
+    connection.close()
+
+
+def run(threads: int, writes: int, hold: float) -> float:
+    """
+    Run concurrent writers and measure their throughput.
+
+    Args:
+        threads (int): Number of concurrent writer threads.
+        writes (int): Number of writes per thread.
+        hold (float): Seconds each transaction stays open after its insert.
+
+    Returns:
+        float: Committed writes per second.
+    """
+    barrier = threading.Barrier(threads + 1)
+    workers = [threading.Thread(target=writer, args=(writes, hold, barrier)) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for joined in workers:
+        joined.join()
+    return threads * writes / (time.perf_counter() - started)
+
+
+def cleanup() -> None:
+    """Delete the movies inserted by the benchmark."""
+    connection, cursor = db.connect()
+    cursor.execute(CLEANUP, params=(f'{TITLE_PREFIX}-%',))
+    connection.commit()
+    connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--writes', type=int, default=20)
+    parser.add_argument('--hold', type=float, default=0.01)
+    args = parser.parse_args()
+
+    cleanup()
+    throughput = run(args.threads, args.writes, args.hold)
+    cleanup()
+
+    print(f'threads={args.threads} writes/thread={args.writes} hold={args.hold * 1000:.0f} ms')
+    print(f'concurrent writes: {throughput:10.1f} writes/s, serialized bound {1 / args.hold:10.1f} writes/s')
@@ -0,0 +1,91 @@
+"""Benchmark write throughput with per-request commits versus group commit."""
+
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config
+import db
+from group_commit import GroupCommitter
+
+TITLE_PREFIX = 'bench-gc'
+CLEANUP = 'delete from movie where title like %s'
+
+
+def writer(thread_no: int, writes: int, barrier: threading.Barrier) -> None:
+    """
+    Insert movies on a dedicated connection as a single request thread would.
+
+    Args:
+        thread_no (int): Number of the writer thread, used to build unique titles.
+        writes (int): Number of movies to insert.
+        barrier (threading.Barrier): Barrier released when all writers are connected.
+    """
+    connection, cursor = db.connect()
+    barrier.wait()
+    for write_no in range(writes):
+        db.add_movie(
+            cursor, connection, f'{TITLE_PREFIX}-{thread_no}-{write_no}',
+            'benchmark movie', 'Drama', 2000, 'trailer', 'poster',
+        )
+    connection.close()
+
+
+def run(threads: int, writes: int) -> float:
+    """
+    Run concurrent writers and measure their throughput.
+
+    Args:
+        threads (int): Number of concurrent writer threads.
+        writes (int): Number of writes per thread.
+
+    Returns:
+        float: Committed writes per second.
+    """
+    barrier = threading.Barrier(threads + 1)
+    workers = [
+        threading.Thread(target=writer, args=(thread_no, writes, barrier))
+        for thread_no in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for joined in workers:
+        joined.join()
+    return threads * writes / (time.perf_counter() - started)
+
+
+def cleanup() -> None:
+    """Delete the movies inserted by the benchmark."""
+    connection, cursor = db.connect()
+    cursor.execute(CLEANUP, params=(f'{TITLE_PREFIX}-%',))
+    connection.commit()
+    connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--writes', type=int, default=200)
+    parser.add_argument('--max-delay', type=float, default=config.GROUP_COMMIT_MAX_DELAY)
+    parser.add_argument('--max-batch', type=int, default=config.GROUP_COMMIT_MAX_BATCH)
+    args = parser.parse_args()
+
+    cleanup()
+    per_request = run(args.threads, args.writes)
+    cleanup()
+    committer = GroupCommitter(
+        lambda: db.connect()[0], args.max_delay, args.max_batch, config.GROUP_COMMIT_TIMEOUT,
+    ).start()
+    grouped = run(args.threads, args.writes)
+    committer.stop()
+    cleanup()
+
+    print(f'threads={args.threads} writes/thread={args.writes}')
+    print(f'per-request commit: {per_request:10.1f} writes/s')
+    print(f'group commit:       {grouped:10.1f} writes/s ({grouped / per_request:.1f}x)')
@@ -0,0 +1,61 @@
+"""Benchmark the latency of similar movies queries on a synthetic catalog, without a database."""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config
+from catalog import CatalogSnapshot
+from seed import CatalogGenerator
+from similarity import SimilarityIndex
+
+QUERIES = 200
+
+
+def build_index(movies: int, actors: int, seed: int) -> tuple[SimilarityIndex, list[tuple]]:
+    """
+    Build the index of a synthetic catalog, generating it twice to stream the casts as movie_actor pages.
+
+    Args:
+        movies (int): Number of movies.
+        actors (int): Number of actors.
+        seed (int): Seed of the generator.
+
+    Returns:
+        tuple[SimilarityIndex, list[tuple]]: The index and the movie rows.
+    """
+    movie_rows = []
+    for chunk, _ in CatalogGenerator(movies, actors, seed).movie_chunks():
+        movie_rows.extend(chunk)
+    index = SimilarityIndex(router=None)
+    index.update(CatalogSnapshot.build(0, movie_rows, ()), None)
+    index.load_casts(cast_rows for _, cast_rows in CatalogGenerator(movies, actors, seed).movie_chunks())
+    return index, movie_rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--movies', type=int, default=500000)
+    parser.add_argument('--actors', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=config.SEED)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index, movie_rows = build_index(args.movies, args.actors, args.seed)
+    print(f'movies={args.movies} actors={args.actors} built in {time.perf_counter() - started:.1f} s')
+
+    queries = random.Random(args.seed).choices(movie_rows, k=QUERIES)
+    latencies = []
+    for movie_row in queries:
+        started = time.perf_counter()
+        index.similar(movie_row[0], config.SIMILAR_DEFAULT_LIMIT)
+        latencies.append((time.perf_counter() - started) * 1000)
+    print(f'top-{config.SIMILAR_DEFAULT_LIMIT} similar movies, ms:')
+    for percentile in (50, 90, 99):
+        print(f'  p{percentile} {numpy.percentile(latencies, percentile):8.2f}')
@@ -0,0 +1,96 @@
+"""Benchmark PUT latency of check-then-update round trips versus a single upsert statement."""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+from types import MappingProxyType
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db
+
+TITLE = 'bench-upsert'
+CLEANUP = 'delete from movie where title like %s'
+# The lookup PUT ran before its update or insert.
+CHECK_MOVIE = 'select 1 from movie where id = %s'
+MOVIE = MappingProxyType({
+    'title': TITLE, 'description': 'benchmark movie', 'genre': 'Drama',
+    'year': 2000, 'trailer': 'trailer', 'poster': 'poster',
+})
+
+
+def check_then_update(cursor, connection, movie_id) -> None:
+    """
+    Replace a movie the way PUT used to: look it up, then update or insert it.
+
+    Args:
+        cursor: The database cursor object to execute the queries.
+        connection: The database connection object to commit the transaction.
+        movie_id: The unique identifier of the movie.
+    """
+    cursor.execute(CHECK_MOVIE, params=(movie_id,))
+    if cursor.fetchone() is not None:
+        db.update_movie(cursor, connection, MOVIE, movie_id)
+    else:
+        db.add_movie(cursor, connection, **MOVIE)
+
+
+def upsert(cursor, connection, movie_id) -> None:
+    """
+    Replace a movie with a single INSERT ... ON CONFLICT DO UPDATE statement.
+
+    Args:
+        cursor: The database cursor object to execute the query.
+        connection: The database connection object to commit the transaction.
+        movie_id: The unique identifier of the movie.
+    """
+    db.upsert_movie(cursor, connection, MOVIE, movie_id)
+
+
+def measure(put: Callable, requests: int) -> list[float]:
+    """
+    Measure the latency of replacing the same movie repeatedly.
+
+    Args:
+        put (Callable): Function replacing the movie.
+        requests (int): Number of replacements.
+
+    Returns:
+        list[float]: Latencies in milliseconds.
+    """
+    connection, cursor = db.connect()
+    movie_id = db.upsert_movie(cursor, connection, MOVIE)[0]
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        put(cursor, connection, movie_id)
+        latencies.append((time.perf_counter() - started) * 1000)
+    cursor.execute(CLEANUP, params=(TITLE,))
+    connection.commit()
+    connection.close()
+    return latencies
+
+
+def report(name: str, latencies: list[float]) -> None:
+    """
+    Print latency percentiles.
+
+    Args:
+        name (str): Name of the measured strategy.
+        latencies (list[float]): Latencies in milliseconds.
+    """
+    percentiles = statistics.quantiles(latencies, n=100)
+    summary = ' '.join(f'p{rank}={percentiles[rank - 1]:.3f}ms' for rank in (50, 95, 99))
+    print(name.ljust(18), summary)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    report('check then update', measure(check_then_update, args.requests))
+    report('upsert', measure(upsert, args.requests))
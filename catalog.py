@@ -0,0 +1,538 @@
+"""A module keeping a compact, indexed in-memory snapshot of the catalog current with the change feed."""
+
+import itertools
+import sys
+import threading
+import time
+from operator import attrgetter
+from types import MappingProxyType
+from typing import Callable, Iterable, Optional
+from uuid import UUID
+
+import config
+import db
+from persistent import HashIndex, SortedSequence
+from replicas import READ_ERRORS, ReplicaRouter
+
+GENRE_SEPARATOR = ', '
+Buckets = tuple[dict, dict, dict]
+OnChange = Callable[['CatalogSnapshot', Optional[list[tuple]]], None]
+# Keys of movies in the indexes; listing positions are those of the catalog query, then of added movies.
+ID_KEY = attrgetter('id')
+TITLE_KEY = attrgetter('title')
+LISTING_KEY = attrgetter('position')
+ACTOR_TAG = 'actor:'
+
+
+class MovieRecord:
+    """A movie of the catalog; genre strings are interned, as few distinct combinations exist."""
+
+    __slots__ = (
+        'id', 'title', 'description', 'genre', 'year', 'trailer', 'poster',
+        'imdb_rating', 'imdb_votes', 'rotten_tomatoes', 'metacritic', 'position',
+    )
+
+    def __init__(
+        self, movie_id: UUID, title: str, description: str, genre: str, year: int, trailer: str, poster: str,
+        imdb_rating: Optional[float] = None, imdb_votes: Optional[int] = None,
+        rotten_tomatoes: Optional[int] = None, metacritic: Optional[int] = None,
+    ) -> None:
+        """
+        Initialize the movie.
+
+        Args:
+            movie_id (UUID): The unique identifier of the movie.
+            title (str): The title of the movie.
+            description (str): A brief description of the movie.
+            genre (str): Comma separated genres of the movie.
+            year (int): The release year of the movie.
+            trailer (str): The URL of the movie's trailer.
+            poster (str): The URL of the movie's poster image.
+            imdb_rating (Optional[float]): The IMDb rating out of 10 stored from OMDB, None if unrated.
+            imdb_votes (Optional[int]): The number of IMDb votes.
+            rotten_tomatoes (Optional[int]): The Rotten Tomatoes score out of 100.
+            metacritic (Optional[int]): The Metacritic score out of 100.
+        """
+        self.id = movie_id
+        self.title = title
+        self.description = description
+        self.genre = sys.intern(genre)
+        self.year = year
+        self.trailer = trailer
+        self.poster = poster
+        self.imdb_rating = imdb_rating
+        self.imdb_votes = imdb_votes
+        self.rotten_tomatoes = rotten_tomatoes
+        self.metacritic = metacritic
+        # The listing position is set by the snapshot indexing the movie.
+        self.position = 0
+
+    @property
+    def genres(self) -> list[str]:
+        """
+        Split the genres of the movie.
+
+        Returns:
+            list[str]: The genres of the movie.
+        """
+        return self.genre.split(GENRE_SEPARATOR)
+
+
+class ActorRecord:
+    """An actor of the catalog."""
+
+    __slots__ = ('id', 'full_name', 'birth_date')
+
+    def __init__(self, actor_id: UUID, full_name: str, birth_date: str) -> None:
+        """
+        Initialize the actor.
+
+        Args:
+            actor_id (UUID): The unique identifier of the actor.
+            full_name (str): The full name of the actor.
+            birth_date (str): The birth date of the actor.
+        """
+        self.id = actor_id
+        self.full_name = full_name
+        self.birth_date = birth_date
+
+
+class CatalogSnapshot:
+    """
+    An immutable state of the catalog with its indexes.
+
+    The ids of the actors changed from the previous snapshot are kept for followers; they are None when all
+    actors were reloaded.
+
+    Indexes are persistent: a change builds a new snapshot updating the changed keys only, in O(log N),
+    and sharing all other nodes, so readers holding the previous snapshot are never affected.
+    """
+
+    __slots__ = (
+        'seq', 'movies_by_id', 'movies_by_title', 'movies', 'movies_by_year', 'movies_by_genre',
+        'movies_by_genre_year', 'movies_by_rating', 'actors', 'changed_actors',
+    )
+
+    def __init__(
+        self, seq: int, movies_by_id: HashIndex, movies_by_title: HashIndex, movies: SortedSequence,
+        buckets: Buckets, ranking: SortedSequence, actors: HashIndex,
+        changed_actors: Optional[frozenset[UUID]] = None,
+    ) -> None:
+        """
+        Initialize the snapshot from its indexes.
+
+        Args:
+            seq (int): The sequence number of the last change of the change feed included.
+            movies_by_id (HashIndex): The movies by id.
+            movies_by_title (HashIndex): The movies by title.
+            movies (SortedSequence): The movies in listing order.
+            buckets (Buckets): Sequences of movies in listing order by release year, by genre and by genre and year.
+            ranking (SortedSequence): The rated movies in rating_rank order.
+            actors (HashIndex): The actors by id.
+            changed_actors (Optional[frozenset[UUID]]): Ids of the actors changed since the last snapshot, or None.
+        """
+        self.seq = seq
+        self.movies_by_id = movies_by_id
+        self.movies_by_title = movies_by_title
+        self.movies = movies
+        self.movies_by_year = MappingProxyType(buckets[0])
+        self.movies_by_genre = MappingProxyType(buckets[1])
+        self.movies_by_genre_year = MappingProxyType(buckets[2])
+        self.movies_by_rating = ranking
+        self.actors = actors
+        self.changed_actors = changed_actors
+
+    @classmethod
+    def build(cls, seq: int, movie_rows: Iterable[tuple], actor_rows: Iterable[tuple]) -> 'CatalogSnapshot':
+        """
+        Build a snapshot from database rows.
+
+        Args:
+            seq (int): The sequence number of the change feed the rows are consistent with.
+            movie_rows (Iterable[tuple]): Rows of (id, title, description, genre, year, trailer, poster) and ratings.
+            actor_rows (Iterable[tuple]): Rows of (full_name, birth_date, id).
+
+        Returns:
+            CatalogSnapshot: The snapshot of the rows.
+        """
+        movies = list(itertools.starmap(MovieRecord, movie_rows))
+        for position, listed in enumerate(movies):
+            listed.position = position
+        buckets = tuple(
+            {key: SortedSequence(LISTING_KEY, bucket) for key, bucket in index.items()}
+            for index in bucket_movies(movies)
+        )
+        return cls(
+            seq, HashIndex(ID_KEY, movies), HashIndex(TITLE_KEY, movies), SortedSequence(LISTING_KEY, movies),
+            buckets, SortedSequence(rating_rank, (movie for movie in movies if movie.imdb_rating is not None)),
+            HashIndex(ID_KEY, make_actors(actor_rows)),
+        )
+
+    def find_movies(
+        self, genre: Optional[str] = None, year: Optional[int] = None, by_rating: bool = False,
+    ) -> Iterable[MovieRecord]:
+        """
+        List the movies of a genre and/or a release year from the indexes.
+
+        Args:
+            genre (Optional[str]): A single genre, e.g. 'Drama'; any genre if None.
+            year (Optional[int]): The release year; any year if None.
+            by_rating (bool): Whether to order the movies by rating_rank instead of listing order.
+
+        Returns:
+            Iterable[MovieRecord]: The matching movies.
+        """
+        if genre is not None and year is not None:
+            movies = self.movies_by_genre_year.get((genre, year), ())
+        elif genre is not None:
+            movies = self.movies_by_genre.get(genre, ())
+        elif year is not None:
+            movies = self.movies_by_year.get(year, ())
+        elif by_rating:
+            unrated = (movie for movie in self.movies if movie.imdb_rating is None)
+            return itertools.chain(self.movies_by_rating, unrated)
+        else:
+            return self.movies
+        return sorted(movies, key=rating_rank) if by_rating else movies
+
+    def apply(self, changes: list[tuple]) -> 'CatalogSnapshot':
+        """
+        Build the snapshot following a batch of the change feed.
+
+        Each changed movie is removed from and inserted into the indexes in O(log N); updated movies keep
+        their listing position and new ones are listed last.
+
+        Args:
+            changes (list[tuple]): Rows of db.get_movie_changes ordered by sequence number.
+
+        Returns:
+            CatalogSnapshot: The new snapshot.
+        """
+        indexes = SnapshotIndexes(self)
+        for _, changed_id, deleted, *attributes in changes:
+            old_movie = indexes.movies_by_id.get(changed_id)
+            if old_movie is not None:
+                indexes.remove(old_movie)
+            if not deleted:
+                movie = MovieRecord(changed_id, *attributes)
+                movie.position = indexes.next_position() if old_movie is None else old_movie.position
+                indexes.add(movie)
+        return CatalogSnapshot(
+            changes[-1][0], indexes.movies_by_id, indexes.movies_by_title, indexes.movies,
+            indexes.buckets, indexes.ranking, self.actors, frozenset(),
+        )
+
+    def with_actors(self, actor_rows: Iterable[tuple]) -> 'CatalogSnapshot':
+        """
+        Build the snapshot with another list of actors, sharing all indexes of movies.
+
+        Args:
+            actor_rows (Iterable[tuple]): Rows of (full_name, birth_date, id).
+
+        Returns:
+            CatalogSnapshot: The new snapshot.
+        """
+        return self._with_actors(HashIndex(ID_KEY, make_actors(actor_rows)), None)
+
+    def with_actor_changes(self, actor_ids: Iterable[UUID], actor_rows: Iterable[tuple]) -> 'CatalogSnapshot':
+        """
+        Build the snapshot with changed actors replaced in O(log A) each, sharing all other actors.
+
+        Args:
+            actor_ids (Iterable[UUID]): The ids of the changed actors.
+            actor_rows (Iterable[tuple]): Rows of (full_name, birth_date, id) of the changed actors left.
+
+        Returns:
+            CatalogSnapshot: The new snapshot.
+        """
+        actor_ids = frozenset(actor_ids)
+        actors = self.actors
+        for actor_id in actor_ids:
+            actors = actors.discard(actor_id)
+        for actor in make_actors(actor_rows):
+            actors = actors.set(actor)
+        return self._with_actors(actors, actor_ids)
+
+    def _with_actors(self, actors: HashIndex, changed_actors: Optional[frozenset[UUID]]) -> 'CatalogSnapshot':
+        buckets = (dict(self.movies_by_year), dict(self.movies_by_genre), dict(self.movies_by_genre_year))
+        return CatalogSnapshot(
+            self.seq, self.movies_by_id, self.movies_by_title, self.movies,
+            buckets, self.movies_by_rating, actors, changed_actors,
+        )
+
+
+class SnapshotIndexes:
+    """The indexes of a snapshot being changed; only the bucket maps of changed keys are copied, once."""
+
+    def __init__(self, snapshot: CatalogSnapshot) -> None:
+        """
+        Start from the indexes of a snapshot.
+
+        Args:
+            snapshot (CatalogSnapshot): The snapshot, left unchanged.
+        """
+        self.movies_by_id = snapshot.movies_by_id
+        self.movies_by_title = snapshot.movies_by_title
+        self.movies = snapshot.movies
+        self.ranking = snapshot.movies_by_rating
+        self.buckets = (snapshot.movies_by_year, snapshot.movies_by_genre, snapshot.movies_by_genre_year)
+        self._copied = False
+
+    def next_position(self) -> int:
+        """
+        Give the listing position after the last movie.
+
+        Returns:
+            int: The position of a new movie.
+        """
+        last = self.movies.last()
+        return 0 if last is None else last.position + 1
+
+    def add(self, movie: MovieRecord) -> None:
+        """
+        Index a movie.
+
+        Args:
+            movie (MovieRecord): The movie, whose id, title and position are not indexed.
+        """
+        self.movies_by_id = self.movies_by_id.set(movie)
+        self.movies_by_title = self.movies_by_title.set(movie)
+        self.movies = self.movies.insert(movie)
+        if movie.imdb_rating is not None:
+            self.ranking = self.ranking.insert(movie)
+        for index, key in self._bucket_keys(movie):
+            index[key] = index.get(key, EMPTY_BUCKET).insert(movie)
+
+    def remove(self, movie: MovieRecord) -> None:
+        """
+        Unindex a movie.
+
+        Args:
+            movie (MovieRecord): The indexed movie.
+        """
+        self.movies_by_id = self.movies_by_id.discard(movie.id)
+        if self.movies_by_title.get(movie.title) is movie:
+            self.movies_by_title = self.movies_by_title.discard(movie.title)
+        self.movies = self.movies.remove(movie)
+        if movie.imdb_rating is not None:
+            self.ranking = self.ranking.remove(movie)
+        for index, key in self._bucket_keys(movie):
+            bucket = index[key].remove(movie)
+            if bucket:
+                index[key] = bucket
+            else:
+                index.pop(key)
+
+    def _bucket_keys(self, movie: MovieRecord) -> list[tuple[dict, object]]:
+        if not self._copied:
+            self.buckets = tuple(map(dict, self.buckets))
+            self._copied = True
+        by_year, by_genre, by_genre_year = self.buckets
+        bucket_keys = [(by_year, movie.year)]
+        for genre in map(sys.intern, movie.genres):
+            bucket_keys.extend(((by_genre, genre), (by_genre_year, (genre, movie.year))))
+        return bucket_keys
+
+
+def make_actors(actor_rows: Iterable[tuple]) -> tuple[ActorRecord, ...]:
+    """
+    Build actor records from database rows.
+
+    Args:
+        actor_rows (Iterable[tuple]): Rows of (full_name, birth_date, id).
+
+    Returns:
+        tuple[ActorRecord, ...]: The actors.
+    """
+    return tuple(ActorRecord(actor_id, full_name, birth_date) for full_name, birth_date, actor_id in actor_rows)
+
+
+def bucket_movies(movies: Iterable[MovieRecord]) -> tuple[dict, dict, dict]:
+    """
+    Group movies by release year, by each of their genres and by each genre and year.
+
+    Args:
+        movies (Iterable[MovieRecord]): The movies to group.
+
+    Returns:
+        tuple[dict, dict, dict]: Lists of movies by year, by genre and by (genre, year).
+    """
+    by_year, by_genre, by_genre_year = {}, {}, {}
+    for movie in movies:
+        by_year.setdefault(movie.year, []).append(movie)
+        for genre in movie.genres:
+            by_genre.setdefault(sys.intern(genre), []).append(movie)
+            by_genre_year.setdefault((sys.intern(genre), movie.year), []).append(movie)
+    return by_year, by_genre, by_genre_year
+
+
+def rating_rank(movie: MovieRecord) -> tuple:
+    """
+    Sort key of movies from the best rated, by IMDb rating then votes; unrated movies come last.
+
+    Args:
+        movie (MovieRecord): The movie.
+
+    Returns:
+        tuple: The sort key, unique as titles are.
+    """
+    return movie.imdb_rating is None, -(movie.imdb_rating or 0), -(movie.imdb_votes or 0), movie.title
+
+
+EMPTY_BUCKET = SortedSequence(LISTING_KEY)
+
+
+class Catalog:
+    """The current catalog snapshot, refreshed from the change feed when movies change."""
+
+    def __init__(self, router: ReplicaRouter) -> None:
+        """
+        Initialize an empty catalog.
+
+        Args:
+            router (ReplicaRouter): The router to read the catalog and its changes with.
+        """
+        self.snapshot = CatalogSnapshot.build(0, (), ())
+        self._router = router
+        self._lock = threading.Lock()
+        self._stale = threading.Event()
+        # Ids of the actors changed since the last refresh; None to reload all actors.
+        self._stale_actor_ids: Optional[set[UUID]] = set()
+        self._stale_lock = threading.Lock()
+        self._subscribers: list[OnChange] = []
+
+    def subscribe(self, on_change: OnChange) -> 'Catalog':
+        """
+        Register a function called with each new snapshot of movies and the changes applied to build it.
+
+        The changes are None when the whole catalog was reloaded and empty when only actors changed.
+        Functions are called in order of the snapshots, with the catalog locked, so they should be quick.
+
+        Args:
+            on_change (OnChange): The function to call on each change of movies.
+
+        Returns:
+            Catalog: The catalog itself.
+        """
+        self._subscribers.append(on_change)
+        return self
+
+    def load(self) -> 'Catalog':
+        """
+        Load the whole catalog from a single snapshot of the database.
+
+        Returns:
+            Catalog: The catalog itself.
+        """
+        with self._lock:
+            self._swap(self._load_snapshot(), None)
+        return self
+
+    def refresh(self, use_primary: bool = False) -> CatalogSnapshot:
+        """
+        Apply the changes of movies committed since the current snapshot.
+
+        The whole catalog is reloaded instead when over half of the movies changed, e.g. after a bulk load.
+
+        Args:
+            use_primary (bool): Whether to read the changes from the primary, to include the latest writes.
+
+        Returns:
+            CatalogSnapshot: The refreshed snapshot.
+        """
+        with self._lock:
+            snapshot = self.snapshot
+            changes = self._read_changes(snapshot, use_primary)
+            if changes is None:
+                snapshot = self._swap(self._load_snapshot(), None)
+            elif changes:
+                snapshot = self._swap(snapshot.apply(changes), changes)
+        return snapshot
+
+    def reload_actors(self, actor_ids: Optional[set[UUID]] = None) -> CatalogSnapshot:
+        """
+        Read changed actors again, leaving out the deleted ones, or reload the list of actors.
+
+        Args:
+            actor_ids (Optional[set[UUID]]): The ids of the changed actors; None to reload all actors.
+
+        Returns:
+            CatalogSnapshot: The snapshot with the reloaded actors.
+        """
+        with self._lock:
+            if actor_ids is None:
+                return self._swap(self.snapshot.with_actors(self._router.read(db.get_actors)), [])
+            # The few notified rows are read where the notification comes from, without waiting for replicas.
+            actor_rows = self._router.read(db.get_actors_by_ids, list(actor_ids), use_primary=True)
+            return self._swap(self.snapshot.with_actor_changes(actor_ids, actor_rows), [])
+
+    def invalidate(self, table: Optional[str], tags: Optional[frozenset[str]]) -> None:
+        """
+        Mark the catalog stale on a change notification; the refresh thread then catches up.
+
+        Changes of movies are read once numbered, as notified by the sequencer as 'movie_change'; changed actors
+        are read by the ids in the tags, or all of them if too many changed.
+
+        Args:
+            table (Optional[str]): The changed table; None if changes may have been missed.
+            tags (Optional[frozenset[str]]): Tags of the changed rows; None if too many rows changed.
+        """
+        if table in {None, 'actor'}:
+            with self._stale_lock:
+                if tags is None:
+                    self._stale_actor_ids = None
+                elif self._stale_actor_ids is not None:
+                    actor_tags = (tag for tag in tags if tag.startswith(ACTOR_TAG))
+                    self._stale_actor_ids.update(UUID(tag[len(ACTOR_TAG):]) for tag in actor_tags)
+        if table in {None, 'movie_change', 'actor'}:
+            self._stale.set()
+
+    def start(self) -> 'Catalog':
+        """
+        Refresh the catalog in a background thread whenever it is marked stale.
+
+        Returns:
+            Catalog: The catalog itself.
+        """
+        threading.Thread(target=self._run, name='catalog-refresh', daemon=True).start()
+        return self
+
+    def _swap(self, snapshot: CatalogSnapshot, changes: Optional[list[tuple]]) -> CatalogSnapshot:
+        self.snapshot = snapshot
+        for on_change in self._subscribers:
+            on_change(snapshot, changes)
+        return snapshot
+
+    def _load_snapshot(self) -> CatalogSnapshot:
+        return CatalogSnapshot.build(*self._router.read(db.get_catalog))
+
+    def _read_changes(self, snapshot: CatalogSnapshot, use_primary: bool) -> Optional[list[tuple]]:
+        changes, since = [], snapshot.seq
+        while True:
+            page = self._router.read(db.get_movie_changes, since, config.CHANGES_MAX_LIMIT, use_primary=use_primary)
+            changes.extend(page)
+            if len(changes) > len(snapshot.movies_by_id) // 2:
+                return None
+            if len(page) < config.CHANGES_MAX_LIMIT:
+                return changes
+            since = page[-1][0]
+
+    def _refresh_stale(self) -> None:
+        with self._stale_lock:
+            actor_ids = self._stale_actor_ids
+            self._stale_actor_ids = set()
+        if actor_ids is None or actor_ids:
+            self.reload_actors(actor_ids)
+        self.refresh()
+
+    def _run(self) -> None:
+        while self._stale.wait():
+            self._stale.clear()
+            try:
+                self._refresh_stale()
+            except READ_ERRORS as error:
+                print(f'catalog refresh failed: {error}')
+                with self._stale_lock:
+                    self._stale_actor_ids = None
+                time.sleep(config.LISTEN_MIN_BACKOFF)
+                self._stale.set()
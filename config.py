@@ -10,12 +10,26 @@ FORBIDDEN = 403
 SERVER_ERROR = 500
 NOT_FOUND = 404
 NOT_ALLOWED = 405
+CONFLICT = 409
 ACCEPTED = 202
+PARTIAL_CONTENT = 206
+NOT_MODIFIED = 304
+RANGE_NOT_SATISFIABLE = 416
+TOO_MANY_REQUESTS = 429
+BAD_GATEWAY = 502
+SERVICE_UNAVAILABLE = 503
+GATEWAY_TIMEOUT = 504
 
 CONTENT_TYPE = 'html'
 CONTENT_LEN_HEADER = 'Content-Length'
-CONTENT_HEADER = 'Content-Type', f'text/{CONTENT_TYPE}'
+CONTENT_TYPE_HEADER = 'Content-Type'
+CONTENT_HEADER = CONTENT_TYPE_HEADER, f'text/{CONTENT_TYPE}'
+JSON_CONTENT_HEADER = CONTENT_TYPE_HEADER, 'application/json'
+POSTER_CONTENT_HEADER = CONTENT_TYPE_HEADER, 'image/jpeg'
+METRICS_CONTENT_HEADER = CONTENT_TYPE_HEADER, 'text/plain; version=0.0.4'
 ALLOW_HEADER = {'Allow': '[GET, HEAD]'}
+TRACEPARENT_HEADER = 'traceparent'
+SERVER_TIMING_HEADER = 'Server-Timing'
 AUTH_HEADER = 'OMDB_API_KEY'
 
 TEMPLATES = 'templates/'
@@ -26,8 +40,87 @@ TEMPLATE_ACTORS = f'{TEMPLATES}actors.html'
 YANDEX_HEADER = 'X-Yandex-API-Key'
 API_URL = 'http://www.omdbapi.com/'
 RATING_KEYS = 'Value'
+ROTTEN_TOMATOES_SOURCE = 'Rotten Tomatoes'
+METACRITIC_SOURCE = 'Metacritic'
 
 TIMEOUT = 8
 
+SEED_MOVIES = 1000
+SEED_ACTORS = 1500
+SEED = 42
+
+GROUP_COMMIT_ENV = 'GROUP_COMMIT'
+GROUP_COMMIT_MAX_DELAY = 0.002
+GROUP_COMMIT_MAX_BATCH = 64
+GROUP_COMMIT_TIMEOUT = 5
+
+REPLICAS_ENV = 'PG_REPLICAS'
+REPLICA_STICKY_SECONDS = 5
+REPLICA_MAX_LAG = 5
+REPLICA_HEALTH_INTERVAL = 2
+REPLICA_HEALTH_TIMEOUT = 1
+SESSION_COOKIE = 'moviehub_session'
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 16
+POOL_TIMEOUT = 5
+
+CATALOG_CACHE_ENV = 'CATALOG_CACHE'
+CATALOG_CACHE_MAX_ENTRIES = 10000
+CATALOG_CHANNEL = 'catalog_changes'
+LISTEN_MIN_BACKOFF = 0.5
+LISTEN_MAX_BACKOFF = 30
+WARMUP_MIN_BACKOFF = 0.5
+WARMUP_MAX_BACKOFF = 30
+
+CHANGES_DEFAULT_LIMIT = 100
+CHANGES_MAX_LIMIT = 1000
+# Seconds between runs numbering committed changes of movies when no change is notified, and the longest a client that
+# wrote recently waits for a run before reading the catalog.
+CHANGE_SEQUENCE_INTERVAL = 1
+
+SIMILAR_DEFAULT_LIMIT = 10
+SIMILAR_MAX_LIMIT = 100
+SIMILAR_GENRE_WEIGHT = 1.0
+SIMILAR_CAST_WEIGHT = 2.0
+SIMILAR_YEAR_WEIGHT = 0.5
+SIMILAR_YEAR_SCALE = 10
+CAST_PAGE_SIZE = 50000
+
+AUTOCOMPLETE_DEFAULT_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+TOP_DEFAULT_LIMIT = 10
+TOP_MAX_LIMIT = 100
+
+ADMISSION_LIMITS = {'read': (32, 64), 'write': (8, 32), 'external': (8, 8)}
+ADMISSION_QUEUE_TIMEOUT = 0.5
+MAX_CONNECTIONS = 256
+RETRY_AFTER = 1
+WRITE_RATE = 20
+WRITE_BURST = 40
+RATE_LIMIT_MAX_KEYS = 10000
+# Statement and lock timeouts of the queries of each route class, in milliseconds.
+QUERY_TIMEOUTS = {'read': (2000, 1000), 'write': (5000, 1000), 'external': (5000, 1000)}
+DISCONNECT_POLL_INTERVAL = 0.1
+
+POSTER_CACHE_DIR = 'poster_cache'
+POSTER_CACHE_MAX_BYTES = 268435456
+POSTER_MAX_BYTES = 10485760
+POSTER_WIDTHS = (92, 154, 185, 342, 500, 780)
+POSTER_QUALITY = 85
+POSTER_MAX_AGE = 7 * 24 * 60 * 60
+# Comma-separated hosts posters are fetched from, as OMDB links them; other hosts, e.g. internal ones, are not fetched.
+POSTER_HOSTS = 'm.media-amazon.com,ia.media-imdb.com,img.omdbapi.com'
+
+SERVER_TIMING_PHASES = ('auth', 'db', 'render', 'upstream', 'write')
+TRACE_FILE = 'traces.jsonl'
+TRACE_SAMPLE_RATE = 0.01
+TRACE_SLOW_SECONDS = 0.5
+# Traces sampled by the client's traceparent exported per second, with bursts; beyond, they are drawn like others.
+TRACE_FORCED_RATE = 5
+TRACE_FORCED_BURST = 20
+# Traces waiting to be written; traces finished while it is full are dropped.
+TRACE_QUEUE_SIZE = 1000
+
 MOVIE_KEYS = ('title', 'description', 'genre', 'year', 'poster', 'trailer')
 MOVIE_REQUIRED_KEYS = set(MOVIE_KEYS)
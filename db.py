@@ -1,33 +1,56 @@
 """A module providing utility functions for interacting with a PostgreSQL database."""
 
+import functools
 import os
+from typing import Iterable
 from uuid import UUID, uuid4
 
 import dotenv
 import psycopg
 
 import query
+from group_commit import GroupCommitter, WriteResult
 
 DEFAULT_PG_PORT = 5555
 
 
-def connect() -> tuple[psycopg.Connection, psycopg.Cursor]:
+@functools.cache
+def load_env() -> None:
+    """Load the variables of .env into the environment, once per process."""
+    dotenv.load_dotenv()
+
+
+def credentials(address: str | None = None) -> dict:
     """
-    Establish a connection to the PostgreSQL database and returns a cursor object.
+    Build the connection parameters of the primary database or of a replica sharing its credentials.
+
+    Parameters:
+        address: The host:port of a replica; the primary from PG_HOST and PG_PORT if None.
 
     Returns:
-        A tuple containing a psycopg.Connection object and a psycopg.Cursor object.
+        A dictionary of keyword arguments for psycopg.connect.
     """
-    dotenv.load_dotenv()
-    port = os.environ.get('PG_PORT')
-    credentials = {
-        'host': os.environ.get('PG_HOST', default='127.0.0.1'),
+    host, _, port = address.partition(':') if address else (
+        os.environ.get('PG_HOST', default='127.0.0.1'), None, os.environ.get('PG_PORT', default=''),
+    )
+    return {
+        'host': host,
         'port': int(port) if port.isdigit() else DEFAULT_PG_PORT,
         'dbname': os.environ.get('PG_DBNAME', default='test'),
         'user': os.environ.get('PG_USER', default='test'),
         'password': os.environ.get('PG_PASSWORD'),
     }
-    connection = psycopg.connect(**credentials)
+
+
+def connect() -> tuple[psycopg.Connection, psycopg.Cursor]:
+    """
+    Establish a connection to the PostgreSQL database and returns a cursor object.
+
+    Returns:
+        A tuple containing a psycopg.Connection object and a psycopg.Cursor object.
+    """
+    load_env()
+    connection = psycopg.connect(**credentials())
     cursor = connection.cursor()
     return connection, cursor
 
@@ -60,6 +83,129 @@ def get_actors(cursor: psycopg.Cursor) -> list[tuple]:
     return cursor.fetchall()
 
 
+def get_actors_by_ids(cursor: psycopg.Cursor, actor_ids: list[UUID]) -> list[tuple]:
+    """
+    Fetch the actors with the given ids from the database; deleted actors are missing.
+
+    Parameters:
+        cursor: The database cursor object to execute the query.
+        actor_ids: The ids of the actors.
+
+    Returns:
+        A list of (full_name, birth_date, id) tuples.
+    """
+    cursor.execute(query.GET_ACTORS_BY_IDS, params=(actor_ids,))
+    return cursor.fetchall()
+
+
+def get_catalog(cursor: psycopg.Cursor) -> tuple[int, list[tuple], list[tuple]]:
+    """
+    Fetch all movies and actors from a single snapshot, with the last change of the change feed it includes.
+
+    Parameters:
+        cursor: The database cursor object to execute the queries.
+
+    Returns:
+        The last change sequence number, (id, title, description, genre, year, trailer, poster) movie tuples
+        and (full_name, birth_date, id) actor tuples.
+    """
+    with cursor.connection.transaction():
+        cursor.execute(query.SET_REPEATABLE_READ)
+        last_change = cursor.execute(query.GET_LAST_CHANGE).fetchone()[0]
+        movies = cursor.execute(query.GET_CATALOG_MOVIES).fetchall()
+        return last_change, movies, get_actors(cursor)
+
+
+def get_movie_cast(cursor: psycopg.Cursor, movie_id: UUID) -> list[tuple]:
+    """
+    Fetch the actors playing in a movie through the movie_actor primary key.
+
+    Parameters:
+        cursor: The database cursor object to execute the query.
+        movie_id: The unique identifier of the movie.
+
+    Returns:
+        A list of (full_name, birth_date, id) tuples of the actors.
+    """
+    cursor.execute(query.GET_MOVIE_CAST, params=(movie_id,))
+    return cursor.fetchall()
+
+
+def get_actor_movies(cursor: psycopg.Cursor, actor_id: UUID) -> list[tuple]:
+    """
+    Fetch the filmography of an actor through the movie_actor (actor_id, movie_id) index.
+
+    Parameters:
+        cursor: The database cursor object to execute the query.
+        actor_id: The unique identifier of the actor.
+
+    Returns:
+        A list of (title, year, genre, id) tuples of the movies, newest first.
+    """
+    cursor.execute(query.GET_ACTOR_MOVIES, params=(actor_id,))
+    return cursor.fetchall()
+
+
+def get_movie_changes(cursor: psycopg.Cursor, since: int, limit: int) -> list[tuple]:
+    """
+    Fetch the latest change of each movie changed after a sequence number, deleted movies included.
+
+    Parameters:
+        cursor: The database cursor object to execute the query.
+        since: The sequence number of the last change already seen.
+        limit: The maximum number of changes to fetch.
+
+    Returns:
+        A list of (seq, id, deleted, title, description, genre, year, trailer, poster) tuples ordered by seq;
+        the movie attributes are None for deleted movies.
+    """
+    cursor.execute(query.GET_MOVIE_CHANGES, params=(since, limit))
+    return cursor.fetchall()
+
+
+def sequence_movie_changes(cursor: psycopg.Cursor, conn: psycopg.Connection) -> None:
+    """
+    Assign sequence numbers to the changes of movies committed since the last run, adding them to the change feed.
+
+    Parameters:
+        cursor: The database cursor object to execute the query.
+        conn: The database connection object to commit the transaction.
+    """
+    cursor.execute(query.SEQUENCE_MOVIE_CHANGES)
+    conn.commit()
+
+
+def get_cast_links(cursor: psycopg.Cursor, after: tuple[UUID, UUID], limit: int) -> list[tuple]:
+    """
+    Fetch a page of the links between movies and their actors, in primary key order.
+
+    Parameters:
+        cursor: The database cursor object to execute the query.
+        after: The (movie_id, actor_id) key of the last link already fetched.
+        limit: The maximum number of links to fetch.
+
+    Returns:
+        A list of (movie_id, actor_id) tuples.
+    """
+    cursor.execute(query.GET_CAST_LINKS, params=(*after, limit))
+    return cursor.fetchall()
+
+
+def get_movies_cast_links(cursor: psycopg.Cursor, movie_ids: list[UUID]) -> list[tuple]:
+    """
+    Fetch the links between the given movies and their actors.
+
+    Parameters:
+        cursor: The database cursor object to execute the query.
+        movie_ids: The unique identifiers of the movies.
+
+    Returns:
+        A list of (movie_id, actor_id) tuples.
+    """
+    cursor.execute(query.GET_MOVIES_CAST_LINKS, params=(movie_ids,))
+    return cursor.fetchall()
+
+
 def get_movies_id(cursor: psycopg.Cursor) -> list[str]:
     """
     Fetch movie IDs from the database.
@@ -89,6 +235,45 @@ def get_coords_by_movie(cursor: psycopg.Cursor, title: str) -> tuple:
     return cursor.fetchone()
 
 
+def execute_write(
+    cursor: psycopg.Cursor, conn: psycopg.Connection,
+    db_query: str, query_params: tuple,
+) -> WriteResult:
+    """
+    Execute a write query and commit it, either on its own or as part of a group commit batch.
+
+    Parameters:
+        cursor: The database cursor object to execute the query.
+        conn: The database connection object to commit the transaction.
+        db_query: The SQL query string to be executed.
+        query_params: A tuple of parameters to be passed to the query.
+
+    Returns:
+        The affected row count and the first row returned by the query, if any.
+    """
+    committer = GroupCommitter.active
+    if committer is not None:
+        return committer.submit(db_query, query_params)
+    cursor.execute(db_query, params=query_params)
+    row = cursor.fetchone() if cursor.description else None
+    conn.commit()
+    return WriteResult(cursor.rowcount, row)
+
+
+def copy_rows(cursor: psycopg.Cursor, copy_query: str, rows: Iterable[tuple]) -> None:
+    """
+    Load rows into a table with COPY without committing the transaction.
+
+    Parameters:
+        cursor: The database cursor object to run COPY with.
+        copy_query: The COPY ... FROM STDIN statement.
+        rows: The rows to be loaded.
+    """
+    with cursor.copy(copy_query) as copy:
+        for row in rows:
+            copy.write_row(row)
+
+
 def change_db(
     cursor: psycopg.Cursor, conn: psycopg.Connection,
     db_query: str, query_params: tuple,
@@ -105,9 +290,7 @@ def change_db(
     Returns:
         True if the query execution was successful, False otherwise.
     """
-    cursor.execute(db_query, params=query_params)
-    conn.commit()
-    return bool(cursor.rowcount)
+    return bool(execute_write(cursor, conn, db_query, query_params).rowcount)
 
 
 def add_movie(
@@ -137,6 +320,42 @@ def add_movie(
     return False
 
 
+def upsert_movie(
+    cursor: psycopg.Cursor, conn: psycopg.Connection,
+    movie: dict, movie_id: UUID | None = None,
+) -> tuple[UUID, bool]:
+    """
+    Insert a movie or replace all attributes of the existing one in a single statement.
+
+    Parameters:
+        cursor: The database cursor object to execute the upsert query.
+        conn: The database connection object to commit the transaction.
+        movie: A dictionary with all the attributes of the movie.
+        movie_id: The unique identifier of the movie; without it the movie is matched by title.
+
+    Returns:
+        The id of the movie and True if it was created, False if it was updated.
+
+    Raises:
+        psycopg.errors.UniqueViolation: If another movie already has the title.
+    """
+    conflict = 'id' if movie_id else 'title'
+    upsert_query = query.UPSERT_MOVIE.format(conflict=conflict)
+    query_params = (
+        movie_id or uuid4(), movie['title'], movie['description'], movie['genre'],
+        movie['year'], movie['trailer'], movie['poster'],
+    )
+    try:
+        return execute_write(cursor, conn, upsert_query, query_params).row
+    except psycopg.errors.UniqueViolation:
+        if movie_id is None:
+            raise
+    # A concurrent PUT of the same new movie can hit the title index before the id arbiter index;
+    # its row is committed by now, so the retry updates it or reports a genuine title conflict.
+    conn.rollback()
+    return execute_write(cursor, conn, upsert_query, query_params).row
+
+
 def delete_movie(
     cursor: psycopg.Cursor, conn: psycopg.Connection,
     movie_id: UUID,
@@ -155,6 +374,25 @@ def delete_movie(
     return change_db(cursor, conn, query.DELETE_MOVIE, (movie_id,))
 
 
+def set_movie_rating(
+    cursor: psycopg.Cursor, conn: psycopg.Connection,
+    movie_id: UUID, movie_rating: tuple,
+) -> bool:
+    """
+    Store the ratings of a movie; unchanged ratings leave the row untouched, so no change is notified.
+
+    Parameters:
+        cursor: The database cursor object to execute the update query.
+        conn: The database connection object to commit the transaction.
+        movie_id: The unique identifier of the movie.
+        movie_rating: The IMDb rating, IMDb votes, Rotten Tomatoes and Metacritic scores, None where unknown.
+
+    Returns:
+        True if the ratings changed, False otherwise.
+    """
+    return change_db(cursor, conn, query.SET_MOVIE_RATING, (*movie_rating, movie_id, *movie_rating))
+
+
 def update_params(new_attrs: list) -> str:
     """
     Construct a string of parameter placeholders for a SQL query based on the provided attributes.
@@ -190,36 +428,33 @@ def update_movie(
         values_params.append(new_value)
     values_params.append(movie_id)
     query_update = query.UPDATE_MOVIE.format(params=update_params(query_params))
-    cursor.execute(query_update, params=values_params)
-    conn.commit()
-    return bool(cursor.rowcount)
+    return change_db(cursor, conn, query_update, tuple(values_params))
 
 
-def check_token(cursor: psycopg.Cursor, token: str) -> bool:
+def check_connection(cursor: psycopg.Cursor) -> bool:
     """
-    Check if a given token exists in the database.
+    Check that the database answers queries.
 
     Parameters:
         cursor: The database cursor object to execute the query.
-        token: The token to be checked.
 
     Returns:
-        True if the token exists, False otherwise.
+        True once the database answered.
     """
-    cursor.execute(query.CHECK_TOKEN, params=(token,))
+    cursor.execute(query.CHECK_CONNECTION)
     return bool(cursor.fetchone()[0])
 
 
-def check_movie(cursor: psycopg.Cursor, movie: str) -> bool:
+def check_token(cursor: psycopg.Cursor, token: str) -> bool:
     """
-    Check if a given movie title exists in the database.
+    Check if a given token exists in the database.
 
     Parameters:
         cursor: The database cursor object to execute the query.
-        movie: The title of the movie to be checked.
+        token: The token to be checked.
 
     Returns:
-        True if the movie exists, False otherwise.
+        True if the token exists, False otherwise.
     """
-    cursor.execute(query.CHECK_TOKEN, params=(movie,))
+    cursor.execute(query.CHECK_TOKEN, params=(token,))
     return bool(cursor.fetchone()[0])
@@ -0,0 +1,218 @@
+"""A module batching write statements from concurrent requests into shared transactions."""
+
+import queue
+import threading
+import time
+from typing import Callable, ClassVar, NamedTuple, Optional
+
+import psycopg
+
+# States of a pending write, changed under the lock of the committer: it is taken into a batch,
+# or abandoned by its caller before that.
+QUEUED = 'queued'
+TAKEN = 'taken'
+ABANDONED = 'abandoned'
+
+
+class CommitTimeout(psycopg.OperationalError):
+    """A write statement gave up waiting for its batch to be committed."""
+
+
+class WriteResult(NamedTuple):
+    """Outcome of a single write statement: affected rows and the returned row, if any."""
+
+    rowcount: int
+    row: Optional[tuple]
+
+
+class PendingWrite:
+    """A write statement waiting in the queue for its batch to be committed."""
+
+    __slots__ = ('db_query', 'query_params', 'done', 'outcome', 'error', 'state')
+
+    def __init__(self, db_query: str, query_params: tuple) -> None:
+        """
+        Initialize the pending write with the statement to execute.
+
+        Args:
+            db_query (str): The SQL query string to be executed.
+            query_params (tuple): Parameters to be passed to the query.
+        """
+        self.db_query = db_query
+        self.query_params = query_params
+        self.done = threading.Event()
+        self.outcome: Optional[WriteResult] = None
+        self.error: Optional[Exception] = None
+        self.state = QUEUED
+
+
+class GroupCommitter:
+    """
+    Commit write statements of concurrent requests together in short batches.
+
+    A batch is first sent as a single pipelined transaction. If any statement fails, the batch is
+    replayed with a savepoint per statement, so a failing statement (e.g. UniqueViolation)
+    is reported to its caller only and does not abort the rest of the batch. If the batch fails as a whole,
+    e.g. on a lost connection, all its statements fail and the connection is reopened for the next batch.
+    """
+
+    active: ClassVar[Optional['GroupCommitter']] = None
+
+    def __init__(
+        self, connect: Callable[[], psycopg.Connection], max_delay: float, max_batch: int, timeout: float,
+    ) -> None:
+        """
+        Initialize the committer on a dedicated connection.
+
+        Args:
+            connect (Callable[[], psycopg.Connection]): Function opening the connection of the committer thread.
+            max_delay (float): Maximum time in seconds a statement waits for its batch to fill.
+            max_batch (int): Maximum number of statements committed in one transaction.
+            timeout (float): Seconds a statement waits to be taken into a batch; a taken one waits for its batch.
+        """
+        self._connect = connect
+        self._connection: Optional[psycopg.Connection] = None
+        self._cursor: Optional[psycopg.Cursor] = None
+        self._max_delay = max_delay
+        self._max_batch = max_batch
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+
+    def start(self) -> 'GroupCommitter':
+        """
+        Start the committer thread and route db write helpers through it.
+
+        Returns:
+            GroupCommitter: The started committer.
+        """
+        self._thread.start()
+        GroupCommitter.active = self
+        return self
+
+    def stop(self) -> None:
+        """Commit the remaining queued statements, stop the committer thread and close its connection."""
+        if GroupCommitter.active is self:
+            GroupCommitter.active = None
+        self._queue.put(None)
+        self._thread.join()
+        self._close()
+
+    def submit(self, db_query: str, query_params: tuple) -> WriteResult:
+        """
+        Queue a write statement and wait until its batch is committed.
+
+        A statement taken into a batch may commit, so its caller waits for the outcome rather than giving up:
+        only statements that never ran are reported as retryable timeouts.
+
+        Args:
+            db_query (str): The SQL query string to be executed.
+            query_params (tuple): Parameters to be passed to the query.
+
+        Returns:
+            WriteResult: Affected row count and the first returned row of the statement.
+
+        Raises:
+            CommitTimeout: If the statement is not taken into a batch in time, so it was never executed.
+            error: The psycopg error of the statement or of the commit of its batch.
+        """
+        pending = PendingWrite(db_query, query_params)
+        self._queue.put(pending)
+        if not pending.done.wait(self._timeout):
+            with self._lock:
+                if pending.state == QUEUED:
+                    pending.state = ABANDONED
+            if pending.state == ABANDONED:
+                raise CommitTimeout(f'write not taken into a batch within {self._timeout} s')
+            pending.done.wait()
+        error = pending.error
+        if error is not None:
+            raise error
+        return pending.outcome
+
+    def _collect(self) -> list[Optional[PendingWrite]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._max_delay
+        while batch[-1] is not None and len(batch) < self._max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        stopped = False
+        while not stopped:
+            batch = self._collect()
+            stopped = batch[-1] is None
+            with self._lock:
+                pending_writes = [pending for pending in batch if pending is not None and pending.state == QUEUED]
+                for taken in pending_writes:
+                    taken.state = TAKEN
+            if pending_writes:
+                self._commit(pending_writes)
+
+    def _commit(self, batch: list[PendingWrite]) -> None:
+        # Any failure of the batch as a whole fails all its statements, which must not leave the thread.
+        try:
+            self._commit_batch(batch)
+        except Exception as error:
+            for failed in batch:
+                failed.outcome = None
+                failed.error = failed.error or error
+            self._close()
+        for committed in batch:
+            committed.done.set()
+
+    def _commit_batch(self, batch: list[PendingWrite]) -> None:
+        if self._connection is None:
+            self._connection = self._connect()
+            self._connection.autocommit = True
+            self._cursor = self._connection.cursor()
+        try:
+            self._commit_pipelined(batch)
+        except psycopg.Error:
+            self._commit_isolated(batch)
+        if self._connection.broken:
+            self._close()
+
+    def _close(self) -> None:
+        # The connection is reopened for the next batch.
+        if self._connection is not None:
+            self._connection.close()
+        self._connection = None
+
+    def _commit_pipelined(self, batch: list[PendingWrite]) -> None:
+        cursors = [self._connection.cursor() for _ in batch]
+        with self._connection.pipeline():
+            with self._connection.transaction():
+                for pending, cursor in zip(batch, cursors):
+                    cursor.execute(pending.db_query, params=pending.query_params)
+        for executed, result_cursor in zip(batch, cursors):
+            row = result_cursor.fetchone() if result_cursor.description else None
+            executed.outcome = WriteResult(result_cursor.rowcount, row)
+
+    def _commit_isolated(self, batch: list[PendingWrite]) -> None:
+        try:
+            with self._connection.transaction():
+                for pending in batch:
+                    self._execute(pending)
+        except psycopg.Error as error:
+            for failed in batch:
+                failed.outcome = None
+                failed.error = failed.error or error
+
+    def _execute(self, pending: PendingWrite) -> None:
+        try:
+            with self._connection.transaction():
+                self._cursor.execute(pending.db_query, params=pending.query_params)
+                row = self._cursor.fetchone() if self._cursor.description else None
+        except psycopg.Error as error:
+            pending.outcome = None
+            pending.error = error
+            return
+        pending.outcome = WriteResult(self._cursor.rowcount, row)
@@ -0,0 +1,229 @@
+"""A module keeping local caches of catalog data fresh with change events published by Postgres triggers."""
+
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Callable, Hashable, Iterable, Optional
+
+import psycopg
+
+import config
+
+MISSING = object()
+Invalidate = Callable[[Optional[str], Optional[frozenset[str]]], None]
+# A cached value with its tags, and a change with the time it is due to be replayed.
+Entry = tuple[object, tuple[str, ...]]
+Replay = tuple[float, Optional[str], Optional[frozenset[str]]]
+
+# Tables whose rows are tagged in the cache, by the changed table.
+TAGGED_TABLES = MappingProxyType({'movie': ('movie',), 'actor': ('actor',), 'movie_actor': ('movie', 'actor')})
+
+
+class TagCache:
+    """
+    Cache of query results tagged with the tables and rows they were built from.
+
+    Tags are table names, e.g. 'movie', for results depending on a whole table,
+    and table:id, e.g. 'movie:<uuid>', for results depending on single rows.
+    The least recently used results are evicted beyond the maximum number of entries. Empty results, e.g. of
+    unknown ids, are not cached: they are cheap to load again and would let lookups of random ids fill the cache.
+    """
+
+    def __init__(self, max_entries: int = config.CATALOG_CACHE_MAX_ENTRIES) -> None:
+        """
+        Initialize an empty cache.
+
+        Args:
+            max_entries (int): The maximum number of cached results.
+        """
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, Entry] = OrderedDict()
+        self._keys_by_tag: dict[str, set[Hashable]] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get_or_load(
+        self, key: Hashable, load: Callable[[], object],
+        tags_of: Callable[[object], Iterable[str]],
+    ) -> object:
+        """
+        Return the cached value of the key, loading and caching it on a miss.
+
+        A value is not cached if an invalidation happened while it was loading, as it may be stale already.
+
+        Args:
+            key (Hashable): Key of the value.
+            load (Callable[[], object]): Function loading the value.
+            tags_of (Callable[[object], Iterable[str]]): Function returning the tags of a loaded value.
+
+        Returns:
+            object: The cached or loaded value.
+        """
+        with self._lock:
+            cached = self._entries.get(key, MISSING)
+            if cached is not MISSING:
+                self._entries.move_to_end(key)
+                return cached[0]
+            generation = self._generation
+        loaded = load()
+        if not loaded:
+            return loaded
+        tags = tuple(tags_of(loaded))
+        with self._lock:
+            if generation == self._generation:
+                self._drop(key)
+                self._entries[key] = (loaded, tags)
+                for tag in tags:
+                    self._keys_by_tag.setdefault(tag, set()).add(key)
+                while len(self._entries) > self.max_entries:
+                    self._drop(next(iter(self._entries)))
+        return loaded
+
+    def invalidate(self, table: Optional[str], tags: Optional[frozenset[str]]) -> None:
+        """
+        Drop the values built from changed rows, or from any row of the table if the rows are unknown.
+
+        Args:
+            table (Optional[str]): The changed table; every value is dropped if None.
+            tags (Optional[frozenset[str]]): Tags of the changed rows; None if too many rows changed.
+        """
+        with self._lock:
+            self._generation += 1
+            if table is None:
+                self._entries.clear()
+                self._keys_by_tag.clear()
+                return
+            stale_tags = {table}
+            if tags is None:
+                prefixes = tuple(f'{tagged}:' for tagged in TAGGED_TABLES.get(table, ()))
+                stale_tags.update(tag for tag in self._keys_by_tag if tag.startswith(prefixes))
+            else:
+                stale_tags.update(tags)
+            for tag in stale_tags:
+                for key in tuple(self._keys_by_tag.get(tag, ())):
+                    self._drop(key)
+
+    def __len__(self) -> int:
+        """
+        Count the cached values.
+
+        Returns:
+            int: Number of cached values.
+        """
+        return len(self._entries)
+
+    def _drop(self, key: Hashable) -> None:
+        # The key is removed from the keys of all its tags, and tags left without keys are removed.
+        _, tags = self._entries.pop(key, (None, ()))
+        for tag in tags:
+            keys = self._keys_by_tag[tag]
+            keys.discard(key)
+            if not keys:
+                self._keys_by_tag.pop(tag)
+
+
+class ChangeListener:
+    """Listen to catalog change notifications on a dedicated connection and pass them to subscribers."""
+
+    def __init__(self, credentials: dict, replay_delay: float = 0) -> None:
+        """
+        Initialize the listener.
+
+        Values reloaded from a lagging replica right after a change are dropped when the change is replayed.
+
+        Args:
+            credentials (dict): Keyword arguments of psycopg.connect for the primary database.
+            replay_delay (float): Seconds after which each change is delivered again for replica lag; 0 disables.
+        """
+        self._credentials = credentials
+        self._replay_delay = replay_delay
+        self._replays: queue.Queue[Replay] = queue.Queue()
+        self._subscribers: list[Invalidate] = []
+        self._backoff = config.LISTEN_MIN_BACKOFF
+
+    def subscribe(self, invalidate: Invalidate) -> 'ChangeListener':
+        """
+        Register a function called with the changed table and the tags of the changed rows.
+
+        The table is None when notifications may have been lost, so everything should be invalidated.
+
+        Args:
+            invalidate (Invalidate): The function to call on each change.
+
+        Returns:
+            ChangeListener: The listener itself.
+        """
+        self._subscribers.append(invalidate)
+        return self
+
+    def start(self) -> 'ChangeListener':
+        """
+        Listen in a background thread, and replay changes in another one if a replay delay is set.
+
+        Returns:
+            ChangeListener: The listener itself.
+        """
+        threading.Thread(target=self._run, name='catalog-listener', daemon=True).start()
+        if self._replay_delay:
+            threading.Thread(target=self._replay, name='catalog-replay', daemon=True).start()
+        return self
+
+    def publish(self, table: Optional[str], tags: Optional[frozenset[str]]) -> None:
+        """
+        Deliver a change to all subscribers, and once more after the replay delay.
+
+        Args:
+            table (Optional[str]): The changed table; None to invalidate everything.
+            tags (Optional[frozenset[str]]): Tags of the changed rows; None if unknown.
+        """
+        self._deliver(table, tags)
+        if self._replay_delay:
+            self._replays.put((time.monotonic() + self._replay_delay, table, tags))
+
+    def _deliver(self, table: Optional[str], tags: Optional[frozenset[str]]) -> None:
+        for invalidate in self._subscribers:
+            invalidate(table, tags)
+
+    def _replay(self) -> None:
+        # Changes are queued with the same delay, so they are due in the order they are queued.
+        for due, table, tags in iter(self._replays.get, None):
+            time.sleep(max(due - time.monotonic(), 0))
+            self._deliver(table, tags)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self._listen()
+            except psycopg.OperationalError as error:
+                print(f'catalog listener disconnected: {error}')
+            # Notifications sent while disconnected are lost, so nothing cached can be trusted.
+            self.publish(None, None)
+            time.sleep(self._backoff)
+            self._backoff = min(self._backoff * 2, config.LISTEN_MAX_BACKOFF)
+
+    def _listen(self) -> None:
+        with psycopg.connect(**self._credentials, autocommit=True) as connection:
+            connection.execute(f'listen {config.CATALOG_CHANNEL}')
+            self._backoff = config.LISTEN_MIN_BACKOFF
+            self.publish(None, None)
+            for notification in connection.notifies():
+                change = json.loads(notification.payload)
+                tags = change['tags']
+                self.publish(change['table'], None if tags is None else frozenset(tags))
+
+
+def tag_rows(table: str, row_ids: Iterable[object]) -> set[str]:
+    """
+    Build the tags of rows of a table.
+
+    Args:
+        table (str): Name of the table.
+        row_ids (Iterable[object]): Ids of the rows.
+
+    Returns:
+        set[str]: The tags of the rows.
+    """
+    return {f'{table}:{row_id}' for row_id in row_ids}
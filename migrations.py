@@ -0,0 +1,209 @@
+"""Idempotent schema migrations bringing databases created by older versions up to the current models."""
+
+import psycopg
+
+import db
+
+MOVIE_ACTOR = """
+do $$
+begin
+    create table if not exists movie_actor (
+        movie_id uuid not null references movie (id) on delete cascade,
+        actor_id uuid not null references actor (id) on delete cascade,
+        primary key (movie_id, actor_id)
+    );
+    create index if not exists ix_movie_actor_actor_movie on movie_actor (actor_id, movie_id);
+
+    if exists (
+        select 1 from information_schema.columns
+        where table_schema = current_schema() and table_name = 'actor' and column_name = 'movie_id'
+    ) then
+        create temporary table actor_canonical on commit drop as
+            select id, movie_id,
+                first_value(id) over (partition by full_name, birth_date order by id) as canonical_id
+            from actor;
+        insert into movie_actor (movie_id, actor_id)
+            select movie_id, canonical_id from actor_canonical where movie_id is not null
+            on conflict do nothing;
+        delete from actor using actor_canonical
+            where actor.id = actor_canonical.id and actor_canonical.id <> actor_canonical.canonical_id;
+        alter table actor drop column movie_id;
+    end if;
+
+    if not exists (select 1 from pg_constraint where conname = 'actor_identity_unique') then
+        alter table actor add constraint actor_identity_unique unique (full_name, birth_date);
+    end if;
+end
+$$
+"""
+
+CATALOG_NOTIFY = """
+create or replace function catalog_tags(table_name text, changed_row jsonb) returns setof text
+language sql immutable as $body$
+    select table_name || ':' || (changed_row ->> 'id') where table_name in ('movie', 'actor')
+    union all
+    select 'movie:' || (changed_row ->> 'movie_id') where table_name = 'movie_actor'
+    union all
+    select 'actor:' || (changed_row ->> 'actor_id') where table_name = 'movie_actor'
+$body$;
+
+create or replace function notify_catalog_change() returns trigger
+language plpgsql as $body$
+declare
+    changed_rows jsonb[];
+    tags jsonb;
+begin
+    if TG_OP = 'INSERT' then
+        changed_rows := array(select to_jsonb(new_row) from new_rows new_row limit 65);
+    elsif TG_OP = 'DELETE' then
+        changed_rows := array(select to_jsonb(old_row) from old_rows old_row limit 65);
+    elsif TG_OP = 'UPDATE' then
+        changed_rows := array(select to_jsonb(old_row) from old_rows old_row limit 33)
+            || array(select to_jsonb(new_row) from new_rows new_row limit 33);
+    end if;
+    if TG_OP <> 'TRUNCATE' and cardinality(changed_rows) = 0 then
+        return null;
+    end if;
+    if TG_OP <> 'TRUNCATE' and cardinality(changed_rows) <= 64 then
+        select jsonb_agg(distinct tag) into tags
+            from unnest(changed_rows) changed_row, catalog_tags(TG_TABLE_NAME, changed_row) tag;
+    end if;
+    perform pg_notify('catalog_changes', jsonb_build_object('table', TG_TABLE_NAME, 'tags', tags)::text);
+    return null;
+end
+$body$;
+
+do $$
+declare
+    table_name text;
+begin
+    foreach table_name in array array['movie', 'actor', 'movie_actor'] loop
+        execute format(
+            'create or replace trigger %1$s_notify_insert after insert on %1$I '
+            'referencing new table as new_rows for each statement execute function notify_catalog_change()',
+            table_name);
+        execute format(
+            'create or replace trigger %1$s_notify_update after update on %1$I '
+            'referencing old table as old_rows new table as new_rows '
+            'for each statement execute function notify_catalog_change()',
+            table_name);
+        execute format(
+            'create or replace trigger %1$s_notify_delete after delete on %1$I '
+            'referencing old table as old_rows for each statement execute function notify_catalog_change()',
+            table_name);
+        execute format(
+            'create or replace trigger %1$s_notify_truncate after truncate on %1$I '
+            'for each statement execute function notify_catalog_change()',
+            table_name);
+    end loop;
+end
+$$
+"""
+
+MOVIE_CHANGE = """
+create sequence if not exists movie_change_seq;
+
+create table if not exists movie_change (
+    movie_id uuid primary key,
+    seq bigint unique,
+    deleted boolean not null default false
+);
+
+insert into movie_change (movie_id, seq, deleted)
+    select id, nextval('movie_change_seq'), false from movie
+    where not exists (select 1 from movie_change where movie_change.movie_id = movie.id)
+    order by id;
+
+-- Changes are numbered after they commit, by sequence_movie_changes run in the background, so writers never wait
+-- on each other;
+-- older versions numbered them on write, serializing writers.
+alter table movie_change alter column seq drop not null, alter column seq drop default;
+create index if not exists ix_movie_change_unsequenced on movie_change (movie_id) where seq is null;
+
+create or replace function record_movie_change() returns trigger
+language plpgsql as $body$
+begin
+    if TG_OP = 'TRUNCATE' then
+        update movie_change set seq = null, deleted = true where not deleted;
+    elsif TG_OP = 'DELETE' then
+        insert into movie_change (movie_id, seq, deleted)
+            select id, null, true from old_rows
+            on conflict (movie_id) do update set seq = null, deleted = true;
+    else
+        if TG_OP = 'UPDATE' then
+            insert into movie_change (movie_id, seq, deleted)
+                select id, null, true from old_rows
+                where id not in (select id from new_rows)
+                on conflict (movie_id) do update set seq = null, deleted = true;
+        end if;
+        insert into movie_change (movie_id, seq, deleted)
+            select id, null, false from new_rows
+            on conflict (movie_id) do update set seq = null, deleted = false;
+    end if;
+    return null;
+end
+$body$;
+
+create or replace function sequence_movie_changes() returns void
+language plpgsql as $body$
+begin
+    -- Runs take turns and each numbers, in its own transaction, the changes committed before it started, so
+    -- numbers become visible in increasing order and a consumer reading past a number never misses a change
+    -- numbered later with a lower one. A change committed during a run is numbered by the next one, and a run
+    -- that numbered changes notifies followers of the feed on commit.
+    if exists (select 1 from movie_change where seq is null) then
+        perform pg_advisory_xact_lock(hashtext('movie_change'));
+        update movie_change set seq = nextval('movie_change_seq') where seq is null;
+        if found then
+            perform pg_notify('catalog_changes', jsonb_build_object('table', 'movie_change', 'tags', null)::text);
+        end if;
+    end if;
+end
+$body$;
+
+create or replace trigger movie_change_insert after insert on movie
+    referencing new table as new_rows for each statement execute function record_movie_change();
+create or replace trigger movie_change_update after update on movie
+    referencing old table as old_rows new table as new_rows for each statement execute function record_movie_change();
+create or replace trigger movie_change_delete after delete on movie
+    referencing old table as old_rows for each statement execute function record_movie_change();
+create or replace trigger movie_change_truncate after truncate on movie
+    for each statement execute function record_movie_change();
+"""
+
+MOVIE_RATING = """
+alter table movie
+    add column if not exists imdb_rating numeric(3, 1),
+    add column if not exists imdb_votes integer,
+    add column if not exists rotten_tomatoes smallint,
+    add column if not exists metacritic smallint;
+
+create index if not exists ix_movie_rating on movie (imdb_rating desc nulls last, imdb_votes desc nulls last);
+"""
+
+MIGRATIONS = (
+    ('movie_actor', MOVIE_ACTOR),
+    ('catalog_notify', CATALOG_NOTIFY),
+    ('movie_change', MOVIE_CHANGE),
+    ('movie_rating', MOVIE_RATING),
+)
+
+
+def migrate(connection: psycopg.Connection) -> None:
+    """
+    Apply all migrations in a single transaction; already applied steps are no-ops.
+
+    Args:
+        connection (psycopg.Connection): Connection to the database to migrate.
+    """
+    with connection.transaction():
+        for _, migration in MIGRATIONS:
+            connection.execute(migration)
+
+
+if __name__ == '__main__':
+    connection, _ = db.connect()
+    migrate(connection)
+    connection.commit()
+    names = ', '.join(name for name, _ in MIGRATIONS)
+    print(f'applied migrations: {names}')
@@ -1,9 +1,11 @@
 """Defines SQLAlchemy models for a movie database application."""
 
+from decimal import Decimal
+from typing import Optional
 from uuid import UUID, uuid4
 
-from sqlalchemy import (CheckConstraint, Column, ForeignKey, String,
-                        UniqueConstraint)
+from sqlalchemy import (CheckConstraint, Column, ForeignKey, Index, Numeric,
+                        SmallInteger, String, Table, UniqueConstraint, text)
 from sqlalchemy.orm import (DeclarativeBase, Mapped, MappedColumn,
                             mapped_column, relationship)
 
@@ -28,15 +30,26 @@ class Token(UUIDMixin, Base):
     __table_args__ = (UniqueConstraint('value', name='_token_uc'),)
 
 
+movie_actor = Table(
+    'movie_actor',
+    Base.metadata,
+    Column('movie_id', ForeignKey('movie.id', ondelete='CASCADE'), primary_key=True),
+    Column('actor_id', ForeignKey('actor.id', ondelete='CASCADE'), primary_key=True),
+    Index('ix_movie_actor_actor_movie', 'actor_id', 'movie_id'),
+)
+
+
 class Actor(UUIDMixin, Base):
     """Represents an actor in the database."""
 
     __tablename__ = 'actor'
     full_name: MappedColumn[str]
     birth_date: MappedColumn[str]
-    movie_id: Mapped[UUID] = mapped_column(ForeignKey('movie.id'))
-    movie: MappedColumn['Movie'] = relationship(back_populates='actors')
-    __table_args__ = (CheckConstraint('length(full_name) <= 30', 'full_name_valid_length'),)
+    movies: MappedColumn[list['Movie']] = relationship(secondary=movie_actor, back_populates='actors')
+    __table_args__ = (
+        CheckConstraint('length(full_name) <= 30', 'full_name_valid_length'),
+        UniqueConstraint('full_name', 'birth_date', name='actor_identity_unique'),
+    )
 
 
 class Movie(UUIDMixin, Base):
@@ -49,9 +62,14 @@ class Movie(UUIDMixin, Base):
     year: MappedColumn[int]
     trailer: MappedColumn[str]
     poster: MappedColumn[str]
-    actors: MappedColumn[list[Actor]] = relationship(back_populates='movie')
+    imdb_rating: MappedColumn[Optional[Decimal]] = mapped_column(Numeric(3, 1))
+    imdb_votes: MappedColumn[Optional[int]]
+    rotten_tomatoes: MappedColumn[Optional[int]] = mapped_column(SmallInteger)
+    metacritic: MappedColumn[Optional[int]] = mapped_column(SmallInteger)
+    actors: MappedColumn[list[Actor]] = relationship(secondary=movie_actor, back_populates='movies')
     __table_args__ = (
         CheckConstraint('length(title) <= 50', 'title_valid_length'),
         CheckConstraint('length(description) <= 500', 'description_valid_length'),
         UniqueConstraint('title', name='title_unique'),
+        Index('ix_movie_rating', text('imdb_rating desc nulls last'), text('imdb_votes desc nulls last')),
     )
@@ -0,0 +1,378 @@
+"""A module of immutable indexes whose updates return a new index sharing all untouched nodes with the old one."""
+
+import bisect
+import itertools
+from collections.abc import Mapping
+from typing import Callable, Hashable, Iterable, Iterator, Optional
+
+# Hash tries branch on 5 bits of the key hash per level, from the highest, into lists of 32 slots, down to
+# dicts of at most NODE_SIZE records by key; keys whose 60 hash bits collide share a dict whatever its size.
+HASH_BITS = 60
+HASH_MASK = (1 << HASH_BITS) - 1
+LEVEL_BITS = 5
+LEVEL_MASK = (1 << LEVEL_BITS) - 1
+MAX_DEPTH = HASH_BITS // LEVEL_BITS
+# Leaves of hash tries and nodes of sorted sequences split beyond this many records or children.
+NODE_SIZE = 64
+
+_missing = object()
+
+
+class HashIndex(Mapping):
+    """
+    Records by a key of theirs in an immutable hash trie.
+
+    A lookup indexes about log32(N / 64) lists then gets the record from a small dict; setting or discarding
+    a record copies only the lists on its path and its dict. Building sorts the records by key hash, so the
+    leaves are sliced from sorted lists instead of being filled one record at a time.
+    """
+
+    __slots__ = ('_key', '_root', '_size')
+
+    def __init__(self, key: Callable[[object], Hashable], records: Iterable[object] = ()) -> None:
+        """
+        Initialize the index.
+
+        Args:
+            key (Callable[[object], Hashable]): The function giving the key of a record.
+            records (Iterable[object]): The records; of records sharing a key, the last one is kept.
+        """
+        self._key = key
+        records = list(records)
+        entries = _sorted_entries(list(map(key, records)), records)
+        self._root = _build_trie(entries, 0, len(records), 0)
+        self._size = sum(1 for _ in self.values())
+
+    def __getitem__(self, key: Hashable) -> object:
+        """
+        Find the record of a key.
+
+        Args:
+            key (Hashable): The key.
+
+        Returns:
+            object: The record.
+
+        Raises:
+            KeyError: If no record has the key.
+        """
+        record = self.get(key, _missing)
+        if record is _missing:
+            raise KeyError(key)
+        return record
+
+    def __iter__(self) -> Iterator[Hashable]:
+        """
+        Iterate over the keys of the records, in hash order.
+
+        Returns:
+            Iterator[Hashable]: The keys.
+        """
+        return map(self._key, self.values())
+
+    def __len__(self) -> int:
+        """
+        Count the records.
+
+        Returns:
+            int: The number of records.
+        """
+        return self._size
+
+    def __contains__(self, key: object) -> bool:
+        """
+        Check if a record has a key.
+
+        Args:
+            key (object): The key.
+
+        Returns:
+            bool: True if a record has the key.
+        """
+        return self.get(key, _missing) is not _missing
+
+    def get(self, key: Hashable, default: object = None) -> object:
+        """
+        Find the record of a key.
+
+        Args:
+            key (Hashable): The key.
+            default (object): The value returned if no record has the key.
+
+        Returns:
+            object: The record or the default.
+        """
+        node, bits, shift = self._root, hash(key) & HASH_MASK, HASH_BITS
+        while isinstance(node, list):
+            shift -= LEVEL_BITS
+            node = node[(bits >> shift) & LEVEL_MASK]
+        return default if node is None else node.get(key, default)
+
+    def values(self) -> Iterator[object]:  # noqa: WPS110
+        """
+        Iterate over the records, in hash order.
+
+        Returns:
+            Iterator[object]: The records.
+        """
+        return _trie_records(self._root)
+
+    def set(self, record: object) -> 'HashIndex':
+        """
+        Build the index with a record, replacing the record of the same key.
+
+        Args:
+            record (object): The record.
+
+        Returns:
+            HashIndex: The new index.
+        """
+        key = self._key(record)
+        added = key not in self
+        return self._derive(self._set(self._root, key, record, 0), self._size + added)
+
+    def discard(self, key: Hashable) -> 'HashIndex':
+        """
+        Build the index without the record of a key.
+
+        Args:
+            key (Hashable): The key.
+
+        Returns:
+            HashIndex: The new index, or the index itself if no record has the key.
+        """
+        if key not in self:
+            return self
+        return self._derive(self._discard(self._root, key, 0), self._size - 1)
+
+    def _derive(self, root: object, size: int) -> 'HashIndex':
+        derived = HashIndex(self._key)
+        derived._root = root  # noqa: WPS437
+        derived._size = size  # noqa: WPS437
+        return derived
+
+    @classmethod
+    def _set(cls, node: object, key: Hashable, record: object, depth: int) -> object:
+        if isinstance(node, list):
+            node = list(node)
+            fragment = _fragment(key, depth)
+            node[fragment] = cls._set(node[fragment], key, record, depth + 1)
+            return node
+        leaf = {} if node is None else dict(node)
+        leaf[key] = record
+        if len(leaf) <= NODE_SIZE or depth == MAX_DEPTH:
+            return leaf
+        # The leaf is full: its records are spread over a new level.
+        return _build_trie(_sorted_entries(list(leaf), list(leaf.values())), 0, len(leaf), depth)
+
+    @classmethod
+    def _discard(cls, node: object, key: Hashable, depth: int) -> object:
+        if isinstance(node, list):
+            node = list(node)
+            fragment = _fragment(key, depth)
+            node[fragment] = cls._discard(node[fragment], key, depth + 1)
+            return node
+        leaf = dict(node)
+        leaf.pop(key)
+        return leaf or None
+
+
+def _fragment(key: Hashable, depth: int) -> int:
+    return ((hash(key) & HASH_MASK) >> (HASH_BITS - LEVEL_BITS * (depth + 1))) & LEVEL_MASK
+
+
+def _sorted_entries(keys: list, records: list) -> tuple[list, list, list]:
+    hashes = [hash(key) & HASH_MASK for key in keys]
+    order = sorted(range(len(keys)), key=hashes.__getitem__)  # noqa: WPS609
+    sorted_keys = [keys[index] for index in order]
+    return [hashes[index] for index in order], sorted_keys, [records[index] for index in order]
+
+
+def _build_trie(entries: tuple[list, list, list], start: int, stop: int, depth: int) -> object:
+    # A trie is a list of 32 tries or a dict of records by key, if any; entries are sorted by hash.
+    hashes, keys, records = entries
+    if stop - start <= NODE_SIZE or depth == MAX_DEPTH:
+        return dict(zip(keys[start:stop], records[start:stop])) or None
+    shift = HASH_BITS - LEVEL_BITS * (depth + 1)
+    prefix = hashes[start] >> shift + LEVEL_BITS << shift + LEVEL_BITS
+    bounds = [
+        bisect.bisect_left(hashes, prefix | fragment << shift, start, stop) for fragment in range(1, 1 << LEVEL_BITS)
+    ]
+    return [
+        _build_trie(entries, low, high, depth + 1)
+        for low, high in zip([start, *bounds], [*bounds, stop])
+    ]
+
+
+def _trie_records(node: object) -> Iterator[object]:
+    if isinstance(node, list):
+        return itertools.chain.from_iterable(_trie_records(slot) for slot in node if slot is not None)
+    return iter(() if node is None else node.values())
+
+
+class SortedSequence:
+    """
+    Records sorted by a unique key of theirs in an immutable B+ tree.
+
+    Leaves are tuples of records and inner nodes pairs of (last keys, children); inserting or removing a record
+    copies only the O(log N) nodes on its path. Emptied nodes are dropped, but underfull ones are not merged.
+    """
+
+    __slots__ = ('_key', '_root', '_height', '_size')
+
+    def __init__(self, key: Callable[[object], object], records: Iterable[object] = ()) -> None:
+        """
+        Initialize the sequence.
+
+        Args:
+            key (Callable[[object], object]): The function giving the sort key of a record, unique among records.
+            records (Iterable[object]): The records, in any order.
+        """
+        self._key = key
+        nodes: list = [tuple(chunk) for chunk in _chunks(sorted(records, key=key))]
+        self._size = sum(map(len, nodes))
+        self._height = 1
+        while len(nodes) > 1:
+            nodes = [
+                (tuple(self._last_key(child, self._height) for child in children), children)
+                for children in map(tuple, _chunks(nodes))
+            ]
+            self._height += 1
+        self._root = nodes[0] if nodes else ()
+
+    def __iter__(self) -> Iterator[object]:
+        """
+        Iterate over the records in order.
+
+        Returns:
+            Iterator[object]: The records.
+        """
+        nodes: Iterable = (self._root,)
+        for _ in range(self._height - 1):
+            nodes = itertools.chain.from_iterable(node[1] for node in nodes)
+        return itertools.chain.from_iterable(nodes)
+
+    def __len__(self) -> int:
+        """
+        Count the records.
+
+        Returns:
+            int: The number of records.
+        """
+        return self._size
+
+    def __bool__(self) -> bool:
+        """
+        Check if the sequence has records.
+
+        Returns:
+            bool: True unless the sequence is empty.
+        """
+        return self._size > 0
+
+    def last(self) -> Optional[object]:
+        """
+        Find the last record.
+
+        Returns:
+            Optional[object]: The record with the greatest key, None if the sequence is empty.
+        """
+        node = self._root
+        for _ in range(self._height - 1):
+            node = node[1][-1]
+        return node[-1] if node else None
+
+    def insert(self, record: object) -> 'SortedSequence':
+        """
+        Build the sequence with a record at its place.
+
+        Args:
+            record (object): The record, whose key is not in the sequence.
+
+        Returns:
+            SortedSequence: The new sequence.
+        """
+        node, sibling = self._insert(self._root, self._height, record)
+        height = self._height
+        if sibling is not None:
+            node = ((self._last_key(node, height), self._last_key(sibling, height)), (node, sibling))
+            height += 1
+        return self._derive(node, height, self._size + 1)
+
+    def remove(self, record: object) -> 'SortedSequence':
+        """
+        Build the sequence without a record.
+
+        Args:
+            record (object): The record, or a record with the same key.
+
+        Returns:
+            SortedSequence: The new sequence, or the sequence itself if no record has the key.
+        """
+        node = self._remove(self._root, self._height, self._key(record))
+        if node is self._root:
+            return self
+        height = self._height if node else 1
+        while height > 1 and len(node[1]) == 1:
+            node, height = node[1][0], height - 1
+        return self._derive(node, height, self._size - 1)
+
+    def _derive(self, root: tuple, height: int, size: int) -> 'SortedSequence':
+        derived = SortedSequence(self._key)
+        derived._root = root  # noqa: WPS437
+        derived._height = height  # noqa: WPS437
+        derived._size = size  # noqa: WPS437
+        return derived
+
+    def _last_key(self, node: tuple, height: int) -> object:
+        return self._key(node[-1]) if height == 1 else node[0][-1]
+
+    def _insert(self, node: tuple, height: int, record: object) -> tuple[tuple, Optional[tuple]]:
+        if height == 1:
+            position = bisect.bisect_left(node, self._key(record), key=self._key)
+            return _split_leaf(node[:position] + (record,) + node[position:])
+        keys, children = node
+        index = min(bisect.bisect_left(keys, self._key(record)), len(keys) - 1)
+        replaced = tuple(filter(None, self._insert(children[index], height - 1, record)))
+        return _split_inner(self._replace(node, height, index, replaced))
+
+    def _remove(self, node: tuple, height: int, key: object) -> tuple:
+        if height == 1:
+            position = bisect.bisect_left(node, key, key=self._key)
+            if position < len(node) and self._key(node[position]) == key:
+                return node[:position] + node[position + 1:]
+            return node
+        index = bisect.bisect_left(node[0], key)
+        if index == len(node[0]):
+            return node
+        child = self._remove(node[1][index], height - 1, key)
+        if child is node[1][index]:
+            return node
+        return self._replace(node, height, index, (child,) if child else ())
+
+    def _replace(self, node: tuple, height: int, index: int, replaced: tuple) -> tuple:
+        # The child at the index is replaced by none, one or two nodes; an inner node without children is empty.
+        keys, children = node
+        children = children[:index] + replaced + children[index + 1:]
+        if not children:
+            return ()
+        replaced_keys = tuple(self._last_key(child, height - 1) for child in replaced)
+        return keys[:index] + replaced_keys + keys[index + 1:], children
+
+
+def _chunks(records: list) -> Iterator[list]:
+    return (records[start:start + NODE_SIZE] for start in range(0, len(records), NODE_SIZE))
+
+
+def _split_leaf(leaf: tuple) -> tuple[tuple, Optional[tuple]]:
+    if len(leaf) <= NODE_SIZE:
+        return leaf, None
+    half = len(leaf) // 2
+    return leaf[:half], leaf[half:]
+
+
+def _split_inner(node: tuple) -> tuple[tuple, Optional[tuple]]:
+    if len(node[1]) <= NODE_SIZE:
+        return node, None
+    keys, children = map(_split_leaf, node)
+    return (keys[0], children[0]), (keys[1], children[1])
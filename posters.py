@@ -0,0 +1,264 @@
+"""A module proxying movie posters through a bounded disk cache of resized thumbnails."""
+
+import collections
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+from typing import BinaryIO, Callable, ContextManager, Optional
+from urllib.parse import urlsplit
+
+import config
+import tracing
+
+FETCH_LOCKS = 64
+RANGE_PATTERN = re.compile('bytes=([0-9]*)-([0-9]*)')
+
+
+class PosterError(Exception):
+    """Raised when a poster cannot be fetched from its origin or is not an image."""
+
+
+class RangeError(ValueError):
+    """Raised when a requested byte range starts after the end of the file."""
+
+
+class PosterCache:
+    """
+    Posters fetched once from their origin and kept on disk with their thumbnails, up to a total size.
+
+    The least recently served files are evicted first; recency survives restarts as file modification times.
+    Only posters of the allowed hosts are fetched.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, hosts: frozenset[str]) -> None:
+        """
+        Open the cache, indexing the files left by previous runs.
+
+        Args:
+            directory (str): The directory of the cached files, created if missing.
+            max_bytes (int): The maximum total size of the cached files.
+            hosts (frozenset[str]): The hosts posters may be fetched from.
+        """
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._hosts = hosts
+        self._lock = threading.Lock()
+        self._fetch_locks = [threading.Lock() for _ in range(FETCH_LOCKS)]
+        cached = sorted(
+            (entry.stat().st_mtime, entry.name, entry.stat().st_size)
+            for entry in self._directory.iterdir()
+            if entry.is_file() and not entry.name.startswith('.')
+        )
+        self._sizes = collections.OrderedDict((name, size) for _, name, size in cached)
+        self._total = sum(self._sizes.values())
+        # Content hashes of the cached files, computed on their first use after a restart.
+        self._digests: dict[str, str] = {}
+
+    def allows(self, url: str) -> bool:
+        """
+        Check if the poster at the url may be fetched.
+
+        Args:
+            url (str): The URL of the poster at its origin.
+
+        Returns:
+            bool: True if the url is an http(s) URL of an allowed host.
+        """
+        parts = urlsplit(url)
+        return parts.scheme in {'http', 'https'} and parts.hostname in self._hosts
+
+    def link(self, movie_id: object, url: str, width: int) -> str:
+        """
+        Link the poster of a movie through the proxy if it may be fetched, or at its origin otherwise.
+
+        Args:
+            movie_id (object): The unique identifier of the movie.
+            url (str): The URL of the poster at its origin.
+            width (int): The width of the thumbnail linked through the proxy.
+
+        Returns:
+            str: The URL to show the poster with.
+        """
+        return f'/posters/{movie_id}?w={width}' if self.allows(url) else url
+
+    def open(
+        self, url: str, width: int, admit_miss: Callable[[], ContextManager],
+    ) -> tuple[str, BinaryIO]:
+        """
+        Open the thumbnail of the poster at the url, fetching and resizing the poster on a miss.
+
+        The PosterError of fetching or resizing the poster and the error of admitting the miss are propagated.
+
+        Args:
+            url (str): The URL of the poster at its origin.
+            width (int): The width of the thumbnail, one of config.POSTER_WIDTHS.
+            admit_miss (Callable[[], ContextManager]): Function returning the context a miss runs in, e.g. a bulkhead.
+
+        Returns:
+            tuple[str, BinaryIO]: The hash of the content of the thumbnail and the open JPEG file.
+        """
+        key = hashlib.sha256(url.encode()).hexdigest()
+        name = f'{key}-w{width}'
+        thumbnail = self._open(name)
+        if thumbnail is None:
+            with admit_miss():
+                thumbnail = self._fill(url, key, name, width)
+        return self._digest(name, thumbnail), thumbnail
+
+    def _fill(self, url: str, key: str, name: str, width: int) -> BinaryIO:
+        with self._fetch_locks[hash(key) % FETCH_LOCKS]:
+            thumbnail = self._open(name)
+            if thumbnail is not None:
+                return thumbnail
+            original = self._open(key)
+            if original is None:
+                poster = fetch(url)
+                self._store(key, poster)
+            else:
+                with original:
+                    poster = original.read()
+            resized = resize(poster, width)
+            self._store(name, resized)
+        return io.BytesIO(resized)
+
+    def _open(self, name: str) -> Optional[BinaryIO]:
+        with self._lock:
+            if name not in self._sizes:
+                return None
+            try:
+                # An open file can still be read if it is evicted meanwhile.
+                cached = (self._directory / name).open('rb')
+            except FileNotFoundError:
+                self._total -= self._sizes.pop(name)
+                self._digests.pop(name, None)
+                return None
+            self._sizes.move_to_end(name)
+        os.utime(cached.fileno())
+        return cached
+
+    def _digest(self, name: str, cached: BinaryIO) -> str:
+        with self._lock:
+            digest = self._digests.get(name)
+        if digest is None:
+            digest = hashlib.sha256(cached.read()).hexdigest()
+            cached.seek(0)
+            with self._lock:
+                self._digests[name] = digest
+        return digest
+
+    def _store(self, name: str, image: bytes) -> None:
+        with tempfile.NamedTemporaryFile(dir=self._directory, prefix='.', delete=False) as temporary:
+            temporary.write(image)
+            temporary_path = temporary.name
+        os.replace(temporary_path, self._directory / name)
+        with self._lock:
+            self._total += len(image) - self._sizes.pop(name, 0)
+            self._sizes[name] = len(image)
+            self._digests[name] = hashlib.sha256(image).hexdigest()
+            while self._total > self._max_bytes and len(self._sizes) > 1:
+                evicted, size = self._sizes.popitem(last=False)
+                self._total -= size
+                self._digests.pop(evicted, None)
+                (self._directory / evicted).unlink(missing_ok=True)
+
+
+def fetch(url: str) -> bytes:
+    """
+    Download a poster from its origin.
+
+    Args:
+        url (str): The URL of the poster.
+
+    Returns:
+        bytes: The poster image.
+
+    Raises:
+        PosterError: If the origin fails or the poster is larger than config.POSTER_MAX_BYTES.
+    """
+    import requests
+
+    try:
+        with tracing.span('upstream', 'poster'):
+            # Redirects are not followed, as they could lead to any host.
+            with requests.get(url, timeout=config.TIMEOUT, stream=True, allow_redirects=False) as response:
+                if response.status_code != config.OK:
+                    raise PosterError(f'origin responded with status code {response.status_code}')
+                poster = response.raw.read(config.POSTER_MAX_BYTES + 1, decode_content=True)
+    except requests.RequestException as error:
+        raise PosterError(f'origin is unreachable: {error}') from error
+    if len(poster) > config.POSTER_MAX_BYTES:
+        raise PosterError(f'poster is larger than {config.POSTER_MAX_BYTES} bytes')
+    return poster
+
+
+def resize(poster: bytes, width: int) -> bytes:
+    """
+    Encode a JPEG thumbnail of a poster no wider than the width, keeping its aspect ratio.
+
+    Args:
+        poster (bytes): The poster image in any format Pillow reads.
+        width (int): The maximum width of the thumbnail.
+
+    Returns:
+        bytes: The JPEG thumbnail.
+
+    Raises:
+        PosterError: If the poster is not a readable image.
+    """
+    from PIL import Image
+
+    thumbnail = io.BytesIO()
+    try:
+        with Image.open(io.BytesIO(poster)) as image:
+            image.thumbnail((width, image.height))
+            image.convert('RGB').save(thumbnail, 'JPEG', quality=config.POSTER_QUALITY, optimize=True)
+    except (OSError, Image.DecompressionBombError) as error:
+        raise PosterError(f'poster is not a readable image: {error}') from error
+    return thumbnail.getvalue()
+
+
+def fit_width(width: int) -> int:
+    """
+    Round a requested width up to the nearest thumbnail width, so few thumbnails are cached per poster.
+
+    Args:
+        width (int): The requested width in pixels.
+
+    Returns:
+        int: The thumbnail width.
+    """
+    return next((fitting for fitting in config.POSTER_WIDTHS if fitting >= width), config.POSTER_WIDTHS[-1])
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """
+    Parse a single byte range of a Range header; other ranges are ignored, to send the whole file.
+
+    Args:
+        header (Optional[str]): The Range header, e.g. 'bytes=0-99', 'bytes=100-' or 'bytes=-100'.
+        size (int): The size of the file.
+
+    Returns:
+        Optional[tuple[int, int]]: The first and last byte of the range, or None to send the whole file.
+
+    Raises:
+        RangeError: If the range starts after the end of the file or is empty.
+    """
+    match = RANGE_PATTERN.fullmatch(header.strip()) if header else None
+    if match is None or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), int(last or size)
+    else:
+        start, end = size - min(int(last), size), size - 1
+    if start >= size:
+        raise RangeError(f'range starts after the end of {size} bytes')
+    if end < start:
+        return None
+    return start, min(end, size - 1)
@@ -1,10 +1,28 @@
 """This module contains SQL queries for interacting with a database."""
 
 GET_MOVIES = 'select * from movie'
-GET_ACTORS = 'select * from actor'
+GET_ACTORS = 'select full_name, birth_date, id from actor'
+GET_ACTORS_BY_IDS = 'select full_name, birth_date, id from actor where id = any(%s)'
 GET_TITLE_BY_MOVIE = 'select title from movie'
 INSERT_MOVIE = 'insert into movie (id, title, description, genre, year, trailer, poster) values (%s, %s, %s, %s, %s, %s, %s)'
 DELETE_MOVIE = 'delete from movie where id=%s'
+CHECK_CONNECTION = 'select 1'
 CHECK_TOKEN = 'select count(*) from token where value=%s'
-CHECK_MOVIE = 'select count(*) from movie where id=%s'
 UPDATE_MOVIE = 'update movie set {params} where id=%s'
+UPSERT_MOVIE = 'insert into movie (id, title, description, genre, year, trailer, poster) values (%s, %s, %s, %s, %s, %s, %s) on conflict ({conflict}) do update set title = excluded.title, description = excluded.description, genre = excluded.genre, year = excluded.year, trailer = excluded.trailer, poster = excluded.poster returning id, xmax = 0'
+COPY_MOVIES = 'copy movie (id, title, description, genre, year, trailer, poster) from stdin'
+COPY_ACTORS = 'copy actor (id, full_name, birth_date) from stdin'
+COPY_MOVIE_ACTORS = 'copy movie_actor (movie_id, actor_id) from stdin'
+TRUNCATE_CATALOG = 'truncate movie_actor, actor, movie'
+GET_MOVIE_CAST = 'select actor.full_name, actor.birth_date, actor.id from movie_actor join actor on actor.id = movie_actor.actor_id where movie_actor.movie_id = %s order by actor.full_name'
+GET_ACTOR_MOVIES = 'select movie.title, movie.year, movie.genre, movie.id from movie_actor join movie on movie.id = movie_actor.movie_id where movie_actor.actor_id = %s order by movie.year desc, movie.title'
+GET_REPLICATION_LAG = 'select case when pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() then 0 else extract(epoch from now() - pg_last_xact_replay_timestamp()) end'
+GET_MOVIE_CHANGES = 'select movie_change.seq, movie_change.movie_id, movie_change.deleted, movie.title, movie.description, movie.genre, movie.year, movie.trailer, movie.poster, movie.imdb_rating::float8, movie.imdb_votes, movie.rotten_tomatoes, movie.metacritic from movie_change left join movie on movie.id = movie_change.movie_id where movie_change.seq > %s order by movie_change.seq limit %s'
+GET_CATALOG_MOVIES = 'select id, title, description, genre, year, trailer, poster, imdb_rating::float8, imdb_votes, rotten_tomatoes, metacritic from movie'
+SET_QUERY_LIMITS = "select set_config('statement_timeout', %s, false), set_config('lock_timeout', %s, false)"
+GET_LAST_CHANGE = 'select coalesce(max(seq), 0) from movie_change'
+SEQUENCE_MOVIE_CHANGES = 'select sequence_movie_changes()'
+SET_REPEATABLE_READ = 'set transaction isolation level repeatable read'
+GET_CAST_LINKS = 'select movie_id, actor_id from movie_actor where (movie_id, actor_id) > (%s, %s) order by movie_id, actor_id limit %s'
+GET_MOVIES_CAST_LINKS = 'select movie_id, actor_id from movie_actor where movie_id = any(%s)'
+SET_MOVIE_RATING = 'update movie set imdb_rating = %s, imdb_votes = %s, rotten_tomatoes = %s, metacritic = %s where id = %s and (imdb_rating, imdb_votes, rotten_tomatoes, metacritic) is distinct from (%s::numeric(3, 1), %s::integer, %s::smallint, %s::smallint)'
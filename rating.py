@@ -1,10 +1,21 @@
 """A module to fetch movie ratings from OMDB using an API key."""
 
 import json
+from typing import Callable, NamedTuple, Optional
 
-import requests
+import config
+import tracing
 
-from config import API_URL, OK, TIMEOUT
+PERCENT = 100
+
+
+class MovieRating(NamedTuple):
+    """Ratings of a movie parsed from OMDB; None where OMDB has no value."""
+
+    imdb_rating: Optional[float]
+    imdb_votes: Optional[int]
+    rotten_tomatoes: Optional[int]
+    metacritic: Optional[int]
 
 
 class ForeignApiError(Exception):
@@ -35,8 +46,68 @@ def get_rating(title: str, apikey: str) -> dict:
     Raises:
         ForeignApiError: If the OMDB API call fails.
     """
-    url = f'{API_URL}?apikey={apikey}&t={title}'
-    response = requests.get(url, timeout=TIMEOUT)
-    if response.status_code != OK:
+    import requests
+
+    with tracing.span('upstream', 'omdb'):
+        response = requests.get(config.API_URL, params={'apikey': apikey, 't': title}, timeout=config.TIMEOUT)
+    if response.status_code != config.OK:
         raise ForeignApiError('OMDB.Ratings', response.status_code)
     return json.loads(response.content)
+
+
+def parse_rating(movie_data: dict) -> Optional[MovieRating]:
+    """
+    Parse the ratings of an OMDB response, scores of the Ratings array out of 100.
+
+    Args:
+        movie_data (dict): The OMDB response.
+
+    Returns:
+        Optional[MovieRating]: The ratings, or None if OMDB did not find the movie.
+    """
+    if movie_data.get('Response') != 'True':
+        return None
+    scores = {
+        source.get('Source'): parse_score(str(source.get(config.RATING_KEYS)))
+        for source in movie_data.get('Ratings', ())
+    }
+    return MovieRating(
+        parse_number(movie_data.get('imdbRating'), float),
+        parse_number(str(movie_data.get('imdbVotes')).replace(',', ''), int),
+        scores.get(config.ROTTEN_TOMATOES_SOURCE),
+        scores.get(config.METACRITIC_SOURCE),
+    )
+
+
+def parse_score(raw_score: str) -> Optional[int]:
+    """
+    Parse a score of the Ratings array of OMDB, e.g. '87%', '74/100' or '8.8/10', out of 100.
+
+    Args:
+        raw_score (str): The score.
+
+    Returns:
+        Optional[int]: The score out of 100, or None if it is not a score.
+    """
+    points, _, scale = raw_score.rstrip('%').partition('/')
+    try:
+        return round(float(points) * PERCENT / float(scale or PERCENT))
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def parse_number(raw_number: Optional[str], number_type: Callable[[str], float]) -> Optional[float]:
+    """
+    Parse a number of an OMDB response, which has 'N/A' for unknown values.
+
+    Args:
+        raw_number (Optional[str]): The number.
+        number_type (Callable[[str], float]): The type of the number, int or float.
+
+    Returns:
+        Optional[float]: The number, or None if it is unknown.
+    """
+    try:
+        return number_type(raw_number)
+    except (TypeError, ValueError):
+        return None
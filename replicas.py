@@ -0,0 +1,245 @@
+"""A module routing reads across healthy read replicas and writes to the primary database."""
+
+import itertools
+import os
+import threading
+import time
+from typing import Callable, Iterator, TypeVar
+
+import psycopg
+import psycopg_pool
+
+import config
+import db
+import query
+import timeouts
+import tracing
+
+ResultType = TypeVar('ResultType')
+READ_ERRORS = (psycopg.OperationalError, psycopg_pool.PoolTimeout)
+
+
+class Node:
+    """A database server with its connection pool and last known health."""
+
+    def __init__(self, name: str, pool: psycopg_pool.ConnectionPool) -> None:
+        """
+        Initialize the node as healthy.
+
+        Args:
+            name (str): Name of the node used in logs and metrics, e.g. host:port.
+            pool (psycopg_pool.ConnectionPool): Pool of connections to the node.
+        """
+        self.name = name
+        self.pool = pool
+        self.healthy = True
+
+
+class ReplicaRouter:
+    """
+    Load-balance reads across healthy replicas and send writes to the primary.
+
+    Reads of a client that wrote recently stay on the primary, so the client reads its own writes
+    even while replicas lag behind; clients are told apart by keys such as a session id. Reads fail over
+    to the primary when a replica is unreachable, but not when they run out of time.
+    """
+
+    def __init__(
+        self, primary: Node, replicas: list[Node],
+        sticky_seconds: float, max_lag: float,
+    ) -> None:
+        """
+        Initialize the router.
+
+        Args:
+            primary (Node): The primary database.
+            replicas (list[Node]): The read replicas.
+            sticky_seconds (float): How long reads of a client stay on the primary after its write.
+            max_lag (float): Replication lag in seconds above which a replica is considered unhealthy.
+        """
+        self.primary = primary
+        self.replicas = replicas
+        self._sticky_seconds = sticky_seconds
+        self.max_lag = max_lag
+        self._next_replica = itertools.count()
+        self._last_writes: dict[str, float] = {}
+        self._forgotten_at = time.monotonic()
+        self._writes_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.guard = timeouts.QueryGuard(config.DISCONNECT_POLL_INTERVAL)
+
+    def read(
+        self, query_function: Callable[..., ResultType], *args: object,
+        client_keys: tuple[str, ...] = (), use_primary: bool = False,
+    ) -> ResultType:
+        """
+        Run a read query on a healthy replica, falling back to the primary.
+
+        Args:
+            query_function (Callable[..., ResultType]): Function taking a cursor and the args, e.g. db.get_movies.
+            args (object): Additional arguments of the query function.
+            client_keys (tuple[str, ...]): Keys of the client, used to read its own recent writes from the primary.
+            use_primary (bool): Whether the read is part of a write request and must see the latest data.
+
+        Returns:
+            ResultType: The result of the query function.
+
+        Raises:
+            error: The error of the last node tried, if no node could serve the read.
+        """
+        error: Exception = psycopg.OperationalError('no database node available')
+        for node in self._read_nodes(client_keys, use_primary):
+            try:
+                with self.guard.connection(node.pool) as connection:
+                    return tracing.traced('db', query_function)(connection.cursor(), *args)
+            except READ_ERRORS as node_error:
+                error = self._fail_over(node, node_error)
+        raise error
+
+    def write(
+        self, query_function: Callable[..., ResultType], *args: object,
+        client_keys: tuple[str, ...] = (), **kwargs: object,
+    ) -> ResultType:
+        """
+        Run a write query on the primary and pin the reads of the client to the primary for a while.
+
+        Args:
+            query_function (Callable[..., ResultType]): Function taking a cursor, a connection and the args.
+            args (object): Additional arguments of the query function.
+            client_keys (tuple[str, ...]): Keys of the client that issued the write.
+            kwargs (object): Additional keyword arguments of the query function.
+
+        Returns:
+            ResultType: The result of the query function.
+        """
+        with self.guard.connection(self.primary.pool) as connection:
+            outcome = tracing.traced('write', query_function)(connection.cursor(), connection, *args, **kwargs)
+        written_at = time.monotonic()
+        with self._writes_lock:
+            for client_key in client_keys:
+                self._last_writes[client_key] = written_at
+            # Expired writes are forgotten at most once per sticky period, so only recent writers are kept.
+            if written_at - self._forgotten_at > self._sticky_seconds:
+                self._forget_old_writes(written_at)
+        return outcome
+
+    def wrote_recently(self, client_keys: tuple[str, ...]) -> bool:
+        """
+        Check if the client wrote recently enough for its reads to go to the primary.
+
+        Args:
+            client_keys (tuple[str, ...]): Keys of the client.
+
+        Returns:
+            bool: True if the client wrote within the sticky period.
+        """
+        sticky_since = time.monotonic() - self._sticky_seconds
+        with self._writes_lock:
+            last_writes = [self._last_writes.get(client_key, sticky_since) for client_key in client_keys]
+        return any(last_write > sticky_since for last_write in last_writes)
+
+    def check_health(self, timeout: float) -> None:
+        """
+        Mark each replica healthy if it answers and lags behind the primary less than allowed.
+
+        Args:
+            timeout (float): Seconds to wait for a connection to each replica.
+        """
+        for replica in self.replicas:
+            try:
+                with replica.pool.connection(timeout=timeout) as connection:
+                    lag = connection.execute(query.GET_REPLICATION_LAG).fetchone()[0]
+            except READ_ERRORS:
+                replica.healthy = False
+                continue
+            replica.healthy = lag is None or lag <= self.max_lag
+
+    def start_health_checks(self, interval: float, timeout: float) -> None:
+        """
+        Check the health of replicas periodically in a background thread.
+
+        Args:
+            interval (float): Seconds between health checks.
+            timeout (float): Seconds to wait for a connection to each replica.
+        """
+        threading.Thread(
+            target=self._run_health_checks, args=(interval, timeout), name='replica-health', daemon=True,
+        ).start()
+
+    def close(self) -> None:
+        """Stop health checks and the query guard and close the pools of all nodes."""
+        self._stopped.set()
+        self.guard.stop()
+        for node in (self.primary, *self.replicas):
+            node.pool.close()
+
+    def _run_health_checks(self, interval: float, timeout: float) -> None:
+        while not self._stopped.wait(interval):
+            self.check_health(timeout)
+
+    def _fail_over(self, node: Node, error: Exception) -> Exception:
+        # A read stopped by the limits of its request would only run out of time again on another node.
+        if isinstance(error, timeouts.QUERY_LIMIT_ERRORS):
+            raise error
+        if node is not self.primary:
+            node.healthy = False
+        return error
+
+    def _read_nodes(self, client_keys: tuple[str, ...], use_primary: bool) -> Iterator[Node]:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if healthy and not use_primary and not self.wrote_recently(client_keys):
+            yield healthy[next(self._next_replica) % len(healthy)]
+        yield self.primary
+
+    def _forget_old_writes(self, now: float) -> None:
+        expired_before = now - self._sticky_seconds
+        self._last_writes = {
+            client_key: last_write
+            for client_key, last_write in self._last_writes.items()
+            if last_write >= expired_before
+        }
+        self._forgotten_at = now
+
+
+def create_node(address: str | None = None) -> Node:
+    """
+    Create a node with a pool of autocommit connections.
+
+    Args:
+        address (str | None): The host:port of the node; the primary from PG_HOST/PG_PORT if None.
+
+    Returns:
+        Node: The node with an opened pool.
+    """
+    credentials = db.credentials(address)
+    pool = psycopg_pool.ConnectionPool(
+        kwargs={**credentials, 'autocommit': True},
+        min_size=config.POOL_MIN_SIZE,
+        max_size=config.POOL_MAX_SIZE,
+        timeout=config.POOL_TIMEOUT,
+        name=f'{credentials["host"]}:{credentials["port"]}',
+        open=True,
+    )
+    return Node(pool.name, pool)
+
+
+def create_router() -> ReplicaRouter:
+    """
+    Create a router for the primary and the replicas listed in PG_REPLICAS and start their health checks.
+
+    Returns:
+        ReplicaRouter: The router of the configured databases.
+    """
+    addresses = os.environ.get(config.REPLICAS_ENV, '').split(',')
+    router = ReplicaRouter(
+        create_node(),
+        [create_node(address.strip()) for address in addresses if address.strip()],
+        float(os.environ.get('REPLICA_STICKY_SECONDS', config.REPLICA_STICKY_SECONDS)),
+        float(os.environ.get('REPLICA_MAX_LAG', config.REPLICA_MAX_LAG)),
+    )
+    router.guard.start()
+    if router.replicas:
+        health_timeout = float(os.environ.get('REPLICA_HEALTH_TIMEOUT', config.REPLICA_HEALTH_TIMEOUT))
+        router.check_health(health_timeout)
+        router.start_health_checks(config.REPLICA_HEALTH_INTERVAL, health_timeout)
+    return router
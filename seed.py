@@ -0,0 +1,365 @@
+"""Deterministic synthetic catalog generator loading movies and actors with COPY."""
+
+import argparse
+import datetime
+import itertools
+import random
+import resource
+import time
+from typing import Iterator
+from uuid import UUID
+
+import psycopg
+
+import config
+import db
+import query
+
+NOUNS = (
+    'River', 'Ghost', 'Empire', 'Storm', 'Heart', 'Shadow', 'Night', 'Dream', 'Fire', 'Stone',
+    'Garden', 'Island', 'Mirror', 'Window', 'Harbor', 'Circle', 'Signal', 'Winter', 'Summer', 'Autumn',
+    'Ocean', 'Desert', 'Forest', 'Valley', 'Tower', 'Bridge', 'Road', 'City', 'Kingdom', 'Legacy',
+    'Promise', 'Silence', 'Echo', 'Angel', 'Devil', 'Hunter', 'Soldier', 'Witness', 'Queen', 'King',
+    'Prince', 'Dragon', 'Wolf', 'Raven', 'Tiger', 'Falcon', 'Horse', 'Rose', 'Lotus', 'Crown',
+    'Sword', 'Arrow', 'Key', 'Door', 'House', 'Hotel', 'Station', 'Train', 'Engine', 'Machine',
+    'Planet', 'Star', 'Moon', 'Sun', 'Comet', 'Orbit', 'Galaxy', 'Border', 'Code', 'Virus',
+    'Cure', 'Memory', 'Future', 'Origin', 'Return', 'Revenge', 'Escape', 'Journey', 'Voyage', 'Mission',
+    'Game', 'Party', 'Wedding', 'Letter', 'Diary', 'Song', 'Dance', 'Voice', 'Blood', 'Bone',
+    'Glass', 'Paper', 'Money', 'Gold', 'Iron', 'Smoke', 'Ash', 'Rain', 'Snow', 'Thunder',
+)
+PREFIXES = (
+    'The', 'A', 'Last', 'Lost', 'Dark', 'Silent', 'Little', 'Great', 'Final', 'Broken', 'Hidden', 'Wild',
+    'Golden', 'Red', 'Black', 'White', 'Blue', 'Cold', 'Dead', 'Deep', 'First', 'Long', 'New', 'Secret',
+)
+PREFIX_COUNT_WEIGHTS = tuple(itertools.accumulate((50, 35, 15)))
+
+GENRES = (
+    'Drama', 'Comedy', 'Action', 'Thriller', 'Romance', 'Horror', 'Crime', 'Adventure', 'Sci-Fi', 'Fantasy',
+    'Mystery', 'Animation', 'Documentary', 'Family', 'History', 'Biography', 'War', 'Western', 'Musical', 'Sport',
+)
+GENRE_WEIGHTS = tuple(itertools.accumulate((
+    25, 18, 14, 10, 8, 7, 7, 6, 5, 5,
+    5, 4, 4, 3, 2, 2, 2, 1, 1, 1,
+)))
+GENRE_COUNT_WEIGHTS = tuple(itertools.accumulate((30, 40, 25, 5)))
+
+SUBJECTS = (
+    'A retired detective', 'Two estranged brothers', 'A young pilot', 'A small-town teacher', 'An exiled prince',
+    'A team of explorers', 'A struggling musician', 'A rookie reporter', 'An android', 'A grieving widow',
+)
+PLOTS = (
+    'must uncover the truth behind a decades-old disappearance',
+    'is drawn into a conspiracy that reaches the highest levels of power',
+    'sets out on a dangerous journey across a hostile land',
+    'tries to hold a family together during a long, hard winter',
+    'discovers a secret that could change the fate of the world',
+    'is forced to confront the mistakes of the past',
+    'joins an unlikely crew for one last job',
+    'falls for a stranger with a mysterious past',
+)
+ENDINGS = (
+    'Time is running out.', 'Nothing is what it seems.', 'Every choice comes at a price.',
+    'Trust no one.', 'Some doors should stay closed.', 'Home is further than it looks.',
+)
+
+FIRST_NAMES = (
+    'James', 'Mary', 'John', 'Emma', 'Robert', 'Olivia', 'Michael', 'Sophia', 'David', 'Isabella',
+    'William', 'Mia', 'Richard', 'Charlotte', 'Thomas', 'Amelia', 'Daniel', 'Harper', 'Matthew', 'Evelyn',
+    'Anthony', 'Abigail', 'Mark', 'Emily', 'Steven', 'Ella', 'Andrew', 'Grace', 'Joshua', 'Chloe',
+    'Kenji', 'Yuki', 'Carlos', 'Lucia', 'Ivan', 'Olga', 'Ahmed', 'Leila', 'Pierre', 'Camille',
+)
+LAST_NAMES = (
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Wilson', 'Anderson', 'Taylor', 'Thomas', 'Moore', 'Jackson', 'Martin', 'Lee', 'Thompson', 'White',
+    'Harris', 'Clark', 'Lewis', 'Walker', 'Hall', 'Young', 'King', 'Wright', 'Scott', 'Green',
+    'Tanaka', 'Sato', 'Lopez', 'Fernandez', 'Petrov', 'Ivanova', 'Hassan', 'Karimi', 'Dubois', 'Laurent',
+)
+INITIALS = tuple('ABCDEFGHJKLMNPRSTW')
+BIRTH_START = datetime.date(1930, 1, 1)
+BIRTH_DAYS = 365 * 76
+BIRTH_DATE_FORMAT = '%B %d, %Y'
+
+ACTOR_SPACE = len(FIRST_NAMES) * len(INITIALS) * len(LAST_NAMES) * BIRTH_DAYS
+# a prime larger than both permutation spaces, so multiplying by it is a bijection modulo them
+PERMUTATION_PRIME = 2147483647
+
+LATEST_YEAR, EARLIEST_YEAR = 2024, 1920
+MEAN_MOVIE_AGE = 18
+CAST_MU, CAST_SIGMA, MAX_CAST = 1.5, 0.5, 30
+# larger exponent concentrates casting on a smaller set of popular actors
+POPULARITY_SKEW = 3
+CHUNK_MOVIES = 10000
+CHUNK_ROWS = 50000
+TRAILER_CODE_LEN = 11
+KIB = 1024
+UUID_BITS = 128
+# actor ids keep the seeded high bits and carry the actor index in the low ones
+ACTOR_INDEX_BITS = 62
+
+Chunk = tuple[list[tuple], list[tuple]]
+
+
+def title_digits(movies: int) -> int:
+    """
+    Compute how many noun words are needed to give every movie a distinct title.
+
+    Args:
+        movies (int): Number of movies to generate.
+
+    Returns:
+        int: Number of noun words in each generated title.
+    """
+    digits = 1
+    while len(NOUNS) ** digits < movies:
+        digits += 1
+    return digits
+
+
+def make_title(rng: random.Random, code: int, digits: int) -> str:
+    """
+    Build a title from optional prefix words followed by the noun encoding of a unique code.
+
+    Args:
+        rng (random.Random): Random generator of the movie.
+        code (int): Unique code of the movie, below len(NOUNS) ** digits.
+        digits (int): Number of noun words encoding the code.
+
+    Returns:
+        str: Title of at most 50 characters, unique for every code.
+    """
+    prefix_count = rng.choices(range(len(PREFIX_COUNT_WEIGHTS)), cum_weights=PREFIX_COUNT_WEIGHTS)[0]
+    words = rng.sample(PREFIXES, prefix_count)
+    for _ in range(digits):
+        code, noun = divmod(code, len(NOUNS))
+        words.append(NOUNS[noun])
+    return ' '.join(words)
+
+
+def make_genre(rng: random.Random) -> str:
+    """
+    Pick a weighted mix of distinct genres.
+
+    Args:
+        rng (random.Random): Random generator of the movie.
+
+    Returns:
+        str: Comma separated genres, e.g. 'Action, Sci-Fi'.
+    """
+    genre_count = rng.choices(range(1, len(GENRE_COUNT_WEIGHTS) + 1), cum_weights=GENRE_COUNT_WEIGHTS)[0]
+    genres = dict.fromkeys(rng.choices(GENRES, cum_weights=GENRE_WEIGHTS, k=genre_count))
+    while len(genres) < genre_count:
+        genres.setdefault(rng.choices(GENRES, cum_weights=GENRE_WEIGHTS)[0])
+    return ', '.join(genres)
+
+
+def make_description(rng: random.Random) -> str:
+    """
+    Compose a short plot description.
+
+    Args:
+        rng (random.Random): Random generator of the movie.
+
+    Returns:
+        str: Description of at most 500 characters.
+    """
+    subject, plot = rng.choice(SUBJECTS), rng.choice(PLOTS)
+    sentences = [f'{subject} {plot}.']
+    sentences.extend(rng.sample(ENDINGS, rng.randint(0, 2)))
+    return ' '.join(sentences)
+
+
+def make_actor(index: int, offset: int) -> tuple[str, str]:
+    """
+    Derive a distinct (full name, birth date) identity of an actor from its index.
+
+    Args:
+        index (int): Index of the actor, below ACTOR_SPACE.
+        offset (int): Seed dependent offset of the permutation.
+
+    Returns:
+        tuple[str, str]: Full name and birth date of the actor.
+    """
+    code = (index * PERMUTATION_PRIME + offset) % ACTOR_SPACE
+    code, day = divmod(code, BIRTH_DAYS)
+    code, first = divmod(code, len(FIRST_NAMES))
+    code, initial = divmod(code, len(INITIALS))
+    birth_date = BIRTH_START + datetime.timedelta(days=day)
+    full_name = ' '.join((FIRST_NAMES[first], f'{INITIALS[initial]}.', LAST_NAMES[code]))
+    return full_name, birth_date.strftime(BIRTH_DATE_FORMAT).replace(' 0', ' ')
+
+
+def random_uuid(rng: random.Random) -> UUID:
+    """
+    Draw a version 4 UUID from a seeded generator, so ids are reproducible.
+
+    Args:
+        rng (random.Random): Random generator of the catalog.
+
+    Returns:
+        UUID: Random UUID.
+    """
+    return UUID(int=rng.getrandbits(UUID_BITS), version=4)
+
+
+class CatalogGenerator:
+    """
+    Generate the same catalog of movies and cast for the same seed and sizes.
+
+    Rows are produced by a single random generator in chunks, so memory use does not grow
+    with the size of the catalog. Every actor appears once and is linked to movies through movie_actor.
+    """
+
+    def __init__(self, movies: int, actors: int, seed: int) -> None:
+        """
+        Initialize the generator.
+
+        Args:
+            movies (int): Number of movies to generate.
+            actors (int): Number of distinct actors to cast from.
+            seed (int): Seed making the generated catalog reproducible.
+
+        Raises:
+            ValueError: If more distinct actors are requested than can be generated.
+        """
+        if actors > ACTOR_SPACE:
+            raise ValueError(f'at most {ACTOR_SPACE} distinct actors can be generated')
+        self.movies = movies
+        self.actors = actors
+        self.digits = title_digits(movies)
+        self._rng = random.Random(seed)
+        self._title_offset = self._rng.randrange(len(NOUNS) ** self.digits)
+        self._actor_offset = self._rng.randrange(ACTOR_SPACE)
+        self._actor_id_base = self._rng.getrandbits(UUID_BITS) >> ACTOR_INDEX_BITS << ACTOR_INDEX_BITS
+
+    def actor_id(self, index: int) -> UUID:
+        """
+        Derive the id of an actor without keeping the ids of all actors in memory.
+
+        Args:
+            index (int): Index of the actor.
+
+        Returns:
+            UUID: Id of the actor, stable for the seed.
+        """
+        return UUID(int=self._actor_id_base | index, version=4)
+
+    def actor_chunks(self) -> Iterator[list[tuple]]:
+        """
+        Yield rows of all actors in chunks.
+
+        Yields:
+            list[tuple]: Actor rows of (id, full_name, birth_date).
+        """
+        for chunk_start in range(0, self.actors, CHUNK_ROWS):
+            chunk_stop = min(chunk_start + CHUNK_ROWS, self.actors)
+            yield [
+                (self.actor_id(index), *make_actor(index, self._actor_offset))
+                for index in range(chunk_start, chunk_stop)
+            ]
+
+    def movie(self, index: int) -> tuple:
+        """
+        Generate the next movie row.
+
+        Args:
+            index (int): Index of the movie.
+
+        Returns:
+            tuple: Row of (id, title, description, genre, year, trailer, poster).
+        """
+        rng = self._rng
+        movie_id = random_uuid(rng)
+        code = (index * PERMUTATION_PRIME + self._title_offset) % len(NOUNS) ** self.digits
+        year = max(EARLIEST_YEAR, LATEST_YEAR - int(rng.expovariate(1 / MEAN_MOVIE_AGE)))
+        trailer_code, poster_code = movie_id.hex[:TRAILER_CODE_LEN], movie_id.hex
+        return (
+            movie_id, make_title(rng, code, self.digits), make_description(rng), make_genre(rng), year,
+            f'https://www.youtube.com/embed/{trailer_code}',
+            f'https://img.example.com/posters/{poster_code}.jpg',
+        )
+
+    def cast(self) -> list[int]:
+        """
+        Pick distinct actors for the next movie, favouring popular ones.
+
+        Returns:
+            list[int]: Indexes of the actors playing in the movie.
+        """
+        rng = self._rng
+        cast_size = min(MAX_CAST, self.actors, max(1, int(rng.lognormvariate(CAST_MU, CAST_SIGMA))))
+        cast: list[int] = []
+        while len(cast) < cast_size:
+            actor = int(self.actors * rng.random() ** POPULARITY_SKEW)
+            if actor not in cast:
+                cast.append(actor)
+        return cast
+
+    def movie_chunks(self) -> Iterator[Chunk]:
+        """
+        Yield the movies in chunks together with the cast links of those movies.
+
+        Yields:
+            tuple[list[tuple], list[tuple]]: Movie rows and movie_actor rows of (movie_id, actor_id).
+        """
+        for chunk_start in range(0, self.movies, CHUNK_MOVIES):
+            movie_rows, cast_rows = [], []
+            for index in range(chunk_start, min(chunk_start + CHUNK_MOVIES, self.movies)):
+                movie_row = self.movie(index)
+                movie_rows.append(movie_row)
+                cast_rows.extend((movie_row[0], self.actor_id(actor)) for actor in self.cast())
+            yield movie_rows, cast_rows
+
+
+def load_catalog(connection: psycopg.Connection, generator: CatalogGenerator) -> None:
+    """
+    Stream the generated catalog into the database with COPY in a single transaction.
+
+    Args:
+        connection (psycopg.Connection): Connection to load the catalog with.
+        generator (CatalogGenerator): Generator of the catalog rows.
+    """
+    with connection.cursor() as cursor:
+        for actor_rows in generator.actor_chunks():
+            db.copy_rows(cursor, query.COPY_ACTORS, actor_rows)
+        for movie_rows, cast_rows in generator.movie_chunks():
+            db.copy_rows(cursor, query.COPY_MOVIES, movie_rows)
+            db.copy_rows(cursor, query.COPY_MOVIE_ACTORS, cast_rows)
+    connection.commit()
+
+
+def truncate_catalog(connection: psycopg.Connection) -> None:
+    """
+    Remove all movies and actors.
+
+    Args:
+        connection (psycopg.Connection): Connection to truncate the catalog with.
+    """
+    connection.execute(query.TRUNCATE_CATALOG)
+    connection.commit()
+
+
+def argument_parser() -> argparse.ArgumentParser:
+    """
+    Build the command line parser of the catalog size and seed.
+
+    Returns:
+        argparse.ArgumentParser: Parser of --movies, --actors, --seed and --truncate.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--movies', type=int, default=config.SEED_MOVIES, help='number of movies')
+    parser.add_argument('--actors', type=int, default=config.SEED_ACTORS, help='number of distinct actors')
+    parser.add_argument('--seed', type=int, default=config.SEED, help='seed of the generated catalog')
+    parser.add_argument('--truncate', action='store_true', help='remove existing movies and actors first')
+    return parser
+
+
+if __name__ == '__main__':
+    args = argument_parser().parse_args()
+    connection, _ = db.connect()
+    if args.truncate:
+        truncate_catalog(connection)
+    started = time.perf_counter()
+    load_catalog(connection, CatalogGenerator(args.movies, args.actors, args.seed))
+    elapsed = time.perf_counter() - started
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // KIB
+    print(f'loaded {args.movies} movies in {elapsed:.1f}s, peak RSS {peak_mb} MB')
@@ -0,0 +1,75 @@
+"""A module numbering committed changes of movies in the background, adding them to the change feed."""
+
+import threading
+from typing import Optional
+
+import db
+from replicas import READ_ERRORS, ReplicaRouter
+
+
+class ChangeSequencer:
+    """
+    Runs of db.sequence_movie_changes on the primary, one at a time, when movies change.
+
+    Runs are triggered by change notifications of movies and every interval in case one was missed; a run that
+    numbered changes notifies 'movie_change', so followers of the feed read it once the numbers are visible.
+    Readers of the feed never write; a client reading its own writes waits for the next run instead.
+    """
+
+    def __init__(self, router: ReplicaRouter, interval: float) -> None:
+        """
+        Initialize the sequencer.
+
+        Args:
+            router (ReplicaRouter): The router to run the sequencing on the primary with.
+            interval (float): Seconds between runs without notifications, and the longest wait for a run.
+        """
+        self._router = router
+        self._interval = interval
+        self._pending = threading.Event()
+        self._runs = threading.Condition()
+        self._started = 0
+        self._finished = 0
+
+    def start(self) -> 'ChangeSequencer':
+        """
+        Run the sequencing in a background thread.
+
+        Returns:
+            ChangeSequencer: The sequencer itself.
+        """
+        threading.Thread(target=self._run, name='change-sequencer', daemon=True).start()
+        return self
+
+    def invalidate(self, table: Optional[str], _tags: Optional[frozenset[str]]) -> None:
+        """
+        Trigger a run on a change notification of movies.
+
+        Args:
+            table (Optional[str]): The changed table; None if changes may have been missed.
+            _tags (Optional[frozenset[str]]): Tags of the changed rows, unused as all pending changes are numbered.
+        """
+        if table in {None, 'movie'}:
+            self._pending.set()
+
+    def catch_up(self) -> None:
+        """Wait for a run started after the call, so the changes committed before it are numbered."""
+        with self._runs:
+            run = self._started + 1
+            self._pending.set()
+            self._runs.wait_for(lambda: self._finished >= run, self._interval)
+
+    def _run(self) -> None:
+        while True:
+            self._pending.wait(self._interval)
+            self._pending.clear()
+            with self._runs:
+                self._started += 1
+                run = self._started
+            try:
+                self._router.write(db.sequence_movie_changes)
+            except READ_ERRORS as error:
+                print(f'change sequencing failed: {error}')
+            with self._runs:
+                self._finished = run
+                self._runs.notify_all()
@@ -1,28 +1,85 @@
 """This module provides a web server for handling movie-related operations using http.server."""
 
+import functools
+import itertools
 import json
 import os
-from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import re
+from http.cookies import CookieError, SimpleCookie
+from http.server import BaseHTTPRequestHandler
+from typing import BinaryIO, Callable, Hashable, Iterable
 from typing import Optional as Option
-from uuid import UUID
+from urllib.parse import parse_qs
+from uuid import UUID, uuid4
 
-import dotenv
-import jinja2
 import psycopg
 
+import admission
+import autocomplete
+import catalog
 import config
 import db
+import invalidation
+import posters
 import rating
+import replicas
+import sequencer
+import similarity
+import timeouts
+import tracing
 import views
+import warmup
+from group_commit import GroupCommitter
 
 TEMPLATE_FOLDER = './templates'
+ID_PATTERN = '[^/]+'
+SAFE_METHODS = frozenset(('GET', 'HEAD'))
+SESSION_PATTERN = re.compile('[0-9a-f]{32}')
+MOVIE_RATING_KEYS = ('imdb_rating', 'imdb_votes', 'rotten_tomatoes', 'metacritic')
+CHANGE_KEYS = ('seq', 'id', 'deleted', 'title', 'description', 'genre', 'year', 'trailer', 'poster', *MOVIE_RATING_KEYS)
 
-jinja_env = jinja2.Environment(loader=jinja2.FileSystemLoader(TEMPLATE_FOLDER), autoescape=True)
+# Handlers by path, with the route class limiting their concurrency; metrics and probes are always served.
+GET_ROUTES = (
+    (re.compile('^/metrics/?$'), 'metrics', None),
+    (re.compile('^/healthz/?$'), 'healthz', None),
+    (re.compile('^/readyz/?$'), 'readyz', None),
+    (re.compile('^/rating'), 'handle_movie_rating_request', admission.EXTERNAL),
+    (re.compile('^/movies/changes/?$'), 'movie_changes', admission.READ),
+    (re.compile('^/movies/top/?$'), 'top_movies', admission.READ),
+    (re.compile(f'^/actors/(?P<actor_id>{ID_PATTERN})/movies/?$'), 'actor_movies', admission.READ),
+    (re.compile(f'^/movies/(?P<movie_id>{ID_PATTERN})/actors/?$'), 'movie_cast', admission.READ),
+    (re.compile(f'^/movies/(?P<movie_id>{ID_PATTERN})/similar/?$'), 'similar_movies', admission.READ),
+    (re.compile('^/autocomplete/?$'), 'autocomplete', admission.READ),
+    (re.compile(f'^/posters/(?P<movie_id>{ID_PATTERN})/?$'), 'poster', admission.READ),
+    (re.compile('^/actors'), 'actors_page', admission.READ),
+    (re.compile('^/movies'), 'movies_page', admission.READ),
+)
+
+
+def admitted(route_class: str) -> Callable[[Callable[..., None]], Callable[..., None]]:
+    """
+    Run a request handler method only when its route class has capacity.
+
+    Args:
+        route_class (str): The route class of the method, e.g. admission.WRITE.
+
+    Returns:
+        Callable[[Callable[..., None]], Callable[..., None]]: The decorator of the method.
+    """
+    def decorator(method: Callable[..., None]) -> Callable[..., None]:
+        @functools.wraps(method)
+        def wrapper(request_handler: 'MyRequestHandler') -> None:
+            request_handler.run_admitted(route_class, functools.partial(method, request_handler))
+        return wrapper
+    return decorator
 
 
 def connect_my_handler(class_: type) -> type:
     """
-    Dynamically injects database connection and API key into a given class.
+    Dynamically injects the API key and admission control into a given class and warms up the rest in the background.
+
+    The database connections, catalog and templates are set on the class by parallel startup tasks,
+    so the server binds at once and answers probes while it warms up.
 
     Args:
         class_ (type): The class to inject attributes into.
@@ -30,26 +87,189 @@ def connect_my_handler(class_: type) -> type:
     Returns:
         type: The modified class.
     """
-    dotenv.load_dotenv()
-    connection, cursor = db.connect()
+    db.load_env()
     attributes = {
         'apikey': os.environ.get('API_KEY'),
-        'db_connection': connection,
-        'db_cursor': cursor,
+        'admission': admission.AdmissionController(),
+        'tracer': tracing.TraceExporter(
+            os.environ.get('TRACE_FILE', config.TRACE_FILE),
+            float(os.environ.get('TRACE_SAMPLE_RATE', config.TRACE_SAMPLE_RATE)),
+            config.TRACE_SLOW_SECONDS,
+        ).start(),
+        'warmup': warmup.Warmup(),
     }
     for name, attr in attributes.items():
         setattr(class_, name, attr)
+    startup_tasks = {
+        'templates': compile_templates,
+        'posters': open_poster_cache,
+        'group_commit': start_group_commit,
+        'database': connect_database,
+    }
+    class_.warmup.start(startup_tasks, class_)
     return class_
 
 
+def compile_templates() -> dict[str, object]:
+    """
+    Compile all templates once; they are not checked for changes afterwards.
+
+    Returns:
+        dict[str, object]: The template environment by handler attribute.
+    """
+    import jinja2
+
+    templates = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(TEMPLATE_FOLDER), autoescape=True, auto_reload=False,
+    )
+    for template_name in templates.list_templates():
+        templates.get_template(template_name)
+    return {'templates': templates}
+
+
+def open_poster_cache() -> dict[str, object]:
+    """
+    Open the poster cache, indexing the files left by previous runs.
+
+    Returns:
+        dict[str, object]: The poster cache by handler attribute.
+    """
+    hosts = os.environ.get('POSTER_HOSTS', config.POSTER_HOSTS).split(',')
+    return {'poster_cache': posters.PosterCache(
+        os.environ.get('POSTER_CACHE_DIR', config.POSTER_CACHE_DIR),
+        int(os.environ.get('POSTER_CACHE_MAX_BYTES', config.POSTER_CACHE_MAX_BYTES)),
+        frozenset(host.strip() for host in hosts if host.strip()),
+    )}
+
+
+def start_group_commit() -> dict[str, object]:
+    """
+    Start committing writes in batches if GROUP_COMMIT is set.
+
+    Returns:
+        dict[str, object]: No handler attributes, as db write helpers find the committer themselves.
+    """
+    if os.environ.get(config.GROUP_COMMIT_ENV) == '1':
+        GroupCommitter(
+            connect_committer,
+            float(os.environ.get('GROUP_COMMIT_MAX_DELAY', config.GROUP_COMMIT_MAX_DELAY)),
+            int(os.environ.get('GROUP_COMMIT_MAX_BATCH', config.GROUP_COMMIT_MAX_BATCH)),
+            float(os.environ.get('GROUP_COMMIT_TIMEOUT', config.GROUP_COMMIT_TIMEOUT)),
+        ).start()
+    return {}
+
+
+def connect_committer() -> psycopg.Connection:
+    """
+    Open the connection of the group committer.
+
+    Returns:
+        psycopg.Connection: The connection, whose batches of writes are bounded by the write timeouts.
+    """
+    # Batches of writes share a connection, so they are bounded by the write timeouts but not cancelled.
+    connection = db.connect()[0]
+    timeouts.set_limits(connection, timeouts.QueryLimits(*config.QUERY_TIMEOUTS[admission.WRITE]))
+    connection.commit()
+    return connection
+
+
+def connect_database() -> dict[str, object]:
+    """
+    Connect to the databases and load the catalog, following change notifications.
+
+    Returns:
+        dict[str, object]: The router, the query cache, the catalog and its indexes by handler attribute.
+    """
+    router, listener, cache = open_database()
+    return {'router': router, 'cache': cache, **create_catalog(router, listener)}
+
+
+@functools.cache
+def open_database() -> tuple[replicas.ReplicaRouter, invalidation.ChangeListener, Option[invalidation.TagCache]]:
+    """
+    Open the pools of the databases and start listening to change notifications, once for all warmup attempts.
+
+    Neither waits for the databases, which the pools and the listener keep reconnecting to.
+
+    Returns:
+        tuple[ReplicaRouter, ChangeListener, Optional[TagCache]]: The router, the listener and the query cache.
+    """
+    router = replicas.create_router()
+    listener = invalidation.ChangeListener(db.credentials(), router.max_lag if router.replicas else 0)
+    cache = None
+    if os.environ.get(config.CATALOG_CACHE_ENV, '1') == '1':
+        max_entries = int(os.environ.get('CATALOG_CACHE_MAX_ENTRIES', config.CATALOG_CACHE_MAX_ENTRIES))
+        cache = invalidation.TagCache(max_entries)
+        listener.subscribe(cache.invalidate)
+    listener.start()
+    return router, listener, cache
+
+
+def create_catalog(router: replicas.ReplicaRouter, listener: invalidation.ChangeListener) -> dict[str, object]:
+    """
+    Load the in-memory catalog with the indexes following its snapshots, refreshed on change notifications.
+
+    Changes of movies are numbered for the change feed by a sequencer in the background.
+
+    Returns once the casts of the similar movies index are loaded too. Nothing is started or subscribed
+    before the catalog is loaded, so a failed load can be retried.
+
+    Args:
+        router (replicas.ReplicaRouter): The router to read the catalog with.
+        listener (invalidation.ChangeListener): The listener of catalog change notifications.
+
+    Returns:
+        dict[str, object]: The catalog, its indexes and the sequencer of its changes by handler attribute.
+    """
+    similar_movies = similarity.SimilarityIndex(router)
+    completions = autocomplete.Autocomplete()
+    movie_catalog = catalog.Catalog(router).subscribe(similar_movies.update).subscribe(completions.update)
+    listener.subscribe(movie_catalog.load().start().invalidate).subscribe(similar_movies.invalidate)
+    changes = sequencer.ChangeSequencer(router, config.CHANGE_SEQUENCE_INTERVAL)
+    listener.subscribe(changes.start().invalidate)
+    similar_movies.start().loaded.wait()
+    return {
+        'catalog': movie_catalog, 'similar': similar_movies, 'completions': completions, 'sequencer': changes,
+    }
+
+
 class MyRequestHandler(BaseHTTPRequestHandler):
     """
     Custom request handler by Python's http.server module.
 
     Methods:
+        parse_request(self) -> bool: Parses the request line and headers and starts the trace of the request.
+        handle_one_request(self) -> None: Handles a request and exports its trace.
+        send_response(self, code: int, message: Optional[str] = None) -> None: Sends the status and Server-Timing.
+        read_session(self) -> Optional[str]: Reads the session id of the client from its cookie.
+        client_keys(self) -> tuple[str, ...]: Keys identifying the client for reading its own writes.
+        read_cached(self, key: Hashable, tags_of: Callable, query_function: Callable, args) -> object.
+        catalog_snapshot(self) -> CatalogSnapshot: Returns the in-memory catalog, up to date for recent writers.
+        read(self, query_function: Callable, args) -> object: Runs a read query on a replica or the primary.
+        write(self, query_function: Callable, args, kwargs) -> object: Runs a write query on the primary.
         get_query(self) -> dict: Extracts query parameters from the request path.
+        get_query_text(self, key: str) -> Optional[str]: Extracts a query parameter as the text sent.
+        run_admitted(self, route_class: Optional[str], handle_request: Callable) -> None: Runs a handler if admitted.
+        run_limited(self, handle_request: Callable) -> None: Runs a handler, answering stopped queries with an error.
+        shed(self, reason: str) -> None: Rejects a request for lack of capacity.
+        metrics(self) -> None: Sends the admission metrics.
+        healthz(self) -> None: Sends whether the server is alive.
+        readyz(self) -> None: Sends whether the server is warm and the database answers.
         handle_movie_rating_request(self) -> None: Processes requests for fetching movie ratings.
-        respond(self, code: int, body: Optional[str] = None, headers: Optional[dict] = None) -> None.
+        store_rating(self, movie: MovieRecord, movie_data: dict) -> None: Stores the OMDB ratings of a movie.
+        respond(self, code: int, body: Optional[str | bytes] = None, headers: Optional[dict] = None) -> None.
+        respond_json(self, code: int, payload: object) -> None: Sends a JSON response.
+        render_page(self, template_name: str, context) -> None: Renders a template with its variables and sends it.
+        get_path(self) -> str: Extracts the request path without the query string.
+        parse_uuid(self, raw_id: str) -> Optional[UUID]: Parses an id, responding with BAD_REQUEST if invalid.
+        movie_cast(self, movie_id: str) -> None: Sends the actors playing in a movie.
+        actor_movies(self, actor_id: str) -> None: Sends the filmography of an actor.
+        similar_movies(self, movie_id: str) -> None: Sends the movies most similar to a movie.
+        movie_changes(self) -> None: Sends the changes of movies after a sequence number.
+        top_movies(self) -> None: Sends the best rated movies.
+        autocomplete(self) -> None: Sends the movie titles and actor names starting with a prefix.
+        poster(self, movie_id: str) -> None: Sends a thumbnail of the poster of a movie from the disk cache.
+        send_poster(self, etag: str, thumbnail: BinaryIO) -> None: Sends a cached thumbnail or a byte range of it.
         movies_page(self) -> None: Renders and sends the page displaying all movies.
         main_page(self) -> None: Renders and sends the main page.
         actors_page(self) -> None: Renders and sends the page displaying all actors.
@@ -61,11 +281,147 @@ class MyRequestHandler(BaseHTTPRequestHandler):
         auth(self) -> bool: Checks if the request is authenticated.
         allow_and_auth(self) -> bool: Combines the checks for whether the request is allowed and authenticated.
         get_json_body(self) -> dict | None: Parses the JSON body from a POST request.
+        get_movie_body(self, partial: bool = False) -> dict | None: Parses and validates movie attributes.
+        get_query_movie_id(self, required: bool) -> tuple[bool, Optional[UUID]]: Parses the movie id from the query.
         do_POST(self) -> None: Handles POST requests by processing the addition of a new movie.
         do_DELETE(self) -> None: Handles DELETE requests by processing the deletion of a movie.
-        do_PUT(self) -> None: Handles PUT requests by processing the update of a movie.
+        do_PUT(self) -> None: Handles PUT requests by creating or replacing a movie in a single statement.
+        do_PATCH(self) -> None: Handles PATCH requests by updating some attributes of a movie.
     """
 
+    def parse_request(self) -> bool:
+        """
+        Parse the request line and headers, then start the trace of the request, continuing its traceparent if any.
+
+        Returns:
+            bool: True if the request was parsed, False if an error was sent.
+        """
+        self.new_session = False
+        parsed = super().parse_request()
+        if parsed:
+            self.status_code: Option[int] = None
+            self.session = self.read_session()
+            tracing.begin(self.headers.get(config.TRACEPARENT_HEADER))
+        return parsed
+
+    def handle_one_request(self) -> None:
+        """Handle a request, then export its trace if it is sampled or slow."""
+        super().handle_one_request()
+        timeouts.end()
+        trace = tracing.end()
+        if trace is not None:
+            self.tracer.export(trace, self.command, self.get_path(), self.status_code)
+
+    def send_response(self, code: int, message: Option[str] = None) -> None:
+        """
+        Send the status line with the Server-Timing header of the phases of the request so far.
+
+        The session cookie is set too if the request started a session.
+
+        Args:
+            code (int): The HTTP status code.
+            message (Optional[str]): The reason phrase, the standard one by default.
+        """
+        super().send_response(code, message)
+        if self.new_session:
+            self.send_header('Set-Cookie', f'{config.SESSION_COOKIE}={self.session}; Path=/; HttpOnly; SameSite=Lax')
+        trace = tracing.current()
+        if trace is not None:
+            self.status_code = code
+            self.send_header(config.SERVER_TIMING_HEADER, trace.server_timing())
+
+    def read_session(self) -> Option[str]:
+        """
+        Read the session id of the client from its cookie.
+
+        Returns:
+            Optional[str]: The session id, None if the request has no valid one.
+        """
+        cookies: SimpleCookie = SimpleCookie()
+        try:
+            cookies.load(self.headers.get('Cookie', ''))
+        except CookieError:
+            return None
+        session = cookies.get(config.SESSION_COOKIE)
+        if session is None or not SESSION_PATTERN.fullmatch(session.value):
+            return None
+        return session.value
+
+    def client_keys(self) -> tuple[str, ...]:
+        """
+        Identify the client by its session cookie; the API token may be shared by many clients.
+
+        Returns:
+            tuple[str, ...]: Keys under which the writes of the client are remembered.
+        """
+        return (self.session,) if self.session else ()
+
+    def read(self, query_function: Callable, *args: object) -> object:
+        """
+        Run a read query on a healthy replica, or on the primary within write requests and after recent writes.
+
+        Args:
+            query_function (Callable): Function of the db module taking a cursor and the args.
+            args (object): Additional arguments of the query function.
+
+        Returns:
+            object: The result of the query function.
+        """
+        return self.router.read(
+            query_function, *args,
+            client_keys=self.client_keys(), use_primary=self.command not in SAFE_METHODS,
+        )
+
+    def read_cached(
+        self, key: Hashable, tags_of: Callable[[object], Iterable[str]],
+        query_function: Callable, *args: object,
+    ) -> object:
+        """
+        Run a read query through the local cache, unless the client has to read its own recent writes.
+
+        Args:
+            key (Hashable): Key of the result in the cache.
+            tags_of (Callable[[object], Iterable[str]]): Function returning the tables and rows the result depends on.
+            query_function (Callable): Function of the db module taking a cursor and the args.
+            args (object): Additional arguments of the query function.
+
+        Returns:
+            object: The cached or fetched result of the query function.
+        """
+        if self.cache is None or self.router.wrote_recently(self.client_keys()):
+            return self.read(query_function, *args)
+        return self.cache.get_or_load(key, functools.partial(self.read, query_function, *args), tags_of)
+
+    def catalog_snapshot(self) -> catalog.CatalogSnapshot:
+        """
+        Return the in-memory catalog, caught up with the primary first if the client wrote recently.
+
+        Returns:
+            CatalogSnapshot: The catalog snapshot to answer the request with.
+        """
+        if self.router.wrote_recently(self.client_keys()):
+            self.sequencer.catch_up()
+            return self.catalog.refresh(use_primary=True)
+        return self.catalog.snapshot
+
+    def write(self, query_function: Callable, *args: object, **kwargs: object) -> object:
+        """
+        Run a write query on the primary.
+
+        Args:
+            query_function (Callable): Function of the db module taking a cursor, a connection and the args.
+            args (object): Additional arguments of the query function.
+            kwargs (object): Additional keyword arguments of the query function.
+
+        Returns:
+            object: The result of the query function.
+        """
+        # A client writing without a session gets one, so its next reads find its writes.
+        if self.session is None:
+            self.session = uuid4().hex
+            self.new_session = True
+        return self.router.write(query_function, *args, client_keys=self.client_keys(), **kwargs)
+
     def get_query(self) -> dict:
         """
         Extract query parameters from the request path.
@@ -87,11 +443,104 @@ class MyRequestHandler(BaseHTTPRequestHandler):
 
         return query
 
+    def get_query_text(self, key: str) -> Option[str]:
+        """
+        Extract a query parameter as the text sent, e.g. a title or a prefix, which get_query may turn into a number.
+
+        Args:
+            key (str): The name of the parameter.
+
+        Returns:
+            Optional[str]: The decoded value of the first parameter of the name, None if it is missing.
+        """
+        _, _, query_string = self.path.partition('?')
+        query_values = parse_qs(query_string).get(key)
+        return query_values[0] if query_values else None
+
+    def run_admitted(self, route_class: Option[str], handle_request: Callable[[], None]) -> None:
+        """
+        Handle a request once the server is warm, if its route class has capacity and the client is within its limit.
+
+        Only writes are rate limited per client.
+
+        Args:
+            route_class (Optional[str]): The route class of the request; None to handle it unconditionally.
+            handle_request (Callable[[], None]): Function handling the request.
+        """
+        if route_class is None:
+            handle_request()
+            return
+        if not self.warmup.ready.is_set():
+            self.respond(
+                config.SERVICE_UNAVAILABLE, 'server is warming up', headers=admission.retry_after(config.RETRY_AFTER),
+            )
+            return
+        if route_class == admission.WRITE:
+            wait = self.admission.limit_write(self.headers.get(config.AUTH_HEADER), self.client_address[0])
+            if wait:
+                self.respond(config.TOO_MANY_REQUESTS, 'too many writes', headers=admission.retry_after(wait))
+                return
+        timeouts.begin(timeouts.QueryLimits(*config.QUERY_TIMEOUTS[route_class]), self.connection)
+        self.admission.run(route_class, functools.partial(self.run_limited, handle_request), self.shed)
+
+    def run_limited(self, handle_request: Callable[[], None]) -> None:
+        """
+        Handle a request whose queries are limited by the timeouts of its route class.
+
+        Queries over their statement timeout get GATEWAY_TIMEOUT, lock and connection waits over their timeouts
+        get SERVICE_UNAVAILABLE with a Retry-After, and queries cancelled for a gone client get no response.
+
+        Args:
+            handle_request (Callable[[], None]): Function handling the request.
+        """
+        try:
+            handle_request()
+        except psycopg.errors.QueryCanceled:
+            if timeouts.disconnected(self.connection):
+                self.close_connection = True
+                return
+            self.respond(config.GATEWAY_TIMEOUT, 'query took too long')
+        except timeouts.BUSY_ERRORS:
+            self.respond(
+                config.SERVICE_UNAVAILABLE, 'database is busy', headers=admission.retry_after(config.RETRY_AFTER),
+            )
+
+    def shed(self, reason: str) -> None:
+        """
+        Reject a request for lack of capacity, asking the client to retry later.
+
+        Args:
+            reason (str): Why the request was rejected.
+        """
+        self.respond(
+            config.SERVICE_UNAVAILABLE, f'server is over capacity: {reason}',
+            headers=admission.retry_after(config.RETRY_AFTER),
+        )
+
+    def metrics(self) -> None:
+        """Send the counters of admitted and shed requests and the load of each route class."""
+        self.respond(config.OK, self.admission.metrics(), content_header=config.METRICS_CONTENT_HEADER)
+
+    def healthz(self) -> None:
+        """Send OK while the server is alive, even while warmup tasks fail and are retried, as reported by readyz."""
+        self.respond(config.OK, 'ok')
+
+    def readyz(self) -> None:
+        """Send OK with the warmup durations once the server is warm and the primary database answers, else errors."""
+        ready = self.warmup.ready.is_set()
+        if ready:
+            try:
+                self.router.read(db.check_connection, use_primary=True)
+            except replicas.READ_ERRORS:
+                ready = False
+        self.respond_json(
+            config.OK if ready else config.SERVICE_UNAVAILABLE,
+            {'ready': ready, 'warmup': self.warmup.durations, 'errors': self.warmup.errors},
+        )
+
     def handle_movie_rating_request(self) -> None:
         """Process requests for fetching movie ratings."""
-        query = self.get_query()
-        movie_title = query.get('title')
-        movies = db.get_movies(self.db_cursor)
+        movie_title = self.get_query_text('title')
         if not movie_title:
             self.respond(config.BAD_REQUEST, 'Movie title is required')
             return
@@ -102,59 +551,312 @@ class MyRequestHandler(BaseHTTPRequestHandler):
             self.respond(config.SERVER_ERROR, f'Failed to fetch movie details: {api_error}')
             return
 
-        template = jinja_env.get_template('index.html')
-        rendered_body = template.render(movies=movies, movie_data=movie_data)
-        self.respond(config.OK, rendered_body)
+        # Movies of the catalog show their own poster, through the poster proxy if its host is allowed, instead of
+        # the OMDB one.
+        movie = self.catalog.snapshot.movies_by_title.get(movie_title)
+        if movie is not None:
+            self.store_rating(movie, movie_data)
+        self.render_page('index.html', movie_data=movie_data, movie=movie, poster_link=self.poster_cache.link)
+
+    def store_rating(self, movie: catalog.MovieRecord, movie_data: dict) -> None:
+        """
+        Store the ratings of an OMDB response for a movie of the catalog, unless they are already stored.
+
+        Args:
+            movie (catalog.MovieRecord): The movie the ratings were fetched for.
+            movie_data (dict): The OMDB response.
+        """
+        movie_rating = rating.parse_rating(movie_data)
+        stored = tuple(getattr(movie, key) for key in MOVIE_RATING_KEYS)
+        if movie_rating is not None and movie_rating != stored:
+            self.write(db.set_movie_rating, movie.id, movie_rating)
 
-    def respond(self, code: int, body: Option[str] = None, headers: Option[dict] = None) -> None:
+    def respond(
+        self, code: int, body: Option[str | bytes] = None, headers: Option[dict] = None,
+        content_header: tuple[str, str] = config.CONTENT_HEADER,
+    ) -> None:
         """
         Send an HTTP response with the specified status code and message.
 
         Args:
             code (int): The HTTP status code.
-            body (Optional[str]): The response body. Defaults to None.
+            body (Optional[str | bytes]): The response body. Defaults to None.
             headers (Optional[dict]): Additional headers to include in the response. Defaults to None.
+            content_header (tuple[str, str]): The Content-Type header of the body. Defaults to text/html.
         """
         self.send_response(code)
-        self.send_header(*config.CONTENT_HEADER)
+        self.send_header(*content_header)
         if headers:
             for header_key, header_value in headers.items():
                 self.send_header(header_key, header_value)
         self.end_headers()
         if body:
-            self.wfile.write(body.encode())
+            self.wfile.write(body if isinstance(body, bytes) else body.encode())
 
-    def movies_page(self) -> None:
-        """Render and sends the page displaying all movies."""
-        movies = db.get_movies(self.db_cursor)
-        template = jinja_env.get_template('movies.html')
-        rendered_body = template.render(movies=movies)
+    def respond_json(self, code: int, payload: object) -> None:
+        """
+        Send a JSON response, serializing UUIDs and other non-JSON values as strings.
+
+        Args:
+            code (int): The HTTP status code.
+            payload (object): The value to serialize into the response body.
+        """
+        self.respond(code, json.dumps(payload, default=str), content_header=config.JSON_CONTENT_HEADER)
+
+    def render_page(self, template_name: str, **context: object) -> None:
+        """
+        Render a template and send it with OK.
+
+        Args:
+            template_name (str): The name of the template in the templates folder.
+            context (object): The variables of the template.
+        """
+        with tracing.span('render', template_name):
+            rendered_body = self.templates.get_template(template_name).render(**context)
         self.respond(config.OK, rendered_body)
 
+    def get_path(self) -> str:
+        """
+        Extract the request path without the query string.
+
+        Returns:
+            str: The request path.
+        """
+        return self.path.split('?', 1)[0]
+
+    def parse_uuid(self, raw_id: str) -> Option[UUID]:
+        """
+        Parse an id from the request, responding with BAD_REQUEST if it is not a valid UUID.
+
+        Args:
+            raw_id (str): The id to parse.
+
+        Returns:
+            Optional[UUID]: The parsed id or None if it is invalid.
+        """
+        try:
+            return UUID(raw_id)
+        except ValueError:
+            self.respond(config.BAD_REQUEST, f'{raw_id} is not a valid id')
+            return None
+
+    def movie_cast(self, movie_id: str) -> None:
+        """
+        Send the actors playing in a movie as JSON.
+
+        Args:
+            movie_id (str): The id of the movie from the request path.
+        """
+        movie_uuid = self.parse_uuid(movie_id)
+        if movie_uuid is None:
+            return
+        cast = self.read_cached(
+            ('cast', movie_uuid),
+            lambda rows: invalidation.tag_rows('actor', (row[2] for row in rows)) | {f'movie:{movie_uuid}'},
+            db.get_movie_cast, movie_uuid,
+        )
+        self.respond_json(config.OK, [
+            {'id': actor_id, 'full_name': full_name, 'birth_date': birth_date}
+            for full_name, birth_date, actor_id in cast
+        ])
+
+    def actor_movies(self, actor_id: str) -> None:
+        """
+        Send the filmography of an actor as JSON.
+
+        Args:
+            actor_id (str): The id of the actor from the request path.
+        """
+        actor_uuid = self.parse_uuid(actor_id)
+        if actor_uuid is None:
+            return
+        movies = self.read_cached(
+            ('filmography', actor_uuid),
+            lambda rows: invalidation.tag_rows('movie', (row[3] for row in rows)) | {f'actor:{actor_uuid}'},
+            db.get_actor_movies, actor_uuid,
+        )
+        self.respond_json(config.OK, [
+            {'id': movie_id, 'title': title, 'year': year, 'genre': genre}
+            for title, year, genre, movie_id in movies
+        ])
+
+    def similar_movies(self, movie_id: str) -> None:
+        """
+        Send the movies most similar to a movie by genres, cast and release year as JSON.
+
+        Args:
+            movie_id (str): The id of the movie from the request path.
+        """
+        movie_uuid = self.parse_uuid(movie_id)
+        if movie_uuid is None:
+            return
+        limit = self.get_query().get('limit', config.SIMILAR_DEFAULT_LIMIT)
+        if not (isinstance(limit, int) and 0 < limit <= config.SIMILAR_MAX_LIMIT):
+            self.respond(config.BAD_REQUEST, f'limit should be between 1 and {config.SIMILAR_MAX_LIMIT}')
+            return
+        snapshot = self.catalog_snapshot()
+        if movie_uuid not in snapshot.movies_by_id:
+            self.respond(config.NOT_FOUND, f'movie {movie_id} not found')
+            return
+        # The index may run ahead of or behind this snapshot by a change.
+        similar = [
+            (snapshot.movies_by_id[similar_id], score)
+            for similar_id, score in self.similar.similar(movie_uuid, limit)
+            if similar_id in snapshot.movies_by_id
+        ]
+        self.respond_json(config.OK, [
+            {'id': movie.id, 'title': movie.title, 'genre': movie.genre, 'year': movie.year, 'score': round(score, 4)}
+            for movie, score in similar
+        ])
+
+    def movie_changes(self) -> None:
+        """Send the latest change of each movie changed after the 'since' sequence number as JSON."""
+        query = self.get_query()
+        since = query.get('since', 0)
+        limit = query.get('limit', config.CHANGES_DEFAULT_LIMIT)
+        if not (isinstance(since, int) and isinstance(limit, int) and 0 < limit <= config.CHANGES_MAX_LIMIT):
+            self.respond(
+                config.BAD_REQUEST,
+                f'since should be a sequence number and limit between 1 and {config.CHANGES_MAX_LIMIT}',
+            )
+            return
+        changes = self.read(db.get_movie_changes, since, limit)
+        self.respond_json(config.OK, {
+            'changes': [
+                {key: change_value for key, change_value in zip(CHANGE_KEYS, change) if change_value is not None}
+                for change in changes
+            ],
+            'next_since': changes[-1][0] if changes else since,
+            'has_more': len(changes) == limit,
+        })
+
+    def top_movies(self) -> None:
+        """Send the leaderboard of the best rated movies, by IMDb rating then votes, as JSON."""
+        limit = self.get_query().get('limit', config.TOP_DEFAULT_LIMIT)
+        if not (isinstance(limit, int) and 0 < limit <= config.TOP_MAX_LIMIT):
+            self.respond(config.BAD_REQUEST, f'limit should be between 1 and {config.TOP_MAX_LIMIT}')
+            return
+        self.respond_json(config.OK, [
+            {
+                'id': movie.id, 'title': movie.title, 'genre': movie.genre, 'year': movie.year,
+                **{key: getattr(movie, key) for key in MOVIE_RATING_KEYS},
+            }
+            for movie in itertools.islice(self.catalog_snapshot().movies_by_rating, limit)
+        ])
+
+    def autocomplete(self) -> None:
+        """Send the movie titles and actor names starting with the 'prefix' query parameter as JSON."""
+        query = self.get_query()
+        limit = query.get('limit', config.AUTOCOMPLETE_DEFAULT_LIMIT)
+        if not (isinstance(limit, int) and 0 < limit <= config.AUTOCOMPLETE_MAX_LIMIT):
+            self.respond(config.BAD_REQUEST, f'limit should be between 1 and {config.AUTOCOMPLETE_MAX_LIMIT}')
+            return
+        self.catalog_snapshot()
+        movies, actors = self.completions.search(self.get_query_text('prefix') or '', limit)
+        self.respond_json(config.OK, {
+            'movies': [{'id': movie.id, 'title': movie.title} for movie in movies],
+            'actors': [{'id': actor.id, 'full_name': actor.full_name} for actor in actors],
+        })
+
+    def poster(self, movie_id: str) -> None:
+        """
+        Send a thumbnail of the poster of a movie, 'w' pixels wide at most, fetched once from its origin.
+
+        Cached thumbnails are served as reads; only misses, which call the origin, need external capacity.
+
+        Args:
+            movie_id (str): The id of the movie from the request path.
+        """
+        movie_uuid = self.parse_uuid(movie_id)
+        if movie_uuid is None:
+            return
+        width = self.get_query().get('w', config.POSTER_WIDTHS[-1])
+        if not (isinstance(width, int) and width > 0):
+            self.respond(config.BAD_REQUEST, 'w should be a positive width in pixels')
+            return
+        movie = self.catalog_snapshot().movies_by_id.get(movie_uuid)
+        if movie is None or not self.poster_cache.allows(movie.poster):
+            self.respond(config.NOT_FOUND, f'poster of movie {movie_id} not found')
+            return
+        try:
+            etag, thumbnail = self.poster_cache.open(
+                movie.poster, posters.fit_width(width), functools.partial(self.admission.admit, admission.EXTERNAL),
+            )
+        except posters.PosterError as poster_error:
+            self.respond(config.BAD_GATEWAY, f'Failed to fetch the poster: {poster_error}')
+            return
+        except admission.Overloaded as overloaded:
+            self.shed(overloaded.reason)
+            return
+        with thumbnail:
+            self.send_poster(etag, thumbnail)
+
+    def send_poster(self, etag: str, thumbnail: BinaryIO) -> None:
+        """
+        Send a cached thumbnail, or the byte range of it asked by the Range header, to be cached by the client.
+
+        Args:
+            etag (str): The hash of the content of the thumbnail, used as its ETag.
+            thumbnail (BinaryIO): The open thumbnail.
+        """
+        headers = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': f'public, max-age={config.POSTER_MAX_AGE}, immutable',
+            'Accept-Ranges': 'bytes',
+        }
+        if self.headers.get('If-None-Match') == headers['ETag']:
+            self.respond(config.NOT_MODIFIED, headers=headers)
+            return
+        size = thumbnail.seek(0, os.SEEK_END)
+        try:
+            byte_range = posters.parse_range(self.headers.get('Range'), size)
+        except posters.RangeError:
+            self.respond(config.RANGE_NOT_SATISFIABLE, headers={'Content-Range': f'bytes */{size}'})
+            return
+        code = config.OK
+        first, last = 0, size - 1
+        if byte_range is not None:
+            first, last = byte_range
+            headers['Content-Range'] = f'bytes {first}-{last}/{size}'
+            code = config.PARTIAL_CONTENT
+        headers[config.CONTENT_LEN_HEADER] = str(last - first + 1)
+        thumbnail.seek(first)
+        self.respond(code, thumbnail.read(last - first + 1), headers, content_header=config.POSTER_CONTENT_HEADER)
+
+    def movies_page(self) -> None:
+        """Render and sends the page displaying movies matching the title, genre and year filters, sorted if asked."""
+        query = self.get_query()
+        snapshot = self.catalog_snapshot()
+        title = self.get_query_text('title')
+        if title is not None:
+            movie = snapshot.movies_by_title.get(title)
+            movies = (movie,) if movie else ()
+        else:
+            movies = snapshot.find_movies(
+                genre=self.get_query_text('genre'),
+                year=query.get('year'),
+                by_rating=query.get('sort') == 'rating',
+            )
+        self.render_page('movies.html', movies=movies, poster_link=self.poster_cache.link)
+
     def main_page(self) -> None:
-        """Render and sends the main page."""
-        movies = db.get_movies(self.db_cursor)
-        template = jinja_env.get_template('index.html')
-        rendered_body = template.render(movies=movies)
-        self.respond(config.OK, rendered_body)
+        """Render and sends the main page; titles are completed with the autocomplete endpoint."""
+        self.render_page('index.html')
 
     def actors_page(self) -> None:
         """Render and sends the page displaying all actors."""
-        actors = db.get_actors(self.db_cursor)
-        template = jinja_env.get_template('actors.html')
-        rendered_body = template.render(actors=actors)
-        self.respond(config.OK, rendered_body)
+        actors = self.catalog_snapshot().actors.values()
+        self.render_page('actors.html', actors=actors)
 
     def do_GET(self) -> None:
         """Handle GET requests and routes them to the appropriate handler based on the request path."""
-        if self.path.startswith('/rating'):
-            self.handle_movie_rating_request()
-        elif self.path.startswith('/actors'):
-            self.actors_page()
-        elif self.path.startswith('/movies'):
-            self.movies_page()
-        else:
-            self.main_page()
+        path = self.get_path()
+        for pattern, handler_name, route_class in GET_ROUTES:
+            match = pattern.match(path)
+            if match:
+                self.run_admitted(route_class, functools.partial(getattr(self, handler_name), **match.groupdict()))
+                return
+        self.run_admitted(admission.READ, self.main_page)
 
     def do_HEAD(self) -> None:
         """Handle HEAD requests by sending an OK response."""
@@ -178,7 +880,12 @@ class MyRequestHandler(BaseHTTPRequestHandler):
         """
         if config.AUTH_HEADER not in self.headers.keys():
             return False
-        return db.check_token(self.db_cursor, self.headers[config.AUTH_HEADER])
+        token = self.headers[config.AUTH_HEADER]
+        with tracing.span('auth'):
+            valid = self.read(db.check_token, token)
+        if valid:
+            self.admission.verified(token)
+        return valid
 
     def allow(self) -> bool:
         """
@@ -232,69 +939,128 @@ class MyRequestHandler(BaseHTTPRequestHandler):
             self.respond(config.BAD_REQUEST, f'failed parsing json: {error}')
             return None
 
+    def get_movie_body(self, partial: bool = False) -> dict | None:
+        """
+        Parse and validate the movie attributes from the JSON body.
+
+        Args:
+            partial (bool): Whether a subset of the movie attributes is allowed. Defaults to False.
+
+        Returns:
+            dict | None: The movie attributes or None if the body is invalid.
+        """
+        body = self.get_json_body()
+        if body is None:
+            return None
+        if not isinstance(body, dict):
+            self.respond(config.BAD_REQUEST, 'movie should be a json object')
+            return None
+        unknown = set(body.keys()) - config.MOVIE_REQUIRED_KEYS
+        if unknown:
+            self.respond(config.BAD_REQUEST, f'keys {unknown} are not defined for instance')
+            return None
+        if not body or not (partial or set(body.keys()) == config.MOVIE_REQUIRED_KEYS):
+            self.respond(config.BAD_REQUEST, f'keys {config.MOVIE_REQUIRED_KEYS} are required')
+            return None
+        return body
+
+    def get_query_movie_id(self, required: bool) -> tuple[bool, Option[UUID]]:
+        """
+        Parse the optional movie id from the query string.
+
+        Args:
+            required (bool): Whether a missing id is an error.
+
+        Returns:
+            tuple[bool, Optional[UUID]]: Whether the id is valid and the parsed id, if any.
+        """
+        movie_key = 'id'
+        query = self.get_query()
+        if movie_key not in query.keys():
+            if required:
+                self.respond(config.BAD_REQUEST, 'you should have provided movie in query')
+            return not required, None
+        movie_id = self.parse_uuid(str(query[movie_key]))
+        return movie_id is not None, movie_id
+
+    @admitted(admission.WRITE)
     def do_POST(self) -> None:
         """Handle POST requests by processing the addition of a new movie."""
         if not self.allow_and_auth():
             return
-        body = self.get_json_body()
+        body = self.get_movie_body()
         if body is None:
             return
-        if set(body.keys()) != config.MOVIE_REQUIRED_KEYS:
-            self.respond(config.BAD_REQUEST, f'keys {config.MOVIE_REQUIRED_KEYS} are required')
-            return
-        keys = [body[key] for key in config.MOVIE_KEYS]
         try:
-            response = db.add_movie(self.db_cursor, self.db_connection, *keys)
+            response = self.write(db.add_movie, **body)
         except psycopg.errors.UniqueViolation:
             self.respond(config.OK, f'record movie={body["title"]} already exists')
-            self.db_connection.rollback()
             return
         if response:
             self.respond(config.CREATED, body=f'{response}')
         else:
             self.respond(config.SERVER_ERROR, f'failed to create record movie={body["title"]}')
 
+    @admitted(admission.WRITE)
     def do_DELETE(self) -> None:
-        """Handle DELETE requests by processing the deletion of a movie."""
+        """Handle DELETE requests by deleting a movie with a single statement, whose row count tells if it existed."""
         if not self.allow_and_auth():
             return
-        query = self.get_query()
-        movie_key = 'id'
-        if movie_key not in query.keys():
-            self.respond(config.BAD_REQUEST, 'you should have provided movie in query')
-            return
-        if UUID(query[movie_key]) not in db.get_movies_id(self.db_cursor):
-            print(db.get_movies_id(self.db_cursor))
-            self.respond(config.ACCEPTED, f'movie {query[movie_key]} is not present in database')
+        is_valid, movie_id = self.get_query_movie_id(required=True)
+        if not is_valid:
             return
-        if db.delete_movie(self.db_cursor, self.db_connection, query[movie_key]):
+        if self.write(db.delete_movie, movie_id):
             self.respond(config.NO_CONTENT)
         else:
-            self.respond(config.SERVER_ERROR, f'movie {query[movie_key]} was not deleted')
+            self.respond(config.ACCEPTED, f'movie {movie_id} is not present in database')
 
+    @admitted(admission.WRITE)
     def do_PUT(self) -> None:
-        """Handle PUT requests by processing the update of a movie."""
+        """Handle PUT requests by creating or replacing a movie with a single upsert statement."""
         if not self.allow_and_auth():
             return
-        query = self.get_query()
-        movie_key = 'id'
-        if movie_key not in query.keys() or db.check_movie(self.db_cursor, query[movie_key]):
-            self.do_POST()
+        is_valid, movie_id = self.get_query_movie_id(required=False)
+        if not is_valid:
             return
-        movie = query[movie_key]
-        body = self.get_json_body()
-        for attr in body.keys():
-            if attr not in config.MOVIE_REQUIRED_KEYS:
-                self.respond(config.BAD_REQUEST, f'key {attr} is not defined for instance')
-                return
-        if db.update_movie(self.db_cursor, self.db_connection, body, movie):
-            self.respond(config.OK, f'movie {movie} was updated')
+        body = self.get_movie_body()
+        if body is None:
+            return
+        try:
+            upserted_id, created = self.write(db.upsert_movie, body, movie_id)
+        except psycopg.errors.UniqueViolation:
+            self.respond(config.CONFLICT, f'record movie={body["title"]} already exists')
+            return
+        if created:
+            self.respond(config.CREATED, body=f'{upserted_id}')
+        else:
+            self.respond(config.OK, f'movie {upserted_id} was updated')
+
+    @admitted(admission.WRITE)
+    def do_PATCH(self) -> None:
+        """Handle PATCH requests by updating the given attributes of an existing movie."""
+        if not self.allow_and_auth():
+            return
+        is_valid, movie_id = self.get_query_movie_id(required=True)
+        if not is_valid:
+            return
+        body = self.get_movie_body(partial=True)
+        if body is None:
+            return
+        try:
+            is_updated = self.write(db.update_movie, body, movie_id)
+        except psycopg.errors.UniqueViolation:
+            self.respond(config.CONFLICT, f'record movie={body["title"]} already exists')
+            return
+        if is_updated:
+            self.respond(config.OK, f'movie {movie_id} was updated')
         else:
-            self.respond(config.SERVER_ERROR, f'movie {movie} was not updated')
+            self.respond(config.NOT_FOUND, f'movie {movie_id} is not present in database')
 
 
 if __name__ == '__main__':
-    server = ThreadingHTTPServer((config.HOST, config.PORT), connect_my_handler(MyRequestHandler))
+    server = admission.BoundedThreadingHTTPServer(
+        (config.HOST, config.PORT), connect_my_handler(MyRequestHandler), config.MAX_CONNECTIONS,
+    )
     print(f'Server started at http://{config.HOST}:{config.PORT}')
     try:
         server.serve_forever()
@@ -0,0 +1,516 @@
+"""A module ranking movies similar to a movie by shared genres, shared cast and release year proximity."""
+
+import array
+import threading
+import time
+from typing import Iterable, Iterator, Optional
+from uuid import UUID
+
+import numpy
+
+import config
+import db
+from catalog import GENRE_SEPARATOR, CatalogSnapshot, MovieRecord
+from replicas import READ_ERRORS, ReplicaRouter
+
+WORD_BITS = 64
+WORD_MASK = (1 << WORD_BITS) - 1
+MIN_CAPACITY = 1024
+REBUILD_REMOVED_SHARE = 0.5
+MOVIE_TAG = 'movie:'
+NO_ID = UUID(int=0)
+EMPTY = numpy.zeros(0, dtype=numpy.int32)
+
+
+class SparseRows:
+    """
+    Rows of a sparse 0/1 matrix in compressed sparse row (CSR) arrays, each row listing its nonzero columns.
+
+    Rows changed after the arrays were built are kept aside and replace their row until the arrays are compacted.
+    """
+
+    def __init__(self, rows: numpy.ndarray, columns: numpy.ndarray, size: int) -> None:
+        """
+        Build the matrix from the coordinates of its nonzero entries.
+
+        Args:
+            rows (numpy.ndarray): Row of each entry.
+            columns (numpy.ndarray): Column of each entry.
+            size (int): Number of rows.
+        """
+        order = numpy.argsort(rows, kind='stable')
+        self._pointers = numpy.zeros(size + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(rows, minlength=size), out=self._pointers[1:])
+        self._columns = columns[order].astype(numpy.int32)
+        self._changed: dict[int, numpy.ndarray] = {}
+
+    def get(self, row: int) -> numpy.ndarray:
+        """
+        Return the columns of a row.
+
+        Args:
+            row (int): The row.
+
+        Returns:
+            numpy.ndarray: The columns of the nonzero entries of the row.
+        """
+        changed = self._changed.get(row)
+        if changed is not None:
+            return changed
+        if row + 1 < len(self._pointers):
+            return self._columns[self._pointers[row]:self._pointers[row + 1]]
+        return EMPTY
+
+    def set(self, row: int, columns: numpy.ndarray) -> None:
+        """
+        Replace the columns of a row, compacting the arrays once a large share of rows changed.
+
+        Args:
+            row (int): The row.
+            columns (numpy.ndarray): The columns of the nonzero entries of the row.
+        """
+        self._changed[row] = columns
+        if len(self._changed) > max(len(self._pointers), MIN_CAPACITY) // 2:
+            self._compact()
+
+    def _compact(self) -> None:
+        size = max(len(self._pointers) - 1, max(self._changed) + 1)
+        rows = [self.get(row) for row in range(size)]
+        self._pointers = numpy.zeros(len(rows) + 1, dtype=numpy.int64)
+        numpy.cumsum([len(columns) for columns in rows], out=self._pointers[1:])
+        self._columns = numpy.concatenate(rows)
+        self._changed = {}
+
+
+class MovieFeatures:
+    """
+    Dense feature columns of the movies, one row per position: genre combination, release year and cast size.
+
+    Genre combinations and years are stored as codes into small tables, as few distinct values exist, so a movie
+    is compared with the distinct values only and the scores are gathered for all positions at once. Positions
+    of removed movies are kept, and reused if the movie comes back, until the features are rebuilt.
+    """
+
+    def __init__(self, movies: Iterable[MovieRecord]) -> None:
+        """
+        Build the features of the movies.
+
+        Args:
+            movies (Iterable[MovieRecord]): The movies of the catalog.
+        """
+        movies = list(movies)
+        self._ids = [movie.id for movie in movies]
+        self._positions = {movie_id: position for position, movie_id in enumerate(self._ids)}
+        self._genre_bits: dict[str, int] = {}
+        self._genre_codes: dict[Optional[str], int] = {}
+        self._year_codes: dict[Optional[int], int] = {}
+        self._tables: Optional[tuple[numpy.ndarray, numpy.ndarray]] = None
+        self._removed = 0
+        capacity = max(len(movies), MIN_CAPACITY)
+        genres = numpy.array([self._code(self._genre_codes, movie.genre) for movie in movies], dtype=numpy.int32)
+        years = numpy.array([self._code(self._year_codes, movie.year) for movie in movies], dtype=numpy.int32)
+        self._genres = padded(genres, capacity)
+        self._years = padded(years, capacity)
+        self._alive = padded(numpy.ones(len(movies), dtype=bool), capacity)
+        self.cast_sizes = numpy.zeros(capacity, dtype=numpy.float32)
+
+    @property
+    def size(self) -> int:
+        """
+        Count the positions in use, removed movies included.
+
+        Returns:
+            int: Number of positions.
+        """
+        return len(self._ids)
+
+    @property
+    def removed_share(self) -> float:
+        """
+        Measure the share of positions held by removed movies.
+
+        Returns:
+            float: Share of removed movies among all positions.
+        """
+        return self._removed / max(len(self._ids), 1)
+
+    def position(self, movie_id: UUID) -> Optional[int]:
+        """
+        Find the position of a movie of the catalog.
+
+        Args:
+            movie_id (UUID): The unique identifier of the movie.
+
+        Returns:
+            Optional[int]: The position, or None if the movie is not in the catalog.
+        """
+        position = self._positions.get(movie_id)
+        if position is None or not self._alive[position]:
+            return None
+        return position
+
+    def movie_id(self, position: int) -> UUID:
+        """
+        Find the movie at a position.
+
+        Args:
+            position (int): The position.
+
+        Returns:
+            UUID: The unique identifier of the movie.
+        """
+        return self._ids[position]
+
+    def set_movie(self, movie: MovieRecord) -> None:
+        """
+        Add a movie or update its features.
+
+        Args:
+            movie (MovieRecord): The new version of the movie.
+        """
+        position = self._positions.get(movie.id)
+        if position is None:
+            position = len(self._ids)
+            if position == len(self._alive):
+                self._grow()
+            self._positions[movie.id] = position
+            self._ids.append(movie.id)
+        elif not self._alive[position]:
+            self._removed -= 1
+        self._genres[position] = self._code(self._genre_codes, movie.genre)
+        self._years[position] = self._code(self._year_codes, movie.year)
+        self._alive[position] = True
+
+    def remove(self, movie_id: UUID) -> None:
+        """
+        Remove a movie, keeping its position.
+
+        Args:
+            movie_id (UUID): The unique identifier of the movie.
+        """
+        position = self.position(movie_id)
+        if position is not None:
+            self._alive[position] = False
+            self._removed += 1
+
+    def scores(self, position: int) -> numpy.ndarray:
+        """
+        Score all movies by genres shared with the movie at a position and by release year proximity.
+
+        Args:
+            position (int): The position of the movie to compare with.
+
+        Returns:
+            numpy.ndarray: Score of each position; -inf for the movie itself and removed movies.
+        """
+        genre_scores, year_scores = self._value_scores(position)
+        size = len(self._ids)
+        scores = genre_scores.take(self._genres[:size])
+        scores += year_scores.take(self._years[:size])
+        scores[~self._alive[:size]] = -numpy.inf
+        scores[position] = -numpy.inf
+        return scores
+
+    def _code(self, codes: dict, feature_value: object) -> int:
+        code = codes.get(feature_value)
+        if code is None:
+            code = codes.setdefault(feature_value, len(codes))
+            self._tables = None
+        return code
+
+    def _value_scores(self, position: int) -> tuple[numpy.ndarray, numpy.ndarray]:
+        if self._tables is None:
+            masks = genre_masks(self._genre_codes, self._genre_bits)
+            self._tables = (masks, numpy.array(list(self._year_codes), dtype=numpy.float32))
+        masks, years = self._tables
+        mask = masks[self._genres[position]]
+        shared = numpy.bitwise_count(masks & mask).sum(axis=1, dtype=numpy.float32)
+        union = numpy.bitwise_count(masks | mask).sum(axis=1, dtype=numpy.float32)
+        year_distance = numpy.abs(years - years[self._years[position]]) / config.SIMILAR_YEAR_SCALE
+        return (
+            shared / numpy.maximum(union, 1) * config.SIMILAR_GENRE_WEIGHT,
+            numpy.nan_to_num(config.SIMILAR_YEAR_WEIGHT / (1 + year_distance)),
+        )
+
+    def _grow(self) -> None:
+        capacity = len(self._alive) * 2
+        self._genres = padded(self._genres, capacity)
+        self._years = padded(self._years, capacity)
+        self._alive = padded(self._alive, capacity)
+        self.cast_sizes = padded(self.cast_sizes, capacity)
+
+
+class SimilarityIndex:
+    """
+    Movie features of the catalog scored with vectorized NumPy operations to rank similar movies.
+
+    Genres and years are dense columns compared with every movie at once, while the cast is a sparse
+    movie-actor matrix, so only movies sharing an actor get a cast score. Movies follow the catalog
+    snapshots and casts are reloaded on movie_actor change notifications.
+    """
+
+    def __init__(self, router: ReplicaRouter) -> None:
+        """
+        Initialize an empty index.
+
+        Args:
+            router (ReplicaRouter): The router to read the casts with.
+        """
+        self._router = router
+        self._lock = threading.Lock()
+        self._stale = threading.Event()
+        self._stale_casts: Optional[set[UUID]] = None
+        self._generation = 0
+        self._actor_codes: dict[UUID, int] = {}
+        self._features = MovieFeatures(())
+        self._actors_by_movie = SparseRows(EMPTY, EMPTY, 0)
+        self._movies_by_actor = SparseRows(EMPTY, EMPTY, 0)
+        self.loaded = threading.Event()
+
+    def update(self, snapshot: CatalogSnapshot, changes: Optional[list[tuple]]) -> None:
+        """
+        Follow a new catalog snapshot, rebuilding the features when it was reloaded or after many removals.
+
+        Args:
+            snapshot (CatalogSnapshot): The new snapshot.
+            changes (Optional[list[tuple]]): Rows of db.get_movie_changes applied; None if the catalog was reloaded.
+        """
+        with self._lock:
+            if changes is None or self._features.removed_share > REBUILD_REMOVED_SHARE:
+                self._rebuild(snapshot)
+                return
+            changed_ids = {change[1] for change in changes}
+            for movie_id in changed_ids:
+                movie = snapshot.movies_by_id.get(movie_id)
+                if movie is None:
+                    self._features.remove(movie_id)
+                else:
+                    self._features.set_movie(movie)
+        # The cast of a movie may have been read before the movie joined the index.
+        self._mark_stale(changed_ids)
+
+    def invalidate(self, table: Optional[str], tags: Optional[frozenset[str]]) -> None:
+        """
+        Mark casts stale on a change notification; the reload thread then reads them again.
+
+        Args:
+            table (Optional[str]): The changed table; None if changes may have been missed.
+            tags (Optional[frozenset[str]]): Tags of the changed rows; None if too many rows changed.
+        """
+        if table is None:
+            self._mark_stale(None)
+        elif table == 'movie_actor':
+            self._mark_stale(None if tags is None else movie_ids_of(tags))
+
+    def similar(self, movie_id: UUID, limit: int) -> list[tuple[UUID, float]]:
+        """
+        Rank the movies most similar to a movie.
+
+        Args:
+            movie_id (UUID): The unique identifier of the movie.
+            limit (int): The maximum number of movies to return.
+
+        Returns:
+            list[tuple[UUID, float]]: Ids and scores of the similar movies, best first; empty if the movie is unknown.
+        """
+        with self._lock:
+            position = self._features.position(movie_id)
+            if position is None:
+                return []
+            scores = self._features.scores(position)
+            actors = self._actors_by_movie.get(position)
+            if actors.size:
+                co_cast = numpy.concatenate([self._movies_by_actor.get(actor) for actor in actors])
+                positions, shared = numpy.unique(co_cast, return_counts=True)
+                cast_sizes = numpy.maximum(self._features.cast_sizes[positions], 1)
+                scores[positions] += config.SIMILAR_CAST_WEIGHT * shared / numpy.sqrt(len(actors) * cast_sizes)
+            return [
+                (self._features.movie_id(position), float(scores[position]))
+                for position in top_positions(scores, limit)
+            ]
+
+    def start(self) -> 'SimilarityIndex':
+        """
+        Reload stale casts in a background thread.
+
+        Returns:
+            SimilarityIndex: The index itself.
+        """
+        threading.Thread(target=self._run, name='similarity-casts', daemon=True).start()
+        return self
+
+    def load_casts(self, pages: Iterable[list[tuple]]) -> None:
+        """
+        Replace all casts with the links between movies and actors of the pages.
+
+        Args:
+            pages (Iterable[list[tuple]]): Pages of (movie_id, actor_id) rows, e.g. of movie_actor.
+        """
+        with self._lock:
+            generation, features = self._generation, self._features
+        links = (array.array('i'), array.array('i'))
+        for page in pages:
+            code_links(page, features, self._actor_codes, links)
+        movies, actors = (numpy.frombuffer(codes, dtype=numpy.int32) for codes in links)
+        with self._lock:
+            if generation != self._generation:
+                self._stale_casts = None
+                self._stale.set()
+                return
+            self._actors_by_movie = SparseRows(movies, actors, features.size)
+            self._movies_by_actor = SparseRows(actors, movies, len(self._actor_codes))
+            features.cast_sizes[:features.size] = numpy.bincount(movies, minlength=features.size)
+        self.loaded.set()
+
+    def _rebuild(self, snapshot: CatalogSnapshot) -> None:
+        self._features = MovieFeatures(snapshot.movies)
+        self._actors_by_movie = SparseRows(EMPTY, EMPTY, 0)
+        self._movies_by_actor = SparseRows(EMPTY, EMPTY, 0)
+        self._generation += 1
+        self._stale_casts = None
+        self._stale.set()
+
+    def _mark_stale(self, movie_ids: Optional[set[UUID]]) -> None:
+        with self._lock:
+            if movie_ids is None or self._stale_casts is None:
+                self._stale_casts = None
+            else:
+                self._stale_casts |= movie_ids
+        self._stale.set()
+
+    def _read_cast_pages(self) -> Iterator[list[tuple]]:
+        after = (NO_ID, NO_ID)
+        while True:
+            page = self._router.read(db.get_cast_links, after, config.CAST_PAGE_SIZE)
+            yield page
+            if len(page) < config.CAST_PAGE_SIZE:
+                return
+            after = page[-1]
+
+    def _reload_casts(self, movie_ids: set[UUID]) -> None:
+        casts: dict[UUID, list[int]] = {movie_id: [] for movie_id in movie_ids}
+        for linked_id, actor_id in self._router.read(db.get_movies_cast_links, list(movie_ids)):
+            casts[linked_id].append(self._actor_codes.setdefault(actor_id, len(self._actor_codes)))
+        with self._lock:
+            for movie_id, actors in casts.items():
+                position = self._features.position(movie_id)
+                if position is not None:
+                    self._set_cast(position, numpy.unique(numpy.array(actors, dtype=numpy.int32)))
+
+    def _set_cast(self, position: int, actors: numpy.ndarray) -> None:
+        previous = self._actors_by_movie.get(position)
+        for actor in numpy.setdiff1d(previous, actors):
+            movies = self._movies_by_actor.get(actor)
+            self._movies_by_actor.set(actor, movies[movies != position])
+        for added in numpy.setdiff1d(actors, previous):
+            movies = self._movies_by_actor.get(added)
+            self._movies_by_actor.set(added, numpy.append(movies, numpy.int32(position)))
+        self._actors_by_movie.set(position, actors)
+        self._features.cast_sizes[position] = len(actors)
+
+    def _run(self) -> None:
+        while self._stale.wait():
+            self._stale.clear()
+            with self._lock:
+                movie_ids = self._stale_casts
+                self._stale_casts = set()
+            try:
+                if movie_ids is None:
+                    self.load_casts(self._read_cast_pages())
+                elif movie_ids:
+                    self._reload_casts(movie_ids)
+            except READ_ERRORS as error:
+                print(f'cast reload failed: {error}')
+                time.sleep(config.LISTEN_MIN_BACKOFF)
+                self._mark_stale(movie_ids)
+
+
+def top_positions(scores: numpy.ndarray, limit: int) -> numpy.ndarray:
+    """
+    Select the positions of the highest finite scores without sorting all of them.
+
+    Args:
+        scores (numpy.ndarray): Score of each position.
+        limit (int): The maximum number of positions.
+
+    Returns:
+        numpy.ndarray: The positions, best score first.
+    """
+    count = min(limit, len(scores))
+    if not count:
+        return EMPTY
+    top = numpy.argpartition(scores, len(scores) - count)[len(scores) - count:]
+    top = top[numpy.argsort(-scores[top], kind='stable')]
+    return top[numpy.isfinite(scores[top])]
+
+
+def genre_masks(genres: Iterable[Optional[str]], genre_bits: dict[str, int]) -> numpy.ndarray:
+    """
+    Encode genre combinations as bit masks, one bit per genre.
+
+    Args:
+        genres (Iterable[Optional[str]]): Comma separated genres of each combination.
+        genre_bits (dict[str, int]): Bits of the genres by name, extended with new genres.
+
+    Returns:
+        numpy.ndarray: A row of 64-bit words per combination.
+    """
+    masks = []
+    for genre in genres:
+        mask = 0
+        for name in (genre or '').split(GENRE_SEPARATOR):
+            mask |= 1 << genre_bits.setdefault(name, len(genre_bits))
+        masks.append(mask)
+    shifts = range(0, max(len(genre_bits), 1), WORD_BITS)
+    return numpy.array([[(mask >> shift) & WORD_MASK for shift in shifts] for mask in masks], dtype=numpy.uint64)
+
+
+def padded(source: numpy.ndarray, capacity: int, fill: object = 0) -> numpy.ndarray:
+    """
+    Extend the rows of an array to a capacity.
+
+    Args:
+        source (numpy.ndarray): The array.
+        capacity (int): The number of rows to extend to.
+        fill (object): The value of the new rows.
+
+    Returns:
+        numpy.ndarray: The extended array.
+    """
+    shape = (capacity - len(source), *source.shape[1:])
+    extension = numpy.full(shape, fill, dtype=source.dtype)
+    return numpy.concatenate((source, extension))
+
+
+def code_links(
+    page: list[tuple], features: MovieFeatures,
+    actor_codes: dict[UUID, int], links: tuple[array.array, array.array],
+) -> None:
+    """
+    Append links between movies and actors as movie positions and actor codes, skipping unknown movies.
+
+    Args:
+        page (list[tuple]): Rows of (movie_id, actor_id).
+        features (MovieFeatures): The features giving the positions of movies.
+        actor_codes (dict[UUID, int]): Codes of actors by id, extended with new actors.
+        links (tuple[array.array, array.array]): Movie positions and actor codes to append to.
+    """
+    for movie_id, actor_id in page:
+        position = features.position(movie_id)
+        if position is not None:
+            links[0].append(position)
+            links[1].append(actor_codes.setdefault(actor_id, len(actor_codes)))
+
+
+def movie_ids_of(tags: Iterable[str]) -> set[UUID]:
+    """
+    Extract the ids of movies from change tags.
+
+    Args:
+        tags (Iterable[str]): Tags of changed rows, e.g. 'movie:<uuid>'.
+
+    Returns:
+        set[UUID]: The ids of the movies tagged.
+    """
+    movie_tags = (tag for tag in tags if tag.startswith(MOVIE_TAG))
+    return {UUID(tag[len(MOVIE_TAG):]) for tag in movie_tags}
@@ -1,11 +1,38 @@
 """Tests REST API endpoints for movie management."""
 
+import hashlib
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import repeat
+from typing import Optional
+from uuid import uuid4
+
+import psycopg
+import psycopg_pool
 import pytest
 import requests
+from PIL import Image
 
-from config import AUTH_HEADER, CREATED, NO_CONTENT, OK
+import admission
+import db
+import query
+import replicas
+import tracing
+import warmup
+from config import (ACCEPTED, ADMISSION_LIMITS, AUTH_HEADER, BAD_REQUEST,
+                    CHANGES_MAX_LIMIT, CREATED, NO_CONTENT, NOT_FOUND,
+                    NOT_MODIFIED, OK, PARTIAL_CONTENT, RANGE_NOT_SATISFIABLE,
+                    SERVER_TIMING_HEADER, SERVICE_UNAVAILABLE, SESSION_COOKIE,
+                    TOO_MANY_REQUESTS, TRACE_FILE, TRACE_FORCED_BURST,
+                    TRACE_QUEUE_SIZE, TRACEPARENT_HEADER, WRITE_BURST)
+from group_commit import CommitTimeout, GroupCommitter
 
-HEADERS = {AUTH_HEADER: '5720906c'}
+# Reads right after writes find them, even with lagging replicas, as the session of the writes is sent along.
+HEADERS = {AUTH_HEADER: '5720906c', 'Cookie': f'{SESSION_COOKIE}={uuid4().hex}'}
 BASE_URL = 'http://localhost:8080/movies'
 
 TEST_MOVIE_CREATE = {
@@ -26,10 +53,70 @@ TEST_MOVIE_UPDATE = {
     'trailer': 'url_trailer',
 }
 
+TEST_MOVIE_UPSERT = {
+    'title': 'Фильм для конкурентных запросов',
+    'description': 'Описание',
+    'genre': 'Драма',
+    'year': 2024,
+    'poster': 'url_постера',
+    'trailer': 'url_trailer',
+}
+
+CONCURRENT_REQUESTS = 8
+FIRST_YEAR = 2000
+INVALIDATION_POLLS = 40
+POLL_INTERVAL = 0.05
+CHANGES_URL = f'{BASE_URL}/changes'
+AUTOCOMPLETE_URL = 'http://localhost:8080/autocomplete'
+LINK_ACTOR = 'insert into movie_actor (movie_id, actor_id) select %s, id from actor limit 1 returning actor_id'
+ADD_ACTOR = 'insert into actor (id, full_name, birth_date) values (%s, %s, %s)'
+LINK_MOVIE_ACTOR = 'insert into movie_actor (movie_id, actor_id) values (%s, %s)'
+DELETE_ACTOR = 'delete from actor where id = %s'
+RENAME_ACTOR = 'update actor set full_name = %s where id = %s'
+ACTOR_SUFFIX_LENGTH = 12
+SET_RATING = 'update movie set imdb_rating = %s, imdb_votes = %s where id = %s'
+TOP_URL = f'{BASE_URL}/top'
+TOP_RATING = 9.9
+POSTERS_URL = 'http://localhost:8080/posters'
+POSTER_SIZE = (600, 900)
+THUMBNAIL_WIDTH = 154
+UNSATISFIABLE_RANGE = 'bytes=1073741824-'
+SLOW_POSTER = '/slow-poster-'
+SLOW_ORIGIN_DELAY = 1
+METRICS_URL = 'http://localhost:8080/metrics'
+PARENT_SPAN_ID = 'b7ad6b7169203331'
+LOCK_MOVIE = 'select id from movie where id = %s for update'
+HEALTHZ_URL = 'http://localhost:8080/healthz'
+READYZ_URL = 'http://localhost:8080/readyz'
+READY_POLLS = 100
+TRANSACTION_ID = 'select txid_current()'
+DIVIDE_BY_ZERO = 'select 1 / 0'
+TERMINATE_SELF = 'select pg_terminate_backend(pg_backend_pid())'
+SLOW_WRITE = 'select pg_sleep(1)'
+BATCH_DELAY = 0.05
+COMMIT_TIMEOUT = 0.2
+APPLICATION_NAME = 'show application_name'
+UNREACHABLE_NODE = '127.0.0.1:9'
+LAGGING = 'select 60.0'
+NOT_LAGGING = 'select 0.0'
+NODE_TIMEOUT = 0.5
+WARMUP_FAILURES = 2
+SLOW_TRACE_SECONDS = 60
+TRACE_WRITE_DELAY = 0.5
+
 TEST_ID = ''
 TEST_MOVIE = ((TEST_MOVIE_CREATE, TEST_MOVIE_UPDATE), )
 
 
+@pytest.fixture(scope='session', autouse=True, name='ready')
+def fixture_ready():
+    """Wait until the server has warmed up, as it binds before loading the catalog."""
+    for _ in range(READY_POLLS):
+        if requests.get(READYZ_URL).status_code == OK:
+            return
+        time.sleep(POLL_INTERVAL)
+
+
 @pytest.mark.parametrize('model_data, model_data_update', TEST_MOVIE)
 def test_crud_movie(model_data, model_data_update):
     """
@@ -52,3 +139,833 @@ def test_crud_movie(model_data, model_data_update):
 
     response = requests.delete(url, headers=HEADERS)
     assert response.status_code == NO_CONTENT
+
+
+def test_movie_cast():
+    """Test the cast of a movie is served as JSON and invalid ids are rejected."""
+    response = requests.post(BASE_URL, headers=HEADERS, json=TEST_MOVIE_CREATE)
+    assert response.status_code == CREATED
+    film_id = response.content.decode()
+
+    response = requests.get(f'{BASE_URL}/{film_id}/actors')
+    assert response.status_code == OK
+    assert not response.json()
+
+    response = requests.get(f'{BASE_URL}/not-an-id/actors')
+    assert response.status_code == BAD_REQUEST
+
+    response = requests.delete(f'{BASE_URL}?id={film_id}', headers=HEADERS)
+    assert response.status_code == NO_CONTENT
+
+
+def put_movie(url: str) -> int:
+    """
+    Send the upserted movie with PUT.
+
+    Args:
+        url (str): Url of the movie.
+
+    Returns:
+        int: Status code of the response.
+    """
+    return requests.put(url, headers=HEADERS, json=TEST_MOVIE_UPSERT).status_code
+
+
+def patch_year(url: str, year: int) -> int:
+    """
+    Change the year of a movie with PATCH.
+
+    Args:
+        url (str): Url of the movie.
+        year (int): New year of the movie.
+
+    Returns:
+        int: Status code of the response.
+    """
+    return requests.patch(url, headers=HEADERS, json={'year': year}).status_code
+
+
+def test_concurrent_upsert():
+    """Test concurrent PUTs of the same new movie create it exactly once and update it otherwise."""
+    url = f'{BASE_URL}?id={uuid4()}'
+    with ThreadPoolExecutor(max_workers=CONCURRENT_REQUESTS) as executor:
+        statuses = list(executor.map(put_movie, repeat(url, CONCURRENT_REQUESTS)))
+    assert statuses.count(CREATED) == 1
+    assert statuses.count(OK) == CONCURRENT_REQUESTS - 1
+
+    response = requests.delete(url, headers=HEADERS)
+    assert response.status_code == NO_CONTENT
+
+
+def test_concurrent_patch():
+    """Test concurrent partial updates of a movie all succeed and a missing movie is reported."""
+    url = f'{BASE_URL}?id={uuid4()}'
+    assert put_movie(url) == CREATED
+    years = range(FIRST_YEAR, FIRST_YEAR + CONCURRENT_REQUESTS)
+    with ThreadPoolExecutor(max_workers=CONCURRENT_REQUESTS) as executor:
+        statuses = list(executor.map(patch_year, repeat(url), years))
+    assert statuses.count(OK) == CONCURRENT_REQUESTS
+    assert patch_year(f'{BASE_URL}?id={uuid4()}', FIRST_YEAR) == NOT_FOUND
+
+    response = requests.delete(url, headers=HEADERS)
+    assert response.status_code == NO_CONTENT
+
+
+def test_cache_invalidation():
+    """Test a cached cast is refreshed once another server process links an actor to the movie."""
+    response = requests.post(BASE_URL, headers=HEADERS, json=TEST_MOVIE_CREATE)
+    assert response.status_code == CREATED
+    film_id = response.content.decode()
+    cast_url = f'{BASE_URL}/{film_id}/actors'
+    assert not requests.get(cast_url).json()
+
+    connection, cursor = db.connect()
+    actor_id = cursor.execute(LINK_ACTOR, (film_id,)).fetchone()[0]
+    connection.commit()
+    connection.close()
+    for _ in range(INVALIDATION_POLLS):
+        cast = requests.get(cast_url).json()
+        if cast:
+            break
+        time.sleep(POLL_INTERVAL)
+    assert [actor['id'] for actor in cast] == [str(actor_id)]
+
+    response = requests.delete(f'{BASE_URL}?id={film_id}', headers=HEADERS)
+    assert response.status_code == NO_CONTENT
+
+
+def test_similar_movies():
+    """Test a movie sharing only an actor, neither genre nor year, ranks first once the cast is linked."""
+    film_ids = [
+        requests.post(BASE_URL, headers=HEADERS, json=movie).content.decode()
+        for movie in (TEST_MOVIE_CREATE, {**TEST_MOVIE_UPSERT, 'genre': 'Комедия', 'year': FIRST_YEAR})
+    ]
+    similar_url = f'{BASE_URL}/{film_ids[0]}/similar'
+    assert film_ids[1] not in {movie['id'] for movie in requests.get(similar_url, headers=HEADERS).json()}
+
+    actor_id = uuid4()
+    connection, cursor = db.connect()
+    cursor.execute(ADD_ACTOR, (actor_id, 'Актёр двух фильмов', '1980-01-01'))
+    cursor.executemany(LINK_MOVIE_ACTOR, zip(film_ids, repeat(actor_id)))
+    connection.commit()
+    for _ in range(INVALIDATION_POLLS):
+        similar = requests.get(similar_url, headers=HEADERS, params={'limit': 1}).json()
+        if similar[0]['id'] == film_ids[1]:
+            break
+        time.sleep(POLL_INTERVAL)
+    assert [movie['id'] for movie in similar] == [film_ids[1]]
+
+    assert requests.get(similar_url, params={'limit': 0}).status_code == BAD_REQUEST
+    assert requests.get(f'{BASE_URL}/{uuid4()}/similar').status_code == NOT_FOUND
+    for film_id in film_ids:
+        assert delete_movie(film_id) == NO_CONTENT
+    cursor.execute(DELETE_ACTOR, (actor_id,))
+    connection.commit()
+    connection.close()
+
+
+def test_autocomplete():
+    """Test a title is completed from a case and accent insensitive prefix until the movie is deleted."""
+    response = requests.post(BASE_URL, headers=HEADERS, json=TEST_MOVIE_CREATE)
+    assert response.status_code == CREATED
+    film_id = response.content.decode()
+    prefix = {'prefix': 'СУПЕР ФИ'}
+
+    response = requests.get(AUTOCOMPLETE_URL, headers=HEADERS, params=prefix)
+    assert response.json()['movies'] == [{'id': film_id, 'title': TEST_MOVIE_CREATE['title']}]
+    assert requests.get(AUTOCOMPLETE_URL, params={**prefix, 'limit': 0}).status_code == BAD_REQUEST
+
+    response = requests.delete(f'{BASE_URL}?id={film_id}', headers=HEADERS)
+    assert response.status_code == NO_CONTENT
+    assert not requests.get(AUTOCOMPLETE_URL, headers=HEADERS, params=prefix).json()['movies']
+
+
+def poll_actor_completions(prefix: str, expected: list[dict]) -> list[dict]:
+    """
+    Complete a prefix with actor names until the expected actors are found or polls run out.
+
+    Args:
+        prefix (str): The prefix to complete.
+        expected (list[dict]): The expected actor completions.
+
+    Returns:
+        list[dict]: The last actor completions.
+    """
+    for _ in range(INVALIDATION_POLLS):
+        actors = requests.get(AUTOCOMPLETE_URL, params={'prefix': prefix}).json()['actors']
+        if actors == expected:
+            break
+        time.sleep(POLL_INTERVAL)
+    return actors
+
+
+def test_actor_changes():
+    """Test actors added, renamed and deleted in the database are followed by the autocomplete index."""
+    actor_id = uuid4()
+    suffix = actor_id.hex[:ACTOR_SUFFIX_LENGTH]
+    added_name, renamed_name = f'Зельда {suffix}', f'Ярослава {suffix}'
+    connection, cursor = db.connect()
+    cursor.execute(ADD_ACTOR, (actor_id, added_name, '1980-01-01'))
+    connection.commit()
+    added = [{'id': str(actor_id), 'full_name': added_name}]
+    assert poll_actor_completions(added_name, added) == added
+
+    cursor.execute(RENAME_ACTOR, (renamed_name, actor_id))
+    connection.commit()
+    renamed = [{'id': str(actor_id), 'full_name': renamed_name}]
+    assert poll_actor_completions(renamed_name, renamed) == renamed
+    assert not poll_actor_completions(added_name, [])
+
+    cursor.execute(DELETE_ACTOR, (actor_id,))
+    connection.commit()
+    connection.close()
+    assert not poll_actor_completions(renamed_name, [])
+
+
+def test_numeric_titles():
+    """Test titles and prefixes that look like numbers are matched as sent, leading zeros and dots included."""
+    movie = {**TEST_MOVIE_UPSERT, 'title': '007.'}
+    numeric_id = requests.post(BASE_URL, headers=HEADERS, json=movie).content.decode()
+    completions = requests.get(AUTOCOMPLETE_URL, headers=HEADERS, params={'prefix': '007'}).json()['movies']
+    assert completions == [{'id': numeric_id, 'title': movie['title']}]
+    page = requests.get(BASE_URL, headers=HEADERS, params={'title': movie['title']}).content.decode()
+    assert '<p class="movies__name">007.</p>' in page
+    assert delete_movie(numeric_id) == NO_CONTENT
+
+
+def changes_head() -> int:
+    """
+    Read the change feed to the end.
+
+    Returns:
+        int: The sequence number of the last change.
+    """
+    since, has_more = 0, True
+    while has_more:
+        feed = requests.get(CHANGES_URL, params={'since': since, 'limit': CHANGES_MAX_LIMIT}).json()
+        since, has_more = feed['next_since'], feed['has_more']
+    return since
+
+
+def poll_change(since: int, film_id: str, expected: dict) -> Optional[dict]:
+    """
+    Read the change feed until the change of a movie has the expected values or polls run out.
+
+    Changes are numbered in the background, so they reach the feed shortly after their commit.
+
+    Args:
+        since (int): The sequence number to read the feed after.
+        film_id (str): The id of the movie.
+        expected (dict): The values expected in the change.
+
+    Returns:
+        Optional[dict]: The last change of the movie read, None if the feed had none.
+    """
+    film_change = None
+    for _ in range(INVALIDATION_POLLS):
+        feed = requests.get(CHANGES_URL, params={'since': since, 'limit': CHANGES_MAX_LIMIT}).json()
+        film_change = next((change for change in feed['changes'] if change['id'] == film_id), film_change)
+        if film_change is not None and expected.items() <= film_change.items():
+            break
+        time.sleep(POLL_INTERVAL)
+    return film_change
+
+
+def test_change_feed():
+    """Test the change feed returns only the latest change of each movie, tombstones included."""
+    head = changes_head()
+    response = requests.post(BASE_URL, headers=HEADERS, json=TEST_MOVIE_CREATE)
+    assert response.status_code == CREATED
+    film_id = response.content.decode()
+    url = f'{BASE_URL}?id={film_id}'
+    assert patch_year(url, FIRST_YEAR) == OK
+
+    change = poll_change(head, film_id, {'year': FIRST_YEAR})
+    assert change['year'] == FIRST_YEAR
+
+    assert requests.delete(url, headers=HEADERS).status_code == NO_CONTENT
+    tombstone = poll_change(change['seq'], film_id, {'deleted': True})
+    assert tombstone == {'seq': tombstone['seq'], 'id': film_id, 'deleted': True}
+
+
+def test_change_feed_limit():
+    """Test the change feed rejects limits out of range."""
+    for limit in (0, CHANGES_MAX_LIMIT + 1, 'all'):
+        response = requests.get(CHANGES_URL, params={'limit': limit})
+        assert response.status_code == BAD_REQUEST
+
+
+def test_movie_filters():
+    """Test movies are found by title, genre and year in the in-memory catalog right after their creation."""
+    response = requests.post(BASE_URL, headers=HEADERS, json=TEST_MOVIE_CREATE)
+    assert response.status_code == CREATED
+    film_id = response.content.decode()
+    title = TEST_MOVIE_CREATE['title']
+
+    for filters in ({'title': title}, {'genre': TEST_MOVIE_CREATE['genre'], 'year': TEST_MOVIE_CREATE['year']}):
+        assert title in requests.get(BASE_URL, headers=HEADERS, params=filters).content.decode()
+    assert title not in requests.get(BASE_URL, headers=HEADERS, params={'year': FIRST_YEAR}).content.decode()
+
+    response = requests.delete(f'{BASE_URL}?id={film_id}', headers=HEADERS)
+    assert response.status_code == NO_CONTENT
+
+
+def delete_movie(film_id: str) -> int:
+    """
+    Delete a movie.
+
+    Args:
+        film_id (str): The id of the movie.
+
+    Returns:
+        int: The status code of the response.
+    """
+    return requests.delete(f'{BASE_URL}?id={film_id}', headers=HEADERS).status_code
+
+
+def test_delete_movie():
+    """Test a movie is deleted once, and invalid ids are rejected instead of reaching the database."""
+    film_id = requests.post(BASE_URL, headers=HEADERS, json=TEST_MOVIE_CREATE).content.decode()
+    assert [delete_movie(film_id) for _ in range(2)] == [NO_CONTENT, ACCEPTED]
+    for invalid_id in ('not-a-uuid', '007'):
+        assert delete_movie(invalid_id) == BAD_REQUEST
+    assert requests.delete(BASE_URL, headers=HEADERS).status_code == BAD_REQUEST
+
+
+def poll_top(film_ids: list[str]) -> list[str]:
+    """
+    Read the head of the leaderboard until it lists the movies in the given order or polls run out.
+
+    Args:
+        film_ids (list[str]): The ids of the movies expected at the top.
+
+    Returns:
+        list[str]: The ids of the movies at the top of the leaderboard.
+    """
+    for _ in range(INVALIDATION_POLLS):
+        top = requests.get(TOP_URL, headers=HEADERS, params={'limit': len(film_ids)}).json()
+        top_ids = [movie['id'] for movie in top]
+        if top_ids == film_ids:
+            break
+        time.sleep(POLL_INTERVAL)
+    return top_ids
+
+
+def test_top_movies():
+    """Test the leaderboard and the rating sort of the movies page follow ratings as they are stored."""
+    film_ids = [
+        requests.post(BASE_URL, headers=HEADERS, json=movie).content.decode()
+        for movie in (TEST_MOVIE_CREATE, TEST_MOVIE_UPSERT)
+    ]
+    connection, cursor = db.connect()
+    cursor.executemany(SET_RATING, ((TOP_RATING, 1, film_ids[0]), (TOP_RATING, 2, film_ids[1])))
+    connection.commit()
+    assert poll_top(film_ids[::-1]) == film_ids[::-1]
+
+    cursor.execute(SET_RATING, (TOP_RATING, 3, film_ids[0]))
+    connection.commit()
+    connection.close()
+    assert poll_top(film_ids) == film_ids
+    page = requests.get(BASE_URL, headers=HEADERS, params={'sort': 'rating'}).content.decode()
+    assert page.index(TEST_MOVIE_CREATE['title']) < page.index(TEST_MOVIE_UPSERT['title'])
+
+    assert requests.get(TOP_URL, params={'limit': 0}).status_code == BAD_REQUEST
+    assert {delete_movie(film_id) for film_id in film_ids} == {NO_CONTENT}
+
+
+class StubPosterOrigin(BaseHTTPRequestHandler):
+    """An image origin serving the same PNG poster at every path and counting the requests of each path."""
+
+    poster = b''
+    hits: dict = {}
+
+    def do_GET(self):
+        """Send the poster."""
+        self.hits[self.path] = self.hits.get(self.path, 0) + 1
+        if self.path.startswith(SLOW_POSTER):
+            time.sleep(SLOW_ORIGIN_DELAY)
+        self.send_response(OK)
+        self.send_header('Content-Type', 'image/png')
+        self.end_headers()
+        self.wfile.write(self.poster)
+
+    def log_message(self, *args):
+        """
+        Keep the test output quiet.
+
+        Args:
+            args: The format and values of the message.
+        """
+
+
+@pytest.fixture(scope='module', name='poster_origin')
+def fixture_poster_origin():
+    """
+    Serve posters from a local stub origin.
+
+    Yields:
+        str: The URL of the origin.
+    """
+    poster = io.BytesIO()
+    Image.new('RGB', POSTER_SIZE, 'navy').save(poster, 'PNG')
+    StubPosterOrigin.poster = poster.getvalue()
+    origin = ThreadingHTTPServer(('127.0.0.1', 0), StubPosterOrigin)
+    threading.Thread(target=origin.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{origin.server_port}'
+    origin.shutdown()
+
+
+def create_poster_movie(origin: str, prefix: str = '/poster-') -> tuple[str, str]:
+    """
+    Create a movie whose poster is served by the stub origin at a path of its own.
+
+    Args:
+        origin (str): The URL of the origin.
+        prefix (str): The prefix of the path of the poster; SLOW_POSTER for a slow origin.
+
+    Returns:
+        tuple[str, str]: The id of the movie and the path of its poster.
+    """
+    poster_id = uuid4()
+    path = f'{prefix}{poster_id}.png'
+    movie = {**TEST_MOVIE_UPSERT, 'title': f'Постер {poster_id}', 'poster': f'{origin}{path}'}
+    return requests.post(BASE_URL, headers=HEADERS, json=movie).content.decode(), path
+
+
+def test_poster_thumbnail(poster_origin):
+    """
+    Test a poster is fetched once from its origin and served as a cached JPEG thumbnail of the requested width.
+
+    Args:
+        poster_origin (str): The URL of the stub origin.
+    """
+    film_id, path = create_poster_movie(poster_origin)
+    poster_url = f'{POSTERS_URL}/{film_id}'
+
+    responses = [requests.get(poster_url, headers=HEADERS, params={'w': width}) for width in (150, 154, 154)]
+    assert {response.status_code for response in responses} == {OK}
+    with Image.open(io.BytesIO(responses[-1].content)) as thumbnail:
+        assert (thumbnail.format, thumbnail.width) == ('JPEG', THUMBNAIL_WIDTH)
+    assert StubPosterOrigin.hits[path] == 1
+    assert 'max-age' in responses[-1].headers['Cache-Control']
+    assert delete_movie(film_id) == NO_CONTENT
+
+
+def test_poster_ranges(poster_origin):
+    """
+    Test a cached poster is served by byte ranges and revalidated by its ETag.
+
+    Args:
+        poster_origin (str): The URL of the stub origin.
+    """
+    film_id, _ = create_poster_movie(poster_origin)
+    poster_url = f'{POSTERS_URL}/{film_id}'
+    response = requests.get(poster_url, headers=HEADERS)
+    etag = response.headers['ETag']
+    digest = hashlib.sha256(response.content).hexdigest()
+    assert etag == f'"{digest}"'
+
+    response = requests.get(poster_url, headers={'Range': 'bytes=0-9'})
+    assert (response.status_code, len(response.content)) == (PARTIAL_CONTENT, 10)
+    assert requests.get(poster_url, headers={'If-None-Match': etag}).status_code == NOT_MODIFIED
+    response = requests.get(poster_url, headers={'Range': UNSATISFIABLE_RANGE})
+    assert response.status_code == RANGE_NOT_SATISFIABLE
+
+    delete_movie(film_id)
+    assert requests.get(poster_url, headers=HEADERS).status_code == NOT_FOUND
+
+
+def test_poster_host_not_allowed(poster_origin):
+    """
+    Test a poster of a host out of POSTER_HOSTS is never fetched, and listed at its origin instead of the proxy.
+
+    Args:
+        poster_origin (str): The URL of the stub origin.
+    """
+    path = f'/poster-{uuid4()}.png'
+    poster = poster_origin.replace('127.0.0.1', 'localhost') + path
+    movie = {**TEST_MOVIE_UPSERT, 'title': f'Внешний {uuid4()}', 'poster': poster}
+    internal_id = requests.post(BASE_URL, headers=HEADERS, json=movie).content.decode()
+    assert requests.get(f'{POSTERS_URL}/{internal_id}', headers=HEADERS).status_code == NOT_FOUND
+    assert path not in StubPosterOrigin.hits
+    listing = requests.get(BASE_URL, headers=HEADERS, params={'title': movie['title']}).text
+    assert f'src="{poster}"' in listing
+    assert delete_movie(internal_id) == NO_CONTENT
+
+
+def test_load_shedding(poster_origin):
+    """
+    Test requests over the capacity of the external route class are rejected with a Retry-After at once.
+
+    Args:
+        poster_origin (str): The URL of the stub origin.
+    """
+    film_id, _ = create_poster_movie(poster_origin, SLOW_POSTER)
+    poster_url = f'{POSTERS_URL}/{film_id}'
+    limit, queue_limit = ADMISSION_LIMITS['external']
+    with ThreadPoolExecutor(max_workers=limit + queue_limit + 4) as executor:
+        responses = list(executor.map(
+            lambda _: requests.get(poster_url, headers=HEADERS), range(limit + queue_limit + 4),
+        ))
+    assert {response.status_code for response in responses} == {OK, SERVICE_UNAVAILABLE}
+    shed = next(response for response in responses if response.status_code == SERVICE_UNAVAILABLE)
+    assert shed.headers['Retry-After'] == '1'
+    assert 'event="shed",route_class="external"' in requests.get(METRICS_URL).text
+    assert delete_movie(film_id) == NO_CONTENT
+
+
+def test_cached_poster_under_load(poster_origin):
+    """
+    Test a cached poster is served as a read while poster misses exhaust the external capacity.
+
+    Args:
+        poster_origin (str): The URL of the stub origin.
+    """
+    cached_id, _ = create_poster_movie(poster_origin)
+    cached_url = f'{POSTERS_URL}/{cached_id}'
+    slow_id, _ = create_poster_movie(poster_origin, SLOW_POSTER)
+    limit, queue_limit = ADMISSION_LIMITS['external']
+    assert requests.get(cached_url, headers=HEADERS).status_code == OK
+    with ThreadPoolExecutor(max_workers=limit + queue_limit) as executor:
+        misses = [
+            executor.submit(requests.get, f'{POSTERS_URL}/{slow_id}', headers=HEADERS)
+            for _ in range(limit + queue_limit)
+        ]
+        time.sleep(SLOW_ORIGIN_DELAY / 4)
+        assert requests.get(cached_url, headers=HEADERS).status_code == OK
+        assert {miss.result().status_code for miss in misses} <= {OK, SERVICE_UNAVAILABLE}
+    assert delete_movie(cached_id) == delete_movie(slow_id) == NO_CONTENT
+
+
+def test_write_rate_limit():
+    """Test writes of an unverified token over the burst of its address are rejected before the token is checked."""
+    flood_headers = {AUTH_HEADER: f'flood-{uuid4()}'}
+    with ThreadPoolExecutor(max_workers=CONCURRENT_REQUESTS) as executor:
+        responses = list(executor.map(
+            lambda _: requests.post(BASE_URL, headers=flood_headers, json=TEST_MOVIE_CREATE), range(WRITE_BURST * 2),
+        ))
+    rate_limited = [response for response in responses if response.status_code == TOO_MANY_REQUESTS]
+    assert rate_limited
+    assert int(rate_limited[0].headers['Retry-After']) >= 1
+    assert 'event="rate_limited"' in requests.get(METRICS_URL).text
+
+
+def test_write_rate_limit_per_client():
+    """Test clients sharing a verified token are rate limited apart."""
+    controller = admission.AdmissionController()
+    token = f'shared-{uuid4()}'
+    controller.verified(token)
+    waits = [controller.limit_write(token, '192.0.2.1') for _ in range(WRITE_BURST + 1)]
+    assert not any(waits[:WRITE_BURST])
+    assert waits[-1] > 0
+    assert controller.limit_write(token, '192.0.2.2') == 0
+    assert controller.limit_write(None, '192.0.2.1') == 0
+
+
+def poll_trace(trace_id: str) -> dict | None:
+    """
+    Read the exported traces until the trace is written or polls run out.
+
+    Args:
+        trace_id (str): The id of the trace.
+
+    Returns:
+        dict | None: The exported trace, None if it was not written.
+    """
+    for _ in range(INVALIDATION_POLLS):
+        with open(TRACE_FILE, 'a+', encoding='utf-8') as trace_file:
+            trace_file.seek(0)
+            traces = [json.loads(line) for line in trace_file if trace_id in line]
+        if traces:
+            return traces[0]
+        time.sleep(POLL_INTERVAL)
+    return None
+
+
+def test_request_traces():
+    """Test responses carry the time of their phases and traces sampled by the client are exported with spans."""
+    trace_id = uuid4().hex
+    traceparent = {TRACEPARENT_HEADER: f'00-{trace_id}-{PARENT_SPAN_ID}-01'}
+    created = requests.post(BASE_URL, headers=HEADERS | traceparent, json=TEST_MOVIE_CREATE)
+    assert {'auth', 'write', 'total'} <= {
+        metric.split(';')[0] for metric in created.headers[SERVER_TIMING_HEADER].split(', ')
+    }
+    assert 'render;dur=' in requests.get(BASE_URL, headers=HEADERS).headers[SERVER_TIMING_HEADER]
+
+    trace = poll_trace(trace_id)
+    spans = {span['name']: span for span in trace['spans']}
+    assert trace['status'] == CREATED
+    auth_span = trace['spans'][spans['db']['parent']]
+    assert spans['db']['detail'] == 'check_token' and auth_span['name'] == 'auth'
+    assert delete_movie(created.content.decode()) == NO_CONTENT
+
+
+def test_forced_trace_sampling(tmp_path):
+    """
+    Test traces sampled by clients are exported up to the forced rate, and traces over the queue are dropped.
+
+    Args:
+        tmp_path (Path): A temporary directory.
+    """
+    trace_path = str(tmp_path / TRACE_FILE)
+    exporter = tracing.TraceExporter(trace_path, 0, SLOW_TRACE_SECONDS).start()
+    for _ in range(TRACE_FORCED_BURST * 2):
+        exporter.export(tracing.Trace(uuid4().hex, sampled=True), 'GET', '/', OK)
+    time.sleep(TRACE_WRITE_DELAY)
+    with open(trace_path, encoding='utf-8') as trace_file:
+        assert TRACE_FORCED_BURST <= len(trace_file.readlines()) <= TRACE_FORCED_BURST + 1
+
+    idle = tracing.TraceExporter(trace_path, 0, 0)
+    for _ in range(TRACE_QUEUE_SIZE + CONCURRENT_REQUESTS):
+        idle.export(tracing.Trace(uuid4().hex, sampled=False), 'GET', '/', OK)
+    assert idle.dropped == CONCURRENT_REQUESTS
+
+
+def test_lock_timeout():
+    """Test a write waiting on a row lock held elsewhere gives up with a Retry-After instead of holding its thread."""
+    film_id = requests.post(BASE_URL, headers=HEADERS, json=TEST_MOVIE_CREATE).content.decode()
+    movie_url = f'{BASE_URL}?id={film_id}'
+    connection, cursor = db.connect()
+    cursor.execute(LOCK_MOVIE, (film_id,))
+    response = requests.patch(movie_url, headers=HEADERS, json={'year': FIRST_YEAR})
+    connection.rollback()
+    connection.close()
+    assert response.status_code == SERVICE_UNAVAILABLE
+    assert response.headers['Retry-After'] == '1'
+    assert patch_year(movie_url, FIRST_YEAR) == OK
+    assert delete_movie(film_id) == NO_CONTENT
+
+
+def test_probes():
+    """Test the liveness probe and the readiness probe, which reports the time of each startup task."""
+    assert requests.get(HEALTHZ_URL).status_code == OK
+    readiness = requests.get(READYZ_URL)
+    assert readiness.status_code == OK
+    assert set(readiness.json()['warmup']) == {'templates', 'posters', 'group_commit', 'database'}
+    assert not readiness.json()['errors']
+
+
+def start_committer(max_delay: float = BATCH_DELAY, timeout: float = 5) -> GroupCommitter:
+    """
+    Start a group committer on its own connection, outside of the server.
+
+    Args:
+        max_delay (float): Maximum time in seconds a statement waits for its batch to fill.
+        timeout (float): Seconds a statement waits to be taken into a batch.
+
+    Returns:
+        GroupCommitter: The started committer, to be stopped by the test.
+    """
+    return GroupCommitter(lambda: db.connect()[0], max_delay, CONCURRENT_REQUESTS, timeout).start()
+
+
+def submit_write(committer: GroupCommitter, db_query: str) -> object:
+    """
+    Submit a statement to a committer.
+
+    Args:
+        committer (GroupCommitter): The committer.
+        db_query (str): The statement.
+
+    Returns:
+        object: The returned row of the statement, or the error it raised.
+    """
+    try:
+        return committer.submit(db_query, ()).row
+    except psycopg.Error as error:
+        return error
+
+
+def submit_all(committer: GroupCommitter, db_queries: list[str]) -> list:
+    """
+    Submit statements concurrently, as concurrent requests would.
+
+    Args:
+        committer (GroupCommitter): The committer.
+        db_queries (list[str]): The statements.
+
+    Returns:
+        list: The returned row of each statement, or the error it raised.
+    """
+    with ThreadPoolExecutor(len(db_queries)) as executor:
+        return list(executor.map(submit_write, repeat(committer), db_queries))
+
+
+def test_group_commit_batches():
+    """Test concurrent statements are committed together, in the same transaction."""
+    committer = start_committer()
+    rows = submit_all(committer, list(repeat(TRANSACTION_ID, CONCURRENT_REQUESTS)))
+    committer.stop()
+    assert len(set(rows)) < CONCURRENT_REQUESTS
+
+
+def test_group_commit_failed_statement():
+    """Test a failing statement fails alone, while the rest of its batch is committed."""
+    committer = start_committer()
+    rows = submit_all(committer, [DIVIDE_BY_ZERO, *repeat(TRANSACTION_ID, CONCURRENT_REQUESTS - 1)])
+    committer.stop()
+    assert isinstance(rows[0], psycopg.errors.DivisionByZero)
+    assert all(isinstance(row, tuple) for row in rows[1:])
+
+
+def test_group_commit_lost_connection():
+    """Test a batch losing its connection fails, and the next batch runs on a new connection."""
+    committer = start_committer()
+    lost = submit_all(committer, [TERMINATE_SELF])
+    committed = submit_all(committer, [TRANSACTION_ID])
+    committer.stop()
+    assert isinstance(lost[0], psycopg.OperationalError)
+    assert isinstance(committed[0], tuple)
+
+
+def test_group_commit_timeout():
+    """Test a statement waiting behind a slow batch gives up unexecuted, while the taken slow one is not given up."""
+    committer = start_committer(max_delay=0, timeout=COMMIT_TIMEOUT)
+    with ThreadPoolExecutor(1) as executor:
+        slow = executor.submit(committer.submit, SLOW_WRITE, ())
+        time.sleep(COMMIT_TIMEOUT / 2)
+        with pytest.raises(CommitTimeout):
+            committer.submit(TRANSACTION_ID, ())
+        assert slow.result().rowcount == 1
+    committer.stop()
+
+
+def create_test_node(name: str, address: Optional[str] = None) -> replicas.Node:
+    """
+    Create a node of the primary database whose connections are told apart by their application name.
+
+    Args:
+        name (str): The name of the node and the application name of its connections.
+        address (Optional[str]): The host:port of the node; the primary by default.
+
+    Returns:
+        replicas.Node: The node with an opened pool.
+    """
+    db.load_env()
+    pool = psycopg_pool.ConnectionPool(
+        kwargs={**db.credentials(address), 'autocommit': True, 'application_name': name},
+        min_size=0, max_size=1, timeout=NODE_TIMEOUT, open=True,
+    )
+    return replicas.Node(name, pool)
+
+
+def application_name(cursor: psycopg.Cursor) -> str:
+    """
+    Read the application name of the connection of a cursor.
+
+    Args:
+        cursor (psycopg.Cursor): The cursor.
+
+    Returns:
+        str: The application name, i.e. the name of the test node.
+    """
+    return cursor.execute(APPLICATION_NAME).fetchone()[0]
+
+
+def check_connection(cursor: psycopg.Cursor, connection: psycopg.Connection) -> str:
+    """
+    Stand for a write, reading the application name of its connection.
+
+    Args:
+        cursor (psycopg.Cursor): The cursor.
+        connection (psycopg.Connection): The connection.
+
+    Returns:
+        str: The application name of the connection.
+    """
+    return application_name(cursor)
+
+
+def test_replica_routing():
+    """Test reads are balanced across replicas, but stay on the primary after a write of their client."""
+    router = replicas.ReplicaRouter(
+        create_test_node('primary'), [create_test_node('replica-1'), create_test_node('replica-2')], 5, 5,
+    )
+    balanced = {router.read(application_name, client_keys=('reader',)) for _ in range(4)}
+    assert router.write(check_connection, client_keys=('writer',)) == 'primary'
+    assert router.read(application_name, client_keys=('writer',)) == 'primary'
+    assert router.read(application_name, use_primary=True) == 'primary'
+    router.close()
+    assert balanced == {'replica-1', 'replica-2'}
+
+
+def test_replica_lag(monkeypatch):
+    """
+    Test reads go to the primary while the replica lags behind by more than allowed, and back once it caught up.
+
+    Args:
+        monkeypatch (pytest.MonkeyPatch): Fixture replacing the replication lag query.
+    """
+    router = replicas.ReplicaRouter(create_test_node('primary'), [create_test_node('replica')], 5, 5)
+    monkeypatch.setattr(query, 'GET_REPLICATION_LAG', LAGGING)
+    router.check_health(NODE_TIMEOUT)
+    lagging = router.read(application_name)
+    monkeypatch.setattr(query, 'GET_REPLICATION_LAG', NOT_LAGGING)
+    router.check_health(NODE_TIMEOUT)
+    caught_up = router.read(application_name)
+    router.close()
+    assert (lagging, caught_up) == ('primary', 'replica')
+
+
+def test_replica_failover():
+    """Test a read fails over to the primary when its replica is unreachable, which is then left out."""
+    replica = create_test_node('replica', UNREACHABLE_NODE)
+    router = replicas.ReplicaRouter(create_test_node('primary'), [replica], 5, 5)
+    assert router.read(application_name) == 'primary'
+    assert not replica.healthy
+    router.check_health(NODE_TIMEOUT)
+    assert not replica.healthy
+    router.close()
+
+
+def test_session_cookie():
+    """Test a write without a session starts one, whose cookie is sent back to read the writes of the client."""
+    response = requests.post(BASE_URL, headers={AUTH_HEADER: HEADERS[AUTH_HEADER]}, json=TEST_MOVIE_CREATE)
+    assert response.status_code == CREATED
+    assert len(response.cookies[SESSION_COOKIE]) == len(uuid4().hex)
+    assert SESSION_COOKIE not in requests.delete(f'{BASE_URL}?id={response.text}', headers=HEADERS).cookies
+
+
+class FlakyTask:
+    """A startup task failing a number of times before it succeeds."""
+
+    def __init__(self, failures: int) -> None:
+        """
+        Initialize the task.
+
+        Args:
+            failures (int): The number of runs that fail.
+        """
+        self.failures = failures
+        self.runs = 0
+
+    def __call__(self) -> dict[str, object]:
+        """
+        Run the task.
+
+        Returns:
+            dict[str, object]: The attribute prepared by the task.
+
+        Raises:
+            ConnectionError: While the task has failures left.
+        """
+        self.runs += 1
+        if self.runs <= self.failures:
+            raise ConnectionError(f'run {self.runs} failed')
+        return {'prepared': self.runs}
+
+
+def test_warmup_retry(monkeypatch):
+    """
+    Test a failing startup task is retried with backoff and reported until it succeeds, then the server is ready.
+
+    Args:
+        monkeypatch (pytest.MonkeyPatch): Fixture shortening the backoff.
+    """
+    monkeypatch.setattr(warmup.config, 'WARMUP_MIN_BACKOFF', POLL_INTERVAL)
+    target = type('Target', (), {})
+    started = warmup.Warmup().start({'flaky': FlakyTask(WARMUP_FAILURES)}, target)
+    time.sleep(POLL_INTERVAL / 2)
+    assert started.errors == {'flaky': 'run 1 failed'}
+    assert started.ready.wait(READY_POLLS * POLL_INTERVAL)
+    assert (target.prepared, started.errors) == (WARMUP_FAILURES + 1, {})
@@ -0,0 +1,161 @@
+"""A module bounding the queries of requests: statement and lock timeouts, cancelled when the client disconnects."""
+
+import contextlib
+import socket
+import threading
+import weakref
+from typing import Iterator, NamedTuple
+
+import psycopg
+import psycopg_pool
+
+import query
+from group_commit import CommitTimeout
+
+# Errors of a query stopped by its timeouts or cancelled; the connection is rolled back before it returns to its pool.
+QUERY_LIMIT_ERRORS = (psycopg.errors.QueryCanceled, psycopg.errors.LockNotAvailable)
+# Errors of a request that gave up waiting on a row lock, a free connection or a batch commit; it may be retried soon.
+BUSY_ERRORS = (psycopg.errors.LockNotAvailable, psycopg_pool.PoolTimeout, CommitTimeout)
+
+_local = threading.local()
+
+
+class QueryLimits(NamedTuple):
+    """Timeouts of the queries of a request in milliseconds, as Postgres takes them; 0 disables a timeout."""
+
+    statement_timeout: int
+    lock_timeout: int
+
+
+UNLIMITED = QueryLimits(0, 0)
+
+
+class QueryGuard:
+    """
+    Connections running the queries of the request handled by the current thread within its limits.
+
+    The timeouts of the request are set on the connection and its query is cancelled if the client disconnects,
+    as checked from a background thread. Queries outside of a request, e.g. catalog loads, are not limited.
+    """
+
+    def __init__(self, interval: float) -> None:
+        """
+        Initialize the guard.
+
+        Args:
+            interval (float): Seconds between checks of the clients of running queries.
+        """
+        self.interval = interval
+        self._limits: weakref.WeakKeyDictionary[psycopg.Connection, QueryLimits] = weakref.WeakKeyDictionary()
+        self._watched: dict[psycopg.Connection, socket.socket] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self) -> 'QueryGuard':
+        """
+        Start checking the clients of running queries in a background thread.
+
+        Returns:
+            QueryGuard: The guard itself.
+        """
+        threading.Thread(target=self._run, name='query-guard', daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        """Stop checking the clients."""
+        self._stopped.set()
+
+    @contextlib.contextmanager
+    def connection(self, pool: psycopg_pool.ConnectionPool) -> Iterator[psycopg.Connection]:
+        """
+        Take a connection from a pool, limited for the request of the current thread.
+
+        Args:
+            pool (psycopg_pool.ConnectionPool): The pool of autocommit connections.
+
+        Yields:
+            psycopg.Connection: The connection, rolled back if its query is stopped.
+
+        Raises:
+            QUERY_LIMIT_ERRORS: If a query runs out of time, waits too long on a lock or its client disconnects.
+        """
+        limits = getattr(_local, 'limits', UNLIMITED)
+        client = getattr(_local, 'client', None)
+        with pool.connection() as connection:
+            # Timeouts are session settings, only sent when they differ from the last ones set on the connection.
+            if self._limits.get(connection) != limits:
+                set_limits(connection, limits)
+                self._limits[connection] = limits
+            if client is not None:
+                with self._lock:
+                    self._watched[connection] = client
+            try:
+                yield connection
+            except QUERY_LIMIT_ERRORS:
+                connection.rollback()
+                raise
+            finally:
+                with self._lock:
+                    self._watched.pop(connection, None)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                watched = list(self._watched.items())
+            for connection, client in watched:
+                if disconnected(client):
+                    self._cancel(connection, client)
+
+    def _cancel(self, connection: psycopg.Connection, client: socket.socket) -> None:
+        # Cancelled under the lock, so a connection already back in its pool is never cancelled.
+        with self._lock:
+            if self._watched.get(connection) is client:
+                self._watched.pop(connection)
+                connection.cancel()
+
+
+def begin(limits: QueryLimits, client: socket.socket) -> None:
+    """
+    Limit the queries of the request handled by the current thread.
+
+    Args:
+        limits (QueryLimits): The timeouts of the route class of the request.
+        client (socket.socket): The socket of the client, to cancel the queries if it disconnects.
+    """
+    _local.limits = limits
+    _local.client = client
+
+
+def end() -> None:
+    """Stop limiting the queries of the current thread, e.g. once its request is handled."""
+    _local.limits = UNLIMITED
+    _local.client = None
+
+
+def set_limits(connection: psycopg.Connection, limits: QueryLimits) -> None:
+    """
+    Set the timeouts of the next queries of a connection, for its whole session.
+
+    Args:
+        connection (psycopg.Connection): The connection.
+        limits (QueryLimits): The timeouts.
+    """
+    connection.execute(query.SET_QUERY_LIMITS, (str(limits.statement_timeout), str(limits.lock_timeout)))
+
+
+def disconnected(client: socket.socket) -> bool:
+    """
+    Check without blocking if a client closed its connection; a pipelined next request does not count.
+
+    Args:
+        client (socket.socket): The socket of the client.
+
+    Returns:
+        bool: True if the client is gone.
+    """
+    try:
+        return not client.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+    except BlockingIOError:
+        return False
+    except OSError:
+        return True
@@ -0,0 +1,308 @@
+"""A module timing the phases of each request as nested spans, exported as sampled traces to a JSONL file."""
+
+import contextlib
+import functools
+import json
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Callable, ContextManager, Optional, TypeVar
+
+import config
+from admission import RateLimiter
+
+TRACEPARENT = re.compile('^00-([0-9a-f]{32})-[0-9a-f]{16}-([0-9a-f]{2})$')
+SAMPLED_FLAG = 1
+FORCED_KEY = 'traceparent'
+HEX = 16
+MILLISECONDS = 1000
+
+ResultType = TypeVar('ResultType')
+
+_local = threading.local()
+
+
+class Span:
+    """A timed phase of a request, nested in the span open when it started."""
+
+    __slots__ = ('name', 'detail', 'parent', 'start', 'duration', '_trace')
+
+    def __init__(self, trace: 'Trace', name: str, detail: str) -> None:
+        """
+        Initialize the span.
+
+        Args:
+            trace (Trace): The trace of the request.
+            name (str): The phase, e.g. 'db'; one of config.SERVER_TIMING_PHASES to appear in Server-Timing.
+            detail (str): What the phase is doing, e.g. the query function.
+        """
+        self.name = name
+        self.detail = detail
+        self.parent: Optional[int] = None
+        self.start: float = 0
+        self.duration: float = 0
+        self._trace = trace
+
+    def __enter__(self) -> 'Span':
+        """
+        Start the span.
+
+        Returns:
+            Span: The span itself.
+        """
+        self._trace.open_span(self)
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """
+        End the span.
+
+        Args:
+            exc_info (object): The exception raised within the span, if any.
+        """
+        self._trace.close_span(self)
+
+
+class Trace:
+    """The spans of a request, with the time of each Server-Timing phase not counting nested spans of the phase."""
+
+    def __init__(self, trace_id: str, sampled: bool) -> None:
+        """
+        Start the trace.
+
+        Args:
+            trace_id (str): The id of the trace, 32 hex digits.
+            sampled (bool): Whether the trace is exported whatever its duration.
+        """
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans: list[Span] = []
+        self.phases: dict[str, float] = {}
+        self._open: list[int] = []
+
+    def open_span(self, span: Span) -> None:
+        """
+        Record the start of a span.
+
+        Args:
+            span (Span): The span, nested in the innermost open span.
+        """
+        span.parent = self._open[-1] if self._open else None
+        span.start = time.perf_counter()
+        self._open.append(len(self.spans))
+        self.spans.append(span)
+
+    def close_span(self, span: Span) -> None:
+        """
+        Record the end of a span and add its time to its phase, unless it is nested in a span of the same phase.
+
+        Args:
+            span (Span): The innermost open span.
+        """
+        span.duration = time.perf_counter() - span.start
+        self._open.pop()
+        if all(self.spans[open_index].name != span.name for open_index in self._open):
+            self.phases[span.name] = self.phases.get(span.name, 0) + span.duration
+
+    def elapsed(self) -> float:
+        """
+        Measure the time since the start of the request.
+
+        Returns:
+            float: Seconds since the start.
+        """
+        return time.perf_counter() - self.start
+
+    def server_timing(self) -> str:
+        """
+        Render the Server-Timing header of the phases so far and of the total.
+
+        Returns:
+            str: The header value, durations in milliseconds.
+        """
+        timings = [
+            (phase, self.phases[phase]) for phase in config.SERVER_TIMING_PHASES if phase in self.phases
+        ]
+        timings.append(('total', self.elapsed()))
+        metrics = []
+        for phase, duration in timings:
+            milliseconds = duration * MILLISECONDS
+            metrics.append(f'{phase};dur={milliseconds:.2f}')
+        return ', '.join(metrics)
+
+    def to_record(self, method: str, path: str, status: Optional[int]) -> dict:
+        """
+        Describe the finished trace for export.
+
+        Args:
+            method (str): The method of the request.
+            path (str): The path of the request.
+            status (Optional[int]): The status code of the response, None if none was sent.
+
+        Returns:
+            dict: The trace, times in milliseconds from the start of the request.
+        """
+        return {
+            'trace_id': self.trace_id,
+            'started_at': self.started_at,
+            'method': method,
+            'path': path,
+            'status': status,
+            'duration_ms': round(self.elapsed() * MILLISECONDS, 3),
+            'spans': [
+                {
+                    'name': span.name,
+                    'detail': span.detail,
+                    'parent': span.parent,
+                    'start_ms': round((span.start - self.start) * MILLISECONDS, 3),
+                    'duration_ms': round(span.duration * MILLISECONDS, 3),
+                }
+                for span in self.spans
+            ],
+        }
+
+
+class TraceExporter:
+    """
+    Appends sampled and slow traces to a JSONL file from a background thread, off the request path.
+
+    Clients may force the export of their traces with the sampled flag of traceparent, but only up to
+    TRACE_FORCED_RATE per second; the queue of the file is bounded, dropping traces while it is full.
+    """
+
+    def __init__(self, path: str, sample_rate: float, slow_seconds: float) -> None:
+        """
+        Initialize the exporter.
+
+        Args:
+            path (str): The JSONL file; export is disabled if empty.
+            sample_rate (float): The share of requests exported at random.
+            slow_seconds (float): The duration over which requests are always exported.
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.dropped = 0
+        self._queue: queue.Queue[dict] = queue.Queue(config.TRACE_QUEUE_SIZE)
+        self._forced = RateLimiter(config.TRACE_FORCED_RATE, config.TRACE_FORCED_BURST, 1)
+        self._rng = random.Random()
+
+    def start(self) -> 'TraceExporter':
+        """
+        Start writing exported traces in a background thread.
+
+        Returns:
+            TraceExporter: The exporter itself.
+        """
+        if self.path:
+            threading.Thread(target=self._run, name='trace-export', daemon=True).start()
+        return self
+
+    def export(self, trace: Trace, method: str, path: str, status: Optional[int]) -> None:
+        """
+        Export a finished trace if it is sampled within the forced rate, drawn at random or slow.
+
+        Args:
+            trace (Trace): The trace.
+            method (str): The method of the request.
+            path (str): The path of the request.
+            status (Optional[int]): The status code of the response.
+        """
+        if not self.path:
+            return
+        exported = self._rng.random() < self.sample_rate or trace.elapsed() >= self.slow_seconds
+        if exported or (trace.sampled and not self._forced.acquire(FORCED_KEY)):
+            try:
+                self._queue.put_nowait(trace.to_record(method, path, status))
+            except queue.Full:
+                self.dropped += 1
+
+    def _run(self) -> None:
+        with open(self.path, 'a', encoding='utf-8') as trace_file:
+            for record in iter(self._queue.get, None):
+                json.dump(record, trace_file)
+                trace_file.write('\n')
+                if self._queue.empty():
+                    trace_file.flush()
+
+
+def begin(traceparent: Optional[str]) -> Trace:
+    """
+    Start the trace of the request handled by the current thread.
+
+    Args:
+        traceparent (Optional[str]): The W3C traceparent header of the request; its trace id and sampled flag are kept.
+
+    Returns:
+        Trace: The trace.
+    """
+    match = TRACEPARENT.match(traceparent or '')
+    if match:
+        flags = int(match.group(2), HEX)
+        trace = Trace(match.group(1), sampled=bool(flags & SAMPLED_FLAG))
+    else:
+        trace = Trace(uuid.uuid4().hex, sampled=False)
+    _local.trace = trace
+    return trace
+
+
+def current() -> Optional[Trace]:
+    """
+    Find the trace of the request handled by the current thread.
+
+    Returns:
+        Optional[Trace]: The trace, None outside of a request.
+    """
+    return getattr(_local, 'trace', None)
+
+
+def end() -> Optional[Trace]:
+    """
+    Stop tracing the request handled by the current thread.
+
+    Returns:
+        Optional[Trace]: The finished trace, None if none was started.
+    """
+    trace = current()
+    _local.trace = None
+    return trace
+
+
+def span(name: str, detail: str = '') -> ContextManager:
+    """
+    Time a phase of the current request; does nothing outside of a request, e.g. in background threads.
+
+    Args:
+        name (str): The phase, e.g. 'db'.
+        detail (str): What the phase is doing, e.g. the query function.
+
+    Returns:
+        ContextManager: The span to enter.
+    """
+    trace = current()
+    if trace is None:
+        return contextlib.nullcontext()
+    return Span(trace, name, detail)
+
+
+def traced(name: str, function: Callable[..., ResultType]) -> Callable[..., ResultType]:
+    """
+    Wrap a function to time its calls as spans of a phase, detailed with the name of the function.
+
+    Args:
+        name (str): The phase, e.g. 'db'.
+        function (Callable[..., ResultType]): The function to time, e.g. db.get_movies.
+
+    Returns:
+        Callable[..., ResultType]: The wrapped function.
+    """
+    @functools.wraps(function)
+    def wrapper(*args: object, **kwargs: object) -> ResultType:
+        with span(name, function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,68 @@
+"""A module warming up the server in the background: startup tasks run in parallel and are timed."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import config
+
+# A startup task returns the attributes it prepared for the request handler class; it may be run again if it fails.
+Task = Callable[[], dict[str, object]]
+
+
+class Warmup:
+    """
+    Startup tasks run in parallel after the server is bound; it is ready once all of them are done.
+
+    A failing task is retried with exponential backoff, e.g. until the database is reachable, and its last
+    error is reported meanwhile; the server stays alive but not ready.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the warmup as not ready."""
+        self.ready = threading.Event()
+        self.errors: dict[str, str] = {}
+        self.durations: dict[str, float] = {}
+
+    def start(self, tasks: dict[str, Task], target: type) -> 'Warmup':
+        """
+        Run the tasks in parallel in a background thread, setting their attributes on the target as they finish.
+
+        Args:
+            tasks (dict[str, Task]): The tasks by name.
+            target (type): The class to set the attributes prepared by the tasks on.
+
+        Returns:
+            Warmup: The warmup itself.
+        """
+        threading.Thread(target=self._run, args=(tasks, target), name='warmup', daemon=True).start()
+        return self
+
+    def _run(self, tasks: dict[str, Task], target: type) -> None:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix='warmup') as executor:
+            for name, task in tasks.items():
+                executor.submit(self._run_task, name, task, target)
+        self.ready.set()
+        elapsed = time.perf_counter() - started
+        print(f'Ready in {elapsed:.2f} s')
+
+    def _run_task(self, name: str, task: Task, target: type) -> None:
+        started = time.perf_counter()
+        backoff = config.WARMUP_MIN_BACKOFF
+        while True:
+            try:
+                attrs = task()
+            except Exception as error:
+                self.errors[name] = str(error)
+                print(f'warmup {name} failed, retrying in {backoff:.1f} s: {error}')
+                time.sleep(backoff)
+                backoff = min(backoff * 2, config.WARMUP_MAX_BACKOFF)
+                continue
+            break
+        for attr_name, attr in attrs.items():
+            setattr(target, attr_name, attr)
+        self.errors.pop(name, None)
+        self.durations[name] = round(time.perf_counter() - started, 3)
+        print(f'warmup {name} took {self.durations[name]:.2f} s')